@@ -0,0 +1,170 @@
+"""
+This plugin converges instances to a spec file describing groups of
+instances: how many of each group there should be and how each group is
+configured.
+
+Usage: swarm apply <options> <spec>
+
+where <options> is zero or more of:
+    -h   --help     print this help and stop
+    -n   --dry-run  show what would be done, but don't do it
+    -P   --prune    terminate instances of groups no longer in the spec
+    -V   --version  print version information and stop
+    -v   --verbose  be verbose (cumulative)
+    -y   --yes      don't prompt before making changes
+
+and <spec> is the path to the spec file, for example:
+
+    groups:
+      workers:
+        name: worker{number}
+        count: 10
+        flavour: m5.large
+        image: ami-12345678
+      masters:
+        name: master
+        count: 1
+        flavour: m5.xlarge
+
+Each group may also set 'key', 'secgroup' (a list), 'zone' and 'userdata'
+(a file path).  The spec is YAML if PyYAML is installed, else JSON.
+
+Instances whose configuration differs from their group spec are replaced,
+surplus instances are terminated and missing instances started.  All
+groups are changed at once.  Only instances started by 'swarm apply'
+belong to a group.
+
+As an example:
+
+    swarm apply -n cluster.yaml
+"""
+
+import os
+import sys
+import argparse
+
+import swarmcore
+import swarmcore.log
+import swarmcore.reconcile as reconcile
+
+
+# set up logging
+log = swarmcore.log.Log('swarm.log', swarmcore.log.Log.DEBUG)
+
+# program version
+MajorRelease = 0
+MinorRelease = 1
+VersionString = 'v%d.%d' % (MajorRelease, MinorRelease)
+
+Plugin = {
+          'entry': 'apply',
+          'version': '%s' % VersionString,
+          'command': 'apply',
+         }
+
+
+def usage(msg=None):
+    """Print help for the befuddled user."""
+
+    if msg:
+        print('*'*60)
+        print(msg)
+        print('*'*60)
+    print(__doc__)        # module docstring used
+
+def describe(plan):
+    """Return a one line description of a group plan."""
+
+    # launches stand in for drifted instances first, any drifted
+    # instances beyond that are just terminated
+    replace = min(len(plan.drifted), plan.launch)
+    return ('keep %d, launch %d, replace %d, terminate %d'
+            % (len(plan.keep), plan.launch - replace, replace,
+               len(plan.surplus) + len(plan.drifted) - replace))
+
+def apply(args):
+    """Converge instances to a spec file.
+
+    args    list of arg values to be parsed
+    """
+
+    # parse the command args
+    parser = argparse.ArgumentParser(prog='swarm apply',
+                                     description='This plugin converges EC2 instances to a spec file.')
+    parser.add_argument('-n', '--dry-run', dest='dry_run', action='store_true',
+                        help="show what would be done, don't do it",
+                        default=False)
+    parser.add_argument('-P', '--prune', dest='prune', action='store_true',
+                        help='terminate instances of groups not in the spec',
+                        default=False)
+    parser.add_argument('-v', '--verbose', dest='verbose', action='count',
+                        default=0, help='make execution more verbose (cumulative)')
+    parser.add_argument('-V', '--version', action='version', version=VersionString,
+                        help='print the version and stop')
+    parser.add_argument('-y', '--yes', dest='yes', action='store_true',
+                        help="don't prompt before making changes", default=False)
+    parser.add_argument('spec', action='store', help='the spec file')
+
+    args = parser.parse_args(args)
+
+    # increase verbosity if required
+    verbose = False
+    for _ in range(args.verbose):
+        log.bump_level()
+        verbose = True
+
+    if not os.path.isfile(args.spec):
+        usage("Spec file '%s' doesn't exist" % args.spec)
+        return 1
+    try:
+        groups = reconcile.load_spec(args.spec)
+    except ValueError as e:
+        usage(str(e))
+        return 1
+
+    swm = swarmcore.Swarm(verbose=verbose)
+    reconciler = reconcile.Reconciler(swm, groups, prune=args.prune)
+    plans = reconciler.plan()
+
+    for plan in plans:
+        print('%-17s |%s' % (plan.group, describe(plan)))
+        log('apply: %s: %s' % (plan.group, describe(plan)))
+
+    changes = [p for p in plans if not p.empty()]
+    if not changes:
+        print('Nothing to do')
+        return 0
+    if args.dry_run:
+        return 0
+
+    # give user a chance to bail
+    if args.yes:
+        answer = 'y'
+    else:
+        answer = raw_input('Changing %d groups.  Proceed? (y/N): ' % len(changes))
+        answer = answer.strip().lower()
+    if len(answer) == 0 or answer[0] != 'y':
+        log.info('User chose not to apply %s', args.spec)
+        return 0
+
+    def show_result(plan, error):
+        """Display the result for one group."""
+
+        if error:
+            print('%-17s*|%s' % (plan.group, error))
+        else:
+            print('%-17s |done' % plan.group)
+        sys.stdout.flush()
+
+    errors = reconciler.apply(changes, callback=show_result)
+    failed = len([e for e in errors.values() if e])
+    print('%d groups changed, %d failed' % (len(changes) - failed, failed))
+
+    if verbose:
+        log.debug('==============================================================')
+        log.debug('=========================  FINISHED  =========================')
+        log.debug('==============================================================')
+
+    if failed:
+        return 1
+    return 0
@@ -7,10 +7,18 @@ Usage: swarm cmd <options> <command>
 
 where <options> is zero or more of:
     -a   --auth     directory holding authentication keys (default is ~/.ssh)
+    -b   --batch-size run in waves of N instances, or P% of the instances
+    -C   --collapse show each distinct output once with a list of its hosts
+    -f   --format   output format, 'text' (default) or 'jsonl'
     -h   --help     print this help and stop
     -i   --ip       show source as IP address, not VM name
+    -m   --max-failures  start no more waves after more than N failures
     -p   --prefix   name prefix used to select nodes (default is all instances)
+    -P   --pause    seconds to pause between waves
     -q   --quiet    be quiet for scripting
+    -R   --retries  number of retries of transient SSH failures
+    -t   --timeout  seconds allowed for each instance before it is killed
+    -T   --deadline seconds allowed for the whole run
     -V   --version  print version information and stop
     -v   --verbose  be verbose
 and <command> is the command string to execute on the node.
@@ -18,6 +26,14 @@ and <command> is the command string to execute on the node.
 An example:
 
     swarm cmd -v -p "test" "ls -la /tmp"
+
+To restart a service on 10% of the instances at a time, stopping if
+more than 2 instances fail:
+
+    swarm cmd -p "test" -b 10% -P 30 -m 2 "sudo service httpd restart"
+
+The exit status is 1 if the command failed or timed out on any instance,
+or if instances were skipped because the failure budget was used up.
 """
 
 import os
@@ -45,6 +61,9 @@ Plugin = {
           'command': 'cmd',
          }
 
+# legal output formats
+OutputFormats = ['text', 'jsonl']
+
 # this function can't be in utils.py as we need access to __doc__
 def usage(msg=None):
     """Print help for the befuddled user."""
@@ -66,10 +85,10 @@ def command(args):
         The given IP has each subfield expanded to 3 numeric digits, eg:
             given '1.255.24.6' return '001.255.014.006'
 
-        The 'key' has the form ((status, output), ip).
+        The 'key' is a HostResult object.
         """
 
-        ip = key[1]
+        ip = key.ip
         fields = ip.split('.')
         result = []
         for f in fields:
@@ -78,9 +97,9 @@ def command(args):
         return result
 
     def name_key(key):
-        """Function to sort data by name (field 1)."""
+        """Function to sort data by name, IP if no name."""
 
-        return key[1]
+        return key.label()
 
     # parse the command args
     parser = argparse.ArgumentParser(prog='swarm cmd',
@@ -88,20 +107,46 @@ def command(args):
     parser.add_argument('-a', '--auth', dest='auth', action='store',
                         help='set the path to the authentication directory',
                         metavar='<auth>', default=defaults.AuthPath)
+    parser.add_argument('-b', '--batch-size', dest='batch_size', action='store',
+                        help='run in waves of N instances or P%% of instances',
+                        metavar='<N|P%>')
     parser.add_argument('-c', '--config', dest='config', action='store',
                         help='set the config from this file',
                         metavar='<configfile>')
+    parser.add_argument('-C', '--collapse', dest='collapse', action='store_true',
+                        help='group instances with identical output',
+                        default=False)
+    parser.add_argument('-f', '--format', dest='format', action='store',
+                        help="set the output format, 'text' or 'jsonl'",
+                        metavar='<format>', choices=OutputFormats,
+                        default='text')
     parser.add_argument('-i', '--ip', dest='show_ip', action='store_true',
                         help='display the instance IP in the results',
                         default=False)
     parser.add_argument('-k', '--key', dest='key', action='store',
                         help='set the key file to use',
                         metavar='<key>', default=defaults.Key)
+    parser.add_argument('-m', '--max-failures', dest='max_failures',
+                        action='store', type=int,
+                        help='start no more waves after more than N failures',
+                        metavar='<N>')
     parser.add_argument('-p', '--prefix', dest='prefix', action='store',
                         help='set the prefix for the new instance name',
                         metavar='<prefix>')
+    parser.add_argument('-P', '--pause', dest='pause', action='store',
+                        type=float, help='seconds to pause between waves',
+                        metavar='<seconds>', default=0)
     parser.add_argument('-q', '--quiet', dest='quiet', action='store_true',
                         help='be quiet for scripting', default=False)
+    parser.add_argument('-R', '--retries', dest='retries', action='store',
+                        type=int, help='retries of transient SSH failures',
+                        metavar='<retries>')
+    parser.add_argument('-t', '--timeout', dest='timeout', action='store',
+                        type=float, help='seconds allowed for each instance',
+                        metavar='<seconds>')
+    parser.add_argument('-T', '--deadline', dest='deadline', action='store',
+                        type=float, help='seconds allowed for the whole run',
+                        metavar='<seconds>')
     parser.add_argument('-r', '--region', dest='region', action='store',
                         help='set the region to use',
                         metavar='<region>', default=defaults.Region)
@@ -133,9 +178,17 @@ def command(args):
 
     # set variables to possibly modified defaults
     auth = config_values.get('auth', args.auth)
+    batch_size = args.batch_size
+    collapse = args.collapse
+    format = args.format
     key = config_values.get('args.key', args.key)
+    max_failures = args.max_failures
+    pause = args.pause
     prefix = config_values.get('args.prefix', args.prefix)
     quiet = args.quiet
+    retries = args.retries
+    timeout = args.timeout
+    deadline = args.deadline
     region = config_values.get('region', args.region)
     secgroup = config_values.get('secgroup', args.secgroup)
     show_ip = config_values.get('show_ip', args.show_ip)
@@ -146,6 +199,8 @@ def command(args):
 
     # get all instances
     swm = swarmcore.Swarm(verbose=verbose)
+    if retries is not None:
+        swm.SshRetries = retries
     all_instances = swm.instances()
 
     # get a filtered list of instances depending on prefix
@@ -159,43 +214,70 @@ def command(args):
             s = swm.filter(all_instances, filter)
             filtered_instances = swm.union(filtered_instances, s)
 
-    if not quiet:
+    if not quiet and format == 'text':
         print("Doing '%s' on %d instances named '%s*'"
               % (cmd, len(filtered_instances), '*|'.join(prefixes)))
 
-    # kick off the parallel cmd
-    answer = swm.cmd(filtered_instances, cmd, swm.info_ip())
-
-    # handle the case where user wants IP displayed
+    # wave and deadline options, passed to every swm.cmd() below
+    run_opts = {'pause': pause, 'max_failures': max_failures,
+                 'timeout': timeout, 'deadline': deadline}
+    if batch_size is not None:
+        try:
+            run_opts['batch_size'] = utils.parse_batch_size(batch_size,
+                                                             len(filtered_instances))
+        except ValueError as e:
+            usage(str(e))
+            return 1
+
+    # the exit status is 1 if any instance failed, timed out or was
+    # skipped because the failure budget was used up
+    failed = []
+
+    # JSON lines are streamed as each result arrives
+    if format == 'jsonl':
+        def show_json(result):
+            if result.status != 0:
+                failed.append(result)
+            print(result.to_json())
+            sys.stdout.flush()
+
+        swm.cmd(filtered_instances, cmd, callback=show_json, **run_opts)
+        return 1 if failed else 0
+
+    # if collapsing output, group results as they arrive and display
+    if collapse:
+        groups = utils.OutputGroups()
+
+        def group_result(result):
+            if result.status != 0:
+                failed.append(result)
+            groups.add(result.label(show_ip), result.status, result.output)
+
+        swm.cmd(filtered_instances, cmd, callback=group_result, **run_opts)
+        groups.show()
+        return 1 if failed else 0
+
+    # kick off the parallel cmd, sort by IP or name
+    answer = swm.cmd(filtered_instances, cmd, **run_opts)
     if show_ip:
         answer = sorted(answer, key=ip_key)
     else:
-        # get openstack names, make new answer
-        ip_names = swm.info(filtered_instances, swm.info_ip(), swm.info_name())
-        new_answer = []
-        for (os_ip, os_name) in ip_names:
-            name = os_ip		# if no match
-            for (result, ans_ip) in answer:
-                if ans_ip == os_ip:
-                    name = os_name
-                    break
-            new_answer.append((result, os_name))
-        answer = sorted(new_answer, key=name_key)
+        answer = sorted(answer, key=name_key)
 
     # display results
 #    if not quiet:
-    for (result, name) in answer:
-        (status, output) = result
-        output = output.split('\n')
+    for result in answer:
+        output = result.output.split('\n')
         canonical_output = ('\n'+' '*17+' |').join(output)
-        if status == 0:
-            print('%-17s |%s' % (name, canonical_output))
+        if result.status == 0:
+            print('%-17s |%s' % (result.label(show_ip), canonical_output))
         else:
-            print('%-17s*|%s' % (name, canonical_output))
+            print('%-17s*|%s' % (result.label(show_ip), canonical_output))
+            failed.append(result)
 
     if verbose:
         log.debug('==============================================================')
         log.debug('=========================  FINISHED  =========================')
         log.debug('==============================================================')
 
-    return 0
+    return 1 if failed else 0
@@ -1,7 +1,7 @@
 """
-This plugin is used to copy a file to many instances.
+This plugin is used to copy files and directories to many instances.
 
-Usage: swarm copy <options> <src> <dst>
+Usage: swarm copy <options> <src> [<src> ...] <dst>
 
 where <options> is zero or more of:
     -a   --auth     directory holding authentication keys (default is ~/.ssh)
@@ -11,12 +11,19 @@ where <options> is zero or more of:
     -q   --quiet    be quiet for scripting
     -v   --verbose  make logging more verbose (cumulative)
     -V   --version  print version information and stop
-and <src> is the source file, <dst> is the remote destination.  Note
-that the <dst> must be valid as an scp destination.
+    -z   --compress compress the data sent to each instance
+and <src> is one or more source files or directories, <dst> is the remote
+destination.  If <src> is a single file then <dst> must be valid as an scp
+destination.  Otherwise all the <src> paths are packed once into a tar
+stream that is unpacked on each instance in the <dst> directory.
 
 To copy a file to every instance with  prefix of 'test_', do:
 
     swarm copy -p test_ /tmp/config /var/spool/torque/mom_priv/config
+
+To copy two directories to /opt on every instance, do:
+
+    swarm copy -p test_ -z bin lib /opt
 """
 
 import os
@@ -69,9 +76,8 @@ def ip_key(key):
         given '1.255.24.6' return '001.255.014.006'
     """
 
-    log.debug('key=%s' % str(key))
-    (_, _, ip) = key
-    fields = ip.split('.')
+    log.debug('key=%s', key)
+    fields = key.ip.split('.')
     result = []
     for f in fields:
         result.append('%03d' % int(f))
@@ -86,7 +92,7 @@ def copy(args):
 
     # parse the command args
     parser = argparse.ArgumentParser(prog='swarm copy',
-                                     description='This plugin is used to copy a file to many instances.')
+                                     description='This plugin is used to copy files to many instances.')
     parser.add_argument('-a', '--auth', dest='auth_dir', action='store',
                         help='set the directory holding authentication files',
                         metavar='<auth>')
@@ -105,7 +111,11 @@ def copy(args):
                         default=0, help='make logging more verbose (cumulative)')
     parser.add_argument('-V', '--version', action='version',
                         version=VersionString, help='print the version and stop')
-    parser.add_argument('source', action='store', help='the file to be copied')
+    parser.add_argument('-z', '--compress', dest='compress', action='store_true',
+                        help='compress the data sent to each instance',
+                        default=False)
+    parser.add_argument('source', action='store', nargs='+',
+                        help='the file(s) or directories to be copied')
     parser.add_argument('destination', action='store',
                         help='path to file destination')
 
@@ -116,7 +126,10 @@ def copy(args):
     show_ip = args.show_ip
     prefix = args.prefix
     quiet = args.quiet
+    compress = args.compress
     source = args.source
+    if len(source) == 1:
+        source = source[0]
     destination = args.destination
 
     # increase verbosity if required
@@ -132,8 +145,8 @@ def copy(args):
         error("Authentication directory '%s' doesn't exist"
               % auth_dir)
 
-    log.debug('copy: auth_dir=%s, show_ip=%s, prefix=%s, source=%s, destination=%s'
-              % (auth_dir, str(show_ip), str(prefix), source, destination))
+    log.debug('copy: auth_dir=%s, show_ip=%s, prefix=%s, source=%s, destination=%s',
+              auth_dir, show_ip, prefix, source, destination)
 
     # get all instances
     swm = swarmcore.Swarm(verbose=verbose)
@@ -155,20 +168,24 @@ def copy(args):
               % (len(filtered_instances), '*|'.join(prefixes)))
 
     # kick off the parallel copy
-    answer = swm.copy(filtered_instances, source, destination, swm.info_ip())
+    answer = swm.copy(filtered_instances, source, destination,
+                      compress=compress)
 
-    # sort by IP
-    answer = sorted(answer, key=ip_key)
+    # sort by IP or name
+    if show_ip:
+        answer = sorted(answer, key=ip_key)
+    else:
+        answer = sorted(answer, key=lambda r: r.label())
 
     # display results
     if not quiet:
-        for (output, status, ip) in answer:
-            output = output.split('\n')
+        for result in answer:
+            output = result.output.split('\n')
             canonical_output = ('\n'+' '*17+'|').join(output)
-            if status == 0:
-                print('%-17s |%s' % (ip, canonical_output))
+            if result.status == 0:
+                print('%-17s |%s' % (result.label(show_ip), canonical_output))
             else:
-                print('%-17s*|%s' % (ip, canonical_output))
+                print('%-17s*|%s' % (result.label(show_ip), canonical_output))
 
     if verbose:
         log.debug('==============================================================')
@@ -0,0 +1,189 @@
+"""
+This plugin is used to fetch files from many instances.
+
+Usage: swarm fetch <options> <src> [<src> ...] <dst>
+
+where <options> is zero or more of:
+    -h   --help         print this help and stop
+    -i   --ip           show public IP instead of instance name
+    -m   --merge        also merge the fetched files into <dst>/_merged
+    -n   --no-compress  don't compress data in transit
+    -p   --prefix       name prefix used to select nodes (default is all servers)
+    -q   --quiet        be quiet for scripting
+    -t   --threads      number of instances to fetch from at once
+    -v   --verbose      make logging more verbose (cumulative)
+    -V   --version      print version information and stop
+and <src> is one or more remote paths (the globs '*', '?' and '[...]' and a
+leading '~/' are expanded on the instance, other shell characters are taken
+literally), <dst> is the local directory to fetch into.  Files from each
+instance are placed in <dst>/<name>/.
+
+To fetch all log files from every instance with a prefix of 'test_', do:
+
+    swarm fetch -p test_ -m "/var/log/*.log" results
+"""
+
+import os
+import sys
+import argparse
+
+import swarmcore
+import swarmcore.log
+import swarmcore.utils as utils
+import swarmcore.defaults as defaults
+
+
+# set up logging
+log = swarmcore.log.Log('swarm.log', swarmcore.log.Log.DEBUG)
+
+# program version
+MajorRelease = 0
+MinorRelease = 1
+VersionString = 'v%d.%d' % (MajorRelease, MinorRelease)
+
+Plugin = {
+          'entry': 'fetch',
+          'version': '%s' % VersionString,
+          'command': 'fetch',
+         }
+
+# default number of concurrent fetches
+DefaultThreads = 20
+
+
+def usage(msg=None):
+    """Print help for the befuddled user."""
+
+    if msg:
+        print('*'*60)
+        print(msg)
+        print('*'*60)
+    print(__doc__)        # module docstring used
+
+def ip_key(key):
+    """Function to make a 'canonical' IP string for sorting.
+    The given IP has each subfield expanded to 3 numeric digits, eg:
+
+        given '1.255.24.6' return '001.255.014.006'
+    """
+
+    fields = key.ip.split('.')
+    result = []
+    for f in fields:
+        result.append('%03d' % int(f))
+
+    return result
+
+def name_key(key):
+    """Function to sort data by instance name."""
+
+    return key.label()
+
+def fetch(args):
+    """Perform the fetch from required instances.
+
+    args    list of arg values
+    """
+
+    # parse the command args
+    parser = argparse.ArgumentParser(prog='swarm fetch',
+                                     description='This plugin is used to fetch files from many instances.')
+    parser.add_argument('-i', '--ip', dest='show_ip', action='store_true',
+                        help='show public IP instead of instance name',
+                        default=False)
+    parser.add_argument('-m', '--merge', dest='merge', action='store_true',
+                        help='merge fetched files into <dst>/_merged',
+                        default=False)
+    parser.add_argument('-n', '--no-compress', dest='compress', action='store_false',
+                        help="don't compress data in transit", default=True)
+    parser.add_argument('-p', '--prefix', dest='prefix', action='store',
+                        help='set the prefix for the instance names',
+                        metavar='<prefix>')
+    parser.add_argument('-q', '--quiet', dest='quiet', action='store_true',
+                        help='be quiet for scripting', default=False)
+    parser.add_argument('-t', '--threads', dest='threads', action='store',
+                        type=int, help='number of instances to fetch from at once',
+                        metavar='<threads>', default=DefaultThreads)
+    parser.add_argument('-v', '--verbose', dest='verbose', action='count',
+                        default=0, help='make logging more verbose (cumulative)')
+    parser.add_argument('-V', '--version', action='version',
+                        version=VersionString, help='print the version and stop')
+    parser.add_argument('source', action='store', nargs='+',
+                        help='the remote path(s) to fetch')
+    parser.add_argument('destination', action='store',
+                        help='local directory to fetch into')
+
+    args = parser.parse_args(args)
+
+    # set variables to possibly modified defaults
+    show_ip = args.show_ip
+    merge = args.merge
+    compress = args.compress
+    prefix = args.prefix
+    quiet = args.quiet
+    threads = args.threads
+    source = args.source
+    destination = args.destination
+
+    # increase verbosity if required
+    verbose = False
+    for _ in range(args.verbose):
+        log.bump_level()
+        verbose = True
+
+    if threads < 1:
+        usage('The number of threads must be a positive integer')
+        return 1
+
+    log.debug('fetch: show_ip=%s, prefix=%s, source=%s, destination=%s',
+              show_ip, prefix, source, destination)
+
+    # get all instances
+    swm = swarmcore.Swarm(verbose=verbose)
+    all_instances = swm.instances()
+
+    # get a filtered list of instances depending on prefix
+    prefixes = []
+    filtered_instances = all_instances
+    if prefix is not None:
+        prefixes = prefix.split(',')
+        filtered_instances = []
+        for prefix in prefixes:
+            filter = swm.filter_name_prefix(prefix)
+            s = swm.filter(all_instances, filter)
+            filtered_instances = swm.union(filtered_instances, s)
+
+    if not quiet:
+        print("Doing 'fetch' on %d instances named '%s*'"
+              % (len(filtered_instances), '*|'.join(prefixes)))
+
+    # kick off the parallel fetch
+    answer = swm.fetch(filtered_instances, source, destination,
+                       compress=compress, merge=merge, threads=threads)
+
+    # sort by IP or name
+    if show_ip:
+        answer = sorted(answer, key=ip_key)
+    else:
+        answer = sorted(answer, key=name_key)
+
+    # display results
+    status = 0
+    for result in answer:
+        if result.status != 0:
+            status = 1
+        if quiet:
+            continue
+        output = result.output.split('\n')
+        canonical_output = ('\n'+' '*17+'|').join(output)
+        if result.status == 0:
+            print('%-17s |%s' % (result.label(show_ip), canonical_output))
+        else:
+            print('%-17s*|%s' % (result.label(show_ip), canonical_output))
+
+    if verbose:
+        log.debug('==============================================================')
+        log.debug('=========================  FINISHED  =========================')
+        log.debug('==============================================================')
+
+    return status
@@ -0,0 +1,100 @@
+"""
+This plugin shows the local catalog of instance types (flavours), and can
+refresh the catalog from AWS.
+
+Usage: swarm flavours <options> [<pattern> ...]
+
+where <options> is zero or more of:
+    -h   --help     print this help and stop
+    -r   --refresh  refresh the catalog from AWS before showing it
+    -V   --version  print version information and stop
+    -v   --verbose  be verbose (cumulative)
+and <pattern> is zero or more type name prefixes to show (default is all
+types).
+
+As an example, the following will refresh the catalog and show all the
+'m5' types:
+
+    swarm flavours -r m5.
+"""
+
+import os
+import sys
+import argparse
+
+import swarmcore
+import swarmcore.log
+import swarmcore.catalog as catalog
+
+
+# set up logging
+log = swarmcore.log.Log('swarm.log', swarmcore.log.Log.DEBUG)
+
+# program version
+MajorRelease = 0
+MinorRelease = 1
+VersionString = 'v%d.%d' % (MajorRelease, MinorRelease)
+
+Plugin = {
+          'entry': 'flavours',
+          'version': '%s' % VersionString,
+          'command': 'flavours',
+         }
+
+
+def usage(msg=None):
+    """Print help for the befuddled user."""
+
+    if msg:
+        print('*'*60)
+        print(msg)
+        print('*'*60)
+    print(__doc__)        # module docstring used
+
+def flavours(args):
+    """Show the instance type catalog.
+
+    args    list of arg values to be parsed
+    """
+
+    # parse the command args
+    parser = argparse.ArgumentParser(prog='swarm flavours',
+                                     description='This plugin shows the catalog of EC2 instance types.')
+    parser.add_argument('-r', '--refresh', dest='refresh', action='store_true',
+                        help='refresh the catalog from AWS', default=False)
+    parser.add_argument('-v', '--verbose', dest='verbose', action='count',
+                        default=0, help='make execution verbose')
+    parser.add_argument('-V', '--version', action='version', version=VersionString,
+                        help='print the version and stop')
+    parser.add_argument('patterns', metavar='<pattern>', nargs='*',
+                        help='type name prefixes to show')
+
+    args = parser.parse_args(args)
+
+    # increase verbosity if required
+    verbose = False
+    for _ in range(args.verbose):
+        log.bump_level()
+        verbose = True
+
+    if args.refresh:
+        swm = swarmcore.Swarm(verbose=verbose)
+        num = swm.refresh_catalog()
+        print('Refreshed catalog, %d instance types' % num)
+
+    names = catalog.names()
+    if args.patterns:
+        names = [n for n in names
+                 if any(n.startswith(p) for p in args.patterns)]
+
+    print('%-16s %6s %10s  %s' % ('Type', 'vCPUs', 'Memory MiB', 'Network'))
+    for name in names:
+        (vcpus, memory, network) = catalog.lookup(name)
+        print('%-16s %6d %10d  %s' % (name, vcpus, memory, network))
+
+    if verbose:
+        log.debug('==============================================================')
+        log.debug('=========================  FINISHED  =========================')
+        log.debug('==============================================================')
+
+    return 0
@@ -0,0 +1,193 @@
+"""
+This plugin is used to check the health of instances.  Things like:
+ . can we SSH to the instance?
+ . is the instance hostname correct?
+ . does the console log show any problem?
+All checks for all instances are done in one concurrent pass, and the
+result for each instance is shown as soon as it is known.
+
+Usage: swarm health <options>
+
+where <options> is zero or more of:
+    -a   --auth      directory holding authentication keys (default is ~/.ssh)
+    -h   --help      print this help and stop
+    -i   --ip        show source as IP address, not VM name
+    -p   --prefix    name prefix used to select nodes (default is all instances)
+    -t   --threads   number of instances checked at once (default is all)
+    -T   --deadline  seconds allowed for the whole check
+    -V   --version   print version information and stop
+    -v   --verbose   be verbose (cumulative)
+
+An example:
+
+    swarm health -p at3-wn
+
+this checks the health of all instances whose names start with "at3-wn".
+"""
+
+import os
+import sys
+import argparse
+
+import swarmcore
+import swarmcore.log
+import swarmcore.utils as utils
+import swarmcore.defaults as defaults
+
+
+# set up logging
+log = swarmcore.log.Log('swarm.log', swarmcore.log.Log.DEBUG)
+
+# program version
+MajorRelease = 0
+MinorRelease = 2
+VersionString = 'v%d.%d' % (MajorRelease, MinorRelease)
+
+Plugin = {
+          'entry': 'health',
+          'version': '%s' % VersionString,
+          'command': 'health',
+         }
+
+# table decoration
+Header = 'instance          S H hostname                                       status'
+Rule =   '-----------------+-+-+----------------------------------------------+------'
+
+
+def usage(msg=None):
+    """Print help for the befuddled user."""
+
+    if msg:
+        print('*'*60)
+        print(msg)
+        print('*'*60)
+    print(__doc__)        # module docstring used
+
+def health(args):
+    """Perform the health check on required instances.
+
+    args    list of arg values to be parsed
+    """
+
+    # parse the command args
+    parser = argparse.ArgumentParser(prog='swarm health',
+                                     description='This plugin checks the health of EC2 instances.')
+    parser.add_argument('-a', '--auth', dest='auth', action='store',
+                        help='set the path to the authentication directory',
+                        metavar='<auth>', default=defaults.AuthPath)
+    parser.add_argument('-i', '--ip', dest='show_ip', action='store_true',
+                        help='show public IP instead of instance name',
+                        default=False)
+    parser.add_argument('-p', '--prefix', dest='prefix', action='store',
+                        help='set the prefix for the instance names',
+                        metavar='<prefix>')
+    parser.add_argument('-t', '--threads', dest='threads', action='store',
+                        type=int, help='number of instances checked at once',
+                        metavar='<threads>')
+    parser.add_argument('-T', '--deadline', dest='deadline', action='store',
+                        type=float, help='seconds allowed for the whole check',
+                        metavar='<seconds>')
+    parser.add_argument('-v', '--verbose', dest='verbose', action='count',
+                        default=0, help='make execution more verbose (cumulative)')
+    parser.add_argument('-V', '--version', action='version', version=VersionString,
+                        help='print the version and stop')
+
+    args = parser.parse_args(args)
+
+    # increase verbosity if required
+    verbose = False
+    for _ in range(args.verbose):
+        log.bump_level()
+        verbose = True
+
+    # set variables to possibly modified defaults
+    auth = args.auth
+    show_ip = args.show_ip
+    prefix = args.prefix
+    threads = args.threads
+    deadline = args.deadline
+
+    if not os.path.isdir(auth):
+        usage("Authentication directory '%s' doesn't exist" % auth)
+        return 1
+    if threads is not None and threads < 1:
+        usage('The number of threads must be a positive integer')
+        return 1
+
+    # get all instances
+    swm = swarmcore.Swarm(auth_dir=auth, verbose=verbose)
+    all_instances = swm.instances()
+
+    # get a filtered list of instances depending on prefix
+    prefixes = []
+    filtered_instances = all_instances
+    if prefix is not None:
+        prefixes = prefix.split(',')
+        filtered_instances = []
+        for p in prefixes:
+            filter = swm.filter_name_prefix(p)
+            s = swm.filter(all_instances, filter)
+            filtered_instances = swm.union(filtered_instances, s)
+
+    print("# health of %d instances with name starting '%s*'"
+          % (len(filtered_instances), '*|'.join(prefixes)))
+    log("# health of %d instances with name starting '%s*'"
+        % (len(filtered_instances), '*|'.join(prefixes)))
+
+    print(Header)
+    print(Rule)
+
+    # counters updated as each result arrives
+    counts = {'ssh': 0, 'hostname': 0, 'class': 0, 'timeout': 0}
+
+    def show_result(result):
+        """Check and display the result for one instance."""
+
+        if result.status == utils.TimeoutStatus or not result.values:
+            counts['timeout'] += 1
+            print('%-17s *|*|%-46s| %s' % (result.label(show_ip), '',
+                                            result.output or 'no result'))
+            sys.stdout.flush()
+            return
+
+        (ssh_ok, hostname, classification) = result.values
+        ssh_flag = ' '
+        hostname_flag = ' '
+        if not ssh_ok:
+            ssh_flag = '*'
+            counts['ssh'] += 1
+        elif hostname != utils.ip2name(result.ip):
+            hostname_flag = '*'
+            counts['hostname'] += 1
+        if classification != 'OK':
+            counts['class'] += 1
+
+        print('%-17s %s|%s|%-46s| %s' % (result.label(show_ip), ssh_flag,
+                                          hostname_flag, hostname,
+                                          classification))
+        sys.stdout.flush()
+
+    # console logs are fetched in one rate-limited batch, then one
+    # concurrent pass gathers all checks for every instance
+    logs = swm.console_logs(filtered_instances)
+    if threads is None:
+        threads = len(filtered_instances)
+    swm.info(filtered_instances,
+             swm.info_ssh(), swm.info_hostname(), swm.info_classify(logs),
+             callback=show_result, threads=threads, deadline=deadline)
+
+    print(Rule)
+    print("%d instances we can't SSH to" % counts['ssh'])
+    print('%d instances with a bad hostname' % counts['hostname'])
+    print('%d instances with a bad classification' % counts['class'])
+    if counts['timeout']:
+        print('%d instances not checked in time' % counts['timeout'])
+
+    if verbose:
+        log.debug('==============================================================')
+        log.debug('=========================  FINISHED  =========================')
+        log.debug('==============================================================')
+
+    if any(counts.values()):
+        return 1
+    return 0
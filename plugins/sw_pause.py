@@ -0,0 +1,157 @@
+"""
+This plugin is used to pause a set of instances: the instances are stopped
+but keep their disks, so 'swarm resume' can restart them without the cost
+of booting new instances and provisioning them again.
+
+Usage: swarm pause <options>
+
+where <options> is zero or more of:
+    -H   --hibernate  hibernate the instances, saving their memory
+    -h   --help       print this help and stop
+    -n   --no-wait    don't wait for the instances to stop
+    -p   --prefix     name prefix used to select nodes (required)
+    -q   --quiet      be quiet for scripting
+    -T   --timeout    seconds to wait for the instances to stop (default 600)
+    -V   --version    print version information and stop
+    -v   --verbose    be verbose (cumulative)
+    -y   --yes        always pause instances, don't prompt user
+
+Only instances started with hibernation enabled can hibernate.  Stopped
+instances don't accrue instance charges, but their disks do.
+
+As an example, the following will pause all instances whose names start
+with 'test':
+
+    swarm pause -p test
+"""
+
+import os
+import sys
+import argparse
+
+import swarmcore
+import swarmcore.log
+
+
+# set up logging
+log = swarmcore.log.Log('swarm.log', swarmcore.log.Log.DEBUG)
+
+# program version
+MajorRelease = 0
+MinorRelease = 1
+VersionString = 'v%d.%d' % (MajorRelease, MinorRelease)
+
+Plugin = {
+          'entry': 'pause',
+          'version': '%s' % VersionString,
+          'command': 'pause',
+         }
+
+
+def usage(msg=None):
+    """Print help for the befuddled user."""
+
+    if msg:
+        print('*'*60)
+        print(msg)
+        print('*'*60)
+    print(__doc__)        # module docstring used
+
+def pause(args):
+    """Pause (stop) a set of instances.
+
+    args    list of arg values to be parsed
+    """
+
+    # parse the command args
+    parser = argparse.ArgumentParser(prog='swarm pause',
+                                     description='This plugin stops EC2 instances so they can be resumed.')
+    parser.add_argument('-H', '--hibernate', dest='hibernate', action='store_true',
+                        help='hibernate the instances', default=False)
+    parser.add_argument('-n', '--no-wait', dest='wait', action='store_false',
+                        help="don't wait for instances to stop", default=True)
+    parser.add_argument('-p', '--prefix', dest='prefix', action='store',
+                        help='set the prefix for the instance names',
+                        metavar='<prefix>')
+    parser.add_argument('-q', '--quiet', dest='quiet', action='store_true',
+                        help='be quiet for scripting', default=False)
+    parser.add_argument('-T', '--timeout', dest='timeout', action='store',
+                        type=float, help='seconds to wait for instances to stop',
+                        metavar='<seconds>',
+                        default=swarmcore.Swarm.PauseTimeout)
+    parser.add_argument('-v', '--verbose', dest='verbose', action='count',
+                        default=0, help='make execution more verbose (cumulative)')
+    parser.add_argument('-V', '--version', action='version', version=VersionString,
+                        help='print the version and stop')
+    parser.add_argument('-y', '--yes', dest='yes', action='store_true',
+                        help="don't prompt before pausing", default=False)
+
+    args = parser.parse_args(args)
+
+    # increase verbosity if required
+    verbose = False
+    for _ in range(args.verbose):
+        log.bump_level()
+        verbose = True
+
+    # set variables to possibly modified defaults
+    prefix = args.prefix
+    quiet = args.quiet
+
+    if prefix is None:
+        usage("You must specify instances to pause ('-p' option).")
+        return 1
+    if args.timeout <= 0:
+        usage('The timeout must be positive')
+        return 1
+
+    # get a filtered list of running instances depending on prefix
+    swm = swarmcore.Swarm(verbose=verbose)
+    all_instances = swm.instances()
+    prefixes = prefix.split(',')
+    filtered_instances = []
+    for p in prefixes:
+        filter = swm.filter_name_prefix(p)
+        s = swm.filter(all_instances, filter)
+        filtered_instances = swm.union(filtered_instances, s)
+
+    log("Pausing %d instances named '%s*'"
+        % (len(filtered_instances), '*|'.join(prefixes)))
+
+    if len(filtered_instances) == 0:
+        if not quiet:
+            print("No running instances found with prefix: '%s*'"
+                  % '*|'.join(prefixes))
+        return 0
+
+    # give user a chance to bail
+    if args.yes:
+        answer = 'y'
+    else:
+        answer = raw_input('Pausing %d instances.  Proceed? (y/N): '
+                           % len(filtered_instances))
+        answer = answer.strip().lower()
+    if len(answer) == 0 or answer[0] != 'y':
+        log.info('User chose not to pause %d instances', len(filtered_instances))
+        return 0
+
+    not_stopped = swm.pause(filtered_instances, hibernate=args.hibernate,
+                            wait=args.wait, timeout=args.timeout)
+
+    if args.wait:
+        msg = ('Paused %d instances, %d not stopped'
+               % (len(filtered_instances), not_stopped))
+    else:
+        msg = 'Pausing %d instances.' % len(filtered_instances)
+    log(msg)
+    if not quiet:
+        print(msg)
+
+    if verbose:
+        log.debug('==============================================================')
+        log.debug('=========================  FINISHED  =========================')
+        log.debug('==============================================================')
+
+    if not_stopped:
+        return 1
+    return 0
@@ -0,0 +1,180 @@
+"""
+This plugin manages warm pools: pre-provisioned, stopped instances that
+'swarm start --from-pool' can start much faster than new instances.
+
+Usage: swarm pool <options> <action> [<pool>]
+
+where <options> is zero or more of:
+    -f   --flavour   set the instance flavour of the pool
+    -h   --help      print this help and stop
+    -i   --image     set the image ID or name of the pool
+    -k   --key       set the key of the pool
+    -n   --size      set the number of stopped instances kept in the pool
+    -S   --script    path to a script run on each instance before stopping it
+    -s   --secgroup  set the security group(s) of the pool (eg, 'xyzzy,default')
+    -u   --userdata  path to a userdata file for the pool instances
+    -V   --version   print version information and stop
+    -v   --verbose   be verbose (cumulative)
+    -z   --zone      set the availability zone of the pool
+
+and <action> is one of:
+    fill       define or update the pool from the options, then launch,
+               provision and stop instances until the pool is full
+    replenish  top the pool up to its size, doing nothing if the pool is
+               already being filled
+    status     show the instances in the pool (all pools if none given)
+    drain      terminate all pool instances and forget the pool
+
+Options given to 'fill' are remembered, so later actions only need the
+pool name.  'swarm start --from-pool' starts a replenish in the background.
+
+As an example, the following keeps 10 provisioned workers ready:
+
+    swarm pool -n 10 -f m5.large -S provision.sh fill workers
+"""
+
+import os
+import sys
+import argparse
+
+import swarmcore
+import swarmcore.log
+import swarmcore.pool as pool
+
+
+# set up logging
+log = swarmcore.log.Log('swarm.log', swarmcore.log.Log.DEBUG)
+
+# program version
+MajorRelease = 0
+MinorRelease = 1
+VersionString = 'v%d.%d' % (MajorRelease, MinorRelease)
+
+Plugin = {
+          'entry': 'pool_cmd',
+          'version': '%s' % VersionString,
+          'command': 'pool',
+         }
+
+# legal actions
+Actions = ('fill', 'replenish', 'status', 'drain')
+
+
+def usage(msg=None):
+    """Print help for the befuddled user."""
+
+    if msg:
+        print('*'*60)
+        print(msg)
+        print('*'*60)
+    print(__doc__)        # module docstring used
+
+def show_status(swm, name):
+    """Print the state counts of one pool."""
+
+    d = pool.get_definition(name)
+    counts = pool.WarmPool(swm, name).status()
+    states = ', '.join('%d %s' % (counts[s], s) for s in sorted(counts))
+    print('%-17s |size %s, %s: %s'
+          % (name, d['size'], d['flavour'], states or 'empty'))
+
+def pool_cmd(args):
+    """Manage a warm pool.
+
+    args    list of arg values to be parsed
+    """
+
+    # parse the command args
+    parser = argparse.ArgumentParser(prog='swarm pool',
+                                     description='This plugin manages warm pools of stopped EC2 instances.')
+    parser.add_argument('-f', '--flavour', dest='flavour', action='store',
+                        help='set the instance flavour', metavar='<flavour>')
+    parser.add_argument('-i', '--image', dest='image', action='store',
+                        help='set the image ID or name', metavar='<image>')
+    parser.add_argument('-k', '--key', dest='key', action='store',
+                        help='set the key', metavar='<key>')
+    parser.add_argument('-n', '--size', dest='size', action='store', type=int,
+                        help='set the pool size', metavar='<size>')
+    parser.add_argument('-S', '--script', dest='script', action='store',
+                        help='set the provisioning script', metavar='<script>')
+    parser.add_argument('-s', '--secgroup', dest='secgroup', action='store',
+                        help='set the security group(s)', metavar='<secgroup>')
+    parser.add_argument('-u', '--userdata', dest='userdata', action='store',
+                        help='set the userdata file', metavar='<userdata>')
+    parser.add_argument('-v', '--verbose', dest='verbose', action='count',
+                        default=0, help='make execution more verbose (cumulative)')
+    parser.add_argument('-V', '--version', action='version', version=VersionString,
+                        help='print the version and stop')
+    parser.add_argument('-z', '--zone', dest='zone', action='store',
+                        help='set the availability zone', metavar='<zone>')
+    parser.add_argument('action', action='store', help='the action to perform')
+    parser.add_argument('name', action='store', nargs='?', help='the pool name')
+
+    args = parser.parse_args(args)
+
+    # increase verbosity if required
+    verbose = False
+    for _ in range(args.verbose):
+        log.bump_level()
+        verbose = True
+
+    action = args.action
+    name = args.name
+
+    if action not in Actions:
+        usage("Action '%s' is not recognised, legal actions are: %s"
+              % (action, ', '.join(Actions)))
+        return 1
+    if name is None and action != 'status':
+        usage("Action '%s' needs a pool name" % action)
+        return 1
+    for path in (args.script, args.userdata):
+        if path is not None and not os.path.isfile(path):
+            usage("File '%s' doesn't exist" % path)
+            return 1
+
+    swm = swarmcore.Swarm(verbose=verbose)
+
+    if action == 'fill':
+        secgroup = None
+        if args.secgroup:
+            secgroup = args.secgroup.split(',')
+        try:
+            pool.define(name, image=args.image, flavour=args.flavour,
+                        key=args.key, secgroup=secgroup, zone=args.zone,
+                        userdata=args.userdata, script=args.script,
+                        size=args.size)
+        except ValueError as e:
+            usage(str(e))
+            return 1
+
+    if action != 'status' and pool.get_definition(name) is None:
+        usage("Pool '%s' isn't defined, use 'fill' first" % name)
+        return 1
+
+    if action in ('fill', 'replenish'):
+        added = pool.WarmPool(swm, name).fill()
+        msg = 'pool %s: %d instances added' % (name, added)
+        log(msg)
+        print(msg)
+        show_status(swm, name)
+    elif action == 'status':
+        names = [name] if name else sorted(pool.definitions())
+        if name and pool.get_definition(name) is None:
+            usage("Pool '%s' isn't defined" % name)
+            return 1
+        for n in names:
+            show_status(swm, n)
+    elif action == 'drain':
+        count = pool.WarmPool(swm, name).drain()
+        pool.undefine(name)
+        msg = 'pool %s: %d instances terminated' % (name, count)
+        log(msg)
+        print(msg)
+
+    if verbose:
+        log.debug('==============================================================')
+        log.debug('=========================  FINISHED  =========================')
+        log.debug('==============================================================')
+
+    return 0
@@ -0,0 +1,185 @@
+"""
+This plugin is used to reboot a set of instances and wait until they
+accept SSH connections again.
+
+Usage: swarm reboot <options>
+
+where <options> is zero or more of:
+    -h   --help     print this help and stop
+    -i   --ip       show public IP instead of instance name
+    -n   --no-wait  don't wait for the instances to accept SSH
+    -p   --prefix   name prefix used to select nodes (required)
+    -T   --timeout  seconds to wait for each wave to accept SSH (default 600)
+    -V   --version  print version information and stop
+    -v   --verbose  be verbose (cumulative)
+    -W   --wave     reboot this many instances at once, a number or a
+                    percentage like '25%' (default all)
+    -y   --yes      always reboot instances, don't prompt user
+
+Instances are rebooted with as few AWS calls as possible, then all are
+checked together for SSH.  The time each instance took to accept SSH
+again is shown as it recovers.  With '-W' each wave must recover (or time
+out) before the next wave is rebooted.
+
+As an example, the following will reboot all instances whose names start
+with 'cxwn', a quarter of them at a time:
+
+    swarm reboot -p cxwn -W 25%
+"""
+
+import os
+import sys
+import argparse
+
+import swarmcore
+import swarmcore.log
+import swarmcore.utils as utils
+
+
+# set up logging
+log = swarmcore.log.Log('swarm.log', swarmcore.log.Log.DEBUG)
+
+# program version
+MajorRelease = 0
+MinorRelease = 2
+VersionString = 'v%d.%d' % (MajorRelease, MinorRelease)
+
+Plugin = {
+          'entry': 'reboot',
+          'version': '%s' % VersionString,
+          'command': 'reboot',
+         }
+
+
+def usage(msg=None):
+    """Print help for the befuddled user."""
+
+    if msg:
+        print('*'*60)
+        print(msg)
+        print('*'*60)
+    print(__doc__)        # module docstring used
+
+def reboot(args):
+    """Reboot a set of instances.
+
+    args    list of arg values to be parsed
+    """
+
+    # parse the command args
+    parser = argparse.ArgumentParser(prog='swarm reboot',
+                                     description='This plugin reboots EC2 instances.')
+    parser.add_argument('-i', '--ip', dest='show_ip', action='store_true',
+                        help='show public IP instead of instance name',
+                        default=False)
+    parser.add_argument('-n', '--no-wait', dest='wait', action='store_false',
+                        help="don't wait for instances to accept SSH",
+                        default=True)
+    parser.add_argument('-p', '--prefix', dest='prefix', action='store',
+                        help='set the prefix for the instance names',
+                        metavar='<prefix>')
+    parser.add_argument('-T', '--timeout', dest='timeout', action='store',
+                        type=float, help='seconds to wait for each wave',
+                        metavar='<seconds>',
+                        default=swarmcore.Swarm.RebootTimeout)
+    parser.add_argument('-v', '--verbose', dest='verbose', action='count',
+                        default=0, help='make execution more verbose (cumulative)')
+    parser.add_argument('-V', '--version', action='version', version=VersionString,
+                        help='print the version and stop')
+    parser.add_argument('-W', '--wave', dest='wave', action='store',
+                        help='number of instances rebooted at once',
+                        metavar='<number>')
+    parser.add_argument('-y', '--yes', dest='yes', action='store_true',
+                        help="don't prompt before rebooting", default=False)
+
+    args = parser.parse_args(args)
+
+    # increase verbosity if required
+    verbose = False
+    for _ in range(args.verbose):
+        log.bump_level()
+        verbose = True
+
+    # set variables to possibly modified defaults
+    show_ip = args.show_ip
+    prefix = args.prefix
+    timeout = args.timeout
+    wait = args.wait
+
+    if prefix is None:
+        usage("You must specify instances to reboot ('-p' option).")
+        return 1
+    if timeout <= 0:
+        usage('The timeout must be positive')
+        return 1
+
+    # get a filtered list of instances depending on prefix
+    swm = swarmcore.Swarm(verbose=verbose)
+    all_instances = swm.instances()
+    prefixes = prefix.split(',')
+    filtered_instances = []
+    for p in prefixes:
+        filter = swm.filter_name_prefix(p)
+        s = swm.filter(all_instances, filter)
+        filtered_instances = swm.union(filtered_instances, s)
+
+    log('%d instances selected' % len(filtered_instances))
+    log("Selection prefixes: '%s*'" % '*|'.join(prefixes))
+
+    if len(filtered_instances) == 0:
+        print("No instances found with prefix: '%s*'" % '*|'.join(prefixes))
+        return 0
+
+    wave = None
+    if args.wave is not None:
+        try:
+            wave = utils.parse_batch_size(args.wave, len(filtered_instances))
+        except ValueError as e:
+            usage(str(e))
+            return 1
+
+    # give user a chance to bail
+    if args.yes:
+        answer = 'y'
+    else:
+        answer = raw_input('Rebooting %d instances.  Proceed? (y/N): '
+                           % len(filtered_instances))
+        answer = answer.strip().lower()
+    if len(answer) == 0 or answer[0] != 'y':
+        log.info('User chose not to reboot %d instances', len(filtered_instances))
+        return 0
+
+    log.info('User elected to reboot %d instances:\n%s',
+             len(filtered_instances), filtered_instances)
+
+    def show_result(result):
+        """Display the recovery of one instance."""
+
+        flag = '*' if result.status else ' '
+        print('%-17s%s|%s' % (result.label(show_ip), flag, result.output))
+        sys.stdout.flush()
+
+    results = swm.reboot(filtered_instances, wave=wave, wait=wait,
+                         timeout=timeout, callback=show_result)
+
+    status = 0
+    if wait:
+        failed = len([r for r in results if r.status])
+        durations = [r.duration for r in results if r.status == 0]
+        msg = ('Rebooted %d instances, %d accepting SSH, %d not'
+               % (len(filtered_instances), len(durations), failed))
+        if durations:
+            msg += ', slowest %.0fs' % max(durations)
+        if failed:
+            status = 1
+    else:
+        msg = 'Rebooted %d instances.' % len(filtered_instances)
+    print(msg)
+    log(msg)
+
+    if verbose:
+        log.debug('==============================================================')
+        log.debug('=========================  FINISHED  =========================')
+        log.debug('==============================================================')
+
+    return status
@@ -0,0 +1,184 @@
+"""
+This plugin finds instances whose console log shows they are unhealthy
+(fsck needed, read-only filesystem, I/O errors, runaway loop, hung before
+the login prompt) and replaces them.
+
+Usage: swarm remediate <options>
+
+where <options> is zero or more of:
+    -a   --auth         directory holding authentication keys (default is ~/.ssh)
+    -C   --cooldown     seconds before an instance name is replaced again (default 3600)
+    -c   --concurrency  maximum number of replacements at once (default 5)
+    -g   --grace        seconds after launch before an instance is checked (default 600)
+    -h   --help         print this help and stop
+    -i   --ip           show public IP instead of instance name
+    -l   --loop         check again every this many seconds (default is once)
+    -n   --dry-run      show what would be replaced, but don't replace
+    -p   --prefix       name prefix used to select nodes (default is all instances)
+    -r   --rate         maximum replacements per minute (default 10)
+    -V   --version      print version information and stop
+    -v   --verbose      be verbose (cumulative)
+
+Replacements keep the name and configuration of the unhealthy instance.
+Instances launched less than the grace period ago are still booting, and
+their console looks hung, so they aren't checked.
+The time each instance name is replaced is remembered between runs, so
+an instance that keeps failing is only replaced once per cooldown period.
+
+As an example, the following checks all instances whose names start with
+'test' every 10 minutes, replacing at most 2 at a time:
+
+    swarm remediate -p test -c 2 -l 600
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import swarmcore
+import swarmcore.log
+import swarmcore.defaults as defaults
+
+
+# set up logging
+log = swarmcore.log.Log('swarm.log', swarmcore.log.Log.DEBUG)
+
+# program version
+MajorRelease = 0
+MinorRelease = 1
+VersionString = 'v%d.%d' % (MajorRelease, MinorRelease)
+
+Plugin = {
+          'entry': 'remediate',
+          'version': '%s' % VersionString,
+          'command': 'remediate',
+         }
+
+
+def usage(msg=None):
+    """Print help for the befuddled user."""
+
+    if msg:
+        print('*'*60)
+        print(msg)
+        print('*'*60)
+    print(__doc__)        # module docstring used
+
+def remediate(args):
+    """Replace unhealthy instances.
+
+    args    list of arg values to be parsed
+    """
+
+    # parse the command args
+    parser = argparse.ArgumentParser(prog='swarm remediate',
+                                     description='This plugin replaces unhealthy EC2 instances.')
+    parser.add_argument('-a', '--auth', dest='auth', action='store',
+                        help='set the path to the authentication directory',
+                        metavar='<auth>', default=defaults.AuthPath)
+    parser.add_argument('-C', '--cooldown', dest='cooldown', action='store',
+                        type=float, help='seconds before a name is replaced again',
+                        metavar='<seconds>',
+                        default=swarmcore.Swarm.RemediateCooldown)
+    parser.add_argument('-c', '--concurrency', dest='concurrency', action='store',
+                        type=int, help='maximum replacements at once',
+                        metavar='<number>',
+                        default=swarmcore.Swarm.RemediateConcurrency)
+    parser.add_argument('-g', '--grace', dest='grace', action='store',
+                        type=float, help='seconds after launch before an instance is checked',
+                        metavar='<seconds>',
+                        default=swarmcore.Swarm.RemediateGrace)
+    parser.add_argument('-i', '--ip', dest='show_ip', action='store_true',
+                        help='show public IP instead of instance name',
+                        default=False)
+    parser.add_argument('-l', '--loop', dest='loop', action='store',
+                        type=float, help='check again every this many seconds',
+                        metavar='<seconds>')
+    parser.add_argument('-n', '--dry-run', dest='dry_run', action='store_true',
+                        help="show what would be replaced, don't replace",
+                        default=False)
+    parser.add_argument('-p', '--prefix', dest='prefix', action='store',
+                        help='set the prefix for the instance names',
+                        metavar='<prefix>')
+    parser.add_argument('-r', '--rate', dest='rate', action='store',
+                        type=float, help='maximum replacements per minute',
+                        metavar='<rate>', default=swarmcore.Swarm.RemediateRate)
+    parser.add_argument('-v', '--verbose', dest='verbose', action='count',
+                        default=0, help='make execution more verbose (cumulative)')
+    parser.add_argument('-V', '--version', action='version', version=VersionString,
+                        help='print the version and stop')
+
+    args = parser.parse_args(args)
+
+    # increase verbosity if required
+    verbose = False
+    for _ in range(args.verbose):
+        log.bump_level()
+        verbose = True
+
+    # set variables to possibly modified defaults
+    show_ip = args.show_ip
+    prefix = args.prefix
+    loop = args.loop
+
+    if args.concurrency < 1:
+        usage('The concurrency must be a positive integer')
+        return 1
+    if args.rate <= 0:
+        usage('The rate must be positive')
+        return 1
+
+    swm = swarmcore.Swarm(auth_dir=args.auth, verbose=verbose)
+
+    def show_result(result):
+        """Display the result for one unhealthy instance."""
+
+        flag = '*' if result.status else ' '
+        print('%-17s%s|%s' % (result.label(show_ip), flag, result.output))
+        sys.stdout.flush()
+
+    status = 0
+    try:
+        while True:
+            # get a filtered list of instances depending on prefix
+            all_instances = swm.instances()
+            prefixes = []
+            filtered_instances = all_instances
+            if prefix is not None:
+                prefixes = prefix.split(',')
+                filtered_instances = []
+                for p in prefixes:
+                    filter = swm.filter_name_prefix(p)
+                    s = swm.filter(all_instances, filter)
+                    filtered_instances = swm.union(filtered_instances, s)
+
+            print("%s checking %d instances named '%s*'"
+                  % (time.strftime('%H:%M:%S'), len(filtered_instances),
+                     '*|'.join(prefixes)))
+            results = swm.remediate(filtered_instances,
+                                    concurrency=args.concurrency,
+                                    rate=args.rate, cooldown=args.cooldown,
+                                    grace=args.grace,
+                                    dry_run=args.dry_run,
+                                    threads=len(filtered_instances),
+                                    callback=show_result)
+            replaced = len([r for r in results if r.status == 0])
+            failed = len([r for r in results if r.status == 1])
+            print('%d unhealthy, %d replaced, %d failed'
+                  % (len(results), replaced, failed))
+            if failed:
+                status = 1
+
+            if loop is None:
+                break
+            time.sleep(loop)
+    except KeyboardInterrupt:
+        pass
+
+    if verbose:
+        log.debug('==============================================================')
+        log.debug('=========================  FINISHED  =========================')
+        log.debug('==============================================================')
+
+    return status
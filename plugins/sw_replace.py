@@ -9,12 +9,16 @@ where <options> is zero or more of:
     -c  <config>    set the config file to use
     -f  <flavour>   set the image flavour
     -h              print this help and stop
-    -i  <image>     sets image to use
+    -i  <image>     sets image to use, an image ID or name
     -k  <keyname>   set key to use
+    -m  <number>    replace at most this many instances at once, a number
+                    or a percentage like '25%' (default all)
     -p  <prefix>    set the name prefix
     -q              be quiet for scripting
-    -r  <region>    set the region to use
+    -r  <region>    set the availability zone of the new instances
+                    (default the zone of each instance replaced)
     -s  <secgroup>  set the security group(s) (can be: 'xyzzy,default')
+    --surge         start replacements before terminating the old instances
     -u  <userdata>  path to a userdata script file
     -v              become verbose (cumulative)
     -V              print version and stop
@@ -26,12 +30,18 @@ more <name>s are given the given <prefix> selects suitable instances and the
 instances in that selection with the given <name>s are replaced.
 
 The command line options override information from the running instance(s).
+
+Instances with the same configuration are replaced with one AWS call, so
+replacing many instances takes about as long as replacing one.  By default
+the old instances are terminated before their replacements start.  With
+'--surge' the replacements start first, and the old instances are only
+terminated once the replacements accept SSH connections.  With '-m' the
+instances are replaced in batches of that size.
 """
 
 import os
 import sys
 import shutil
-import time
 import argparse
 import commands
 import tempfile
@@ -57,9 +67,6 @@ Plugin = {
           'command': 'replace',
          }
 
-# delay while polling status of dying instance
-WaitForDyingServer = 5
-
 # default instance values
 DefaultAuthPath = os.path.expanduser('~/.ssh')
 DefaultRegion = 'ap-southeast-2'
@@ -110,7 +117,7 @@ def load_config(config_file):
     if not os.path.isfile(config_file):
         error("Can't find config file %s" % config_file)
 
-    log.debug("load_config: loading config from '%s'" % str(config_file))
+    log.debug("load_config: loading config from '%s'", config_file)
 
     # read config, look for known variable definitions
     with open(config_file, 'rb') as fd:
@@ -136,8 +143,8 @@ def load_config(config_file):
         value = value.strip()
 
         if name not in Config2Global:
-            log.warn("Line %d of %s: name '%s' is unrecognized"
-                     % (l+1, config_file, name))
+            log.warn("Line %d of %s: name '%s' is unrecognized",
+                     l+1, config_file, name)
             errors = True
             continue
 
@@ -156,7 +163,7 @@ def load_config(config_file):
     # update globals with values from the config file
     log.debug('load_config: New globals:')
     for (key, value) in updated_globals.items():
-        log.debug('    %s: %s,' % (str(key), str(value)))
+        log.debug('    %s: %s,', key, value)
 
     globals().update(updated_globals)
 
@@ -184,17 +191,23 @@ def replace(args):
     parser.add_argument('-k', '--key', dest='key', action='store',
                         help='set the key file for the new instance',
                         metavar='<key>', default=defaults.Key)
+    parser.add_argument('-m', '--max-unavailable', dest='max_unavailable',
+                        action='store', metavar='<number>',
+                        help='maximum number of instances replaced at once')
     parser.add_argument('-p', '--prefix', dest='prefix', action='store',
                         help='set the prefix for the new instance name',
                         metavar='<prefix>')
     parser.add_argument('-q', '--quiet', dest='quiet', action='store_true',
                         help='be quiet for scripting', default=False)
     parser.add_argument('-r', '--region', dest='region', action='store',
-                        help='set the region for the new instance name',
-                        metavar='<region>', default=defaults.Region)
+                        help='set the availability zone for the new instances',
+                        metavar='<region>')
     parser.add_argument('-s', '--secgroup', dest='secgroup', action='store',
                         help='set the security group for the new instance',
                         metavar='<secgroup>', default=defaults.Secgroup)
+    parser.add_argument('--surge', dest='surge', action='store_true',
+                        help='start replacements before terminating the old instances',
+                        default=False)
     parser.add_argument('-u', '--userdata', dest='userdata', action='store',
                         help='set the userdata file for the new instance',
                         metavar='<userdata>')
@@ -235,16 +248,16 @@ def replace(args):
     zone = config_values.get('zone', args.zone)
     instances = args.instances
 
-    log.debug('auth=%s' % str(auth))
-    log.debug('flavour=%s' % str(flavour))
-    log.debug('image=%s' % str(image))
-    log.debug('key=%s' % str(key))
-    log.debug('prefix=%s' % str(prefix))
-    log.debug('region=%s' % str(region))
-    log.debug('secgroup=%s' % str(secgroup))
-    log.debug('userdata=%s' % str(userdata))
-    log.debug('zone=%s' % str(zone))
-    log.debug('instances=%s' % str(instances))
+    log.debug('auth=%s', auth)
+    log.debug('flavour=%s', flavour)
+    log.debug('image=%s', image)
+    log.debug('key=%s', key)
+    log.debug('prefix=%s', prefix)
+    log.debug('region=%s', region)
+    log.debug('secgroup=%s', secgroup)
+    log.debug('userdata=%s', userdata)
+    log.debug('zone=%s', zone)
+    log.debug('instances=%s', instances)
 
     # connect to AWS
     s = swarmcore.Swarm(auth_dir=auth, verbose=verbose)
@@ -259,7 +272,7 @@ def replace(args):
             instance_name = utils.get_instance_name(instance)
             if instance_name.startswith(prefix):
                 replace_instances.append(instance)
-    log.debug('Replacing instance(s) %s' % str(replace_instances))
+    log.debug('Replacing instance(s) %s', replace_instances)
     if not quiet:
         print('Replacing instance(s) %s' % str(replace_instances))
 
@@ -275,9 +288,9 @@ def replace(args):
     if not replace_instances:
         if prefix and instances:
             msg = ("Sorry, didn't find any instances of '%s*' with names '%s'"
-                   % (name, str(instances)))
+                   % (prefix, str(instances)))
         elif prefix:
-            msg = ("Sorry, didn't find any instances of '%s*'" % name)
+            msg = ("Sorry, didn't find any instances of '%s*'" % prefix)
         elif instances:
             msg = ("Sorry, didn't find any instances with names in '%s'"
                    % str(instances))
@@ -287,77 +300,43 @@ def replace(args):
         print(msg)
         sys.exit(10)
 
-    # gather what info we can from the running instances
-    data = s.describe_instances(replace_instances)
-
-    # debug
-    log('data=%s' % str(data))
-
-    # replace instance info with data from parameters, this should be infrequent
-    for info in data:
-#        if auth:
-#            info['auth'] = auth
-        if flavour:
-            info['instance_type'] = flavour
-        if image:
-            info['image_id'] = image
-        if key:
-            info['key_name'] = key
-        if region:
-            info['availability_zone'] = region
-        if secgroup:
-            info['security_groups'] = secgroup.split(',')
-            print("secgroup.split(',')=%s" % str(secgroup.split(',')))
-#        if userdata:
-#            info['userdata'] = userdata
-
-    log.debug('After replace, data=%s' % str(data))
-
-    # stop the current instances, wait until really gone
-    log.debug('Stopping %d instances %s'
-              % (len(replace_instances), ', '.join([x['name'] for x in data])))
+    names = [utils.get_instance_name(i) or i.instance_id for i in replace_instances]
+    log.debug('Replacing %d instances %s',
+              len(replace_instances), ', '.join(names))
     if not quiet:
-        print('Stopping %d instances %s'
-              % (len(replace_instances), ', '.join([x['name'] for x in data])))
-
-    s.terminate(replace_instances, wait=True)
-
-    log('%d instances stopped' % len(replace_instances))
-
-    # we must be *absolutely sure* that the instance we just terminated has gone
-    log('Ensuring %d instances have really been terminated...' % len(replace_instances))
-    old_names = [info['name'] for info in data]
-    while True:
-        all_instances = s.instances()
-        log('all_instances=%s' % str(all_instances))
-        none_left = True
-        for s in all_instances:
-            if s.name in old_names:
-                log('Server %s still around, sleeping...' % new_name)
-                time.sleep(WaitForDyingServer)
-                none_left = False
-        break
-    log('%d instances have really gone now' % len(replace_instances))
-
-    # start replacement instance
-    if not quiet:
-        print('Starting %d new instances' % len(replace_instances))
-    log.debug('Starting %d new instances' % len(replace_instances))
-
-    new_instances = []
-    for info in data:
-        new_image = info['image_id']
-        new_key = info['key_name']
-        new_security = info['security_groups']
-        new_flavour = info['instance_type']
-        new_userdata = ''
-#        'tenancy': '...',
-#        'availability_zone': 'ap-...',
-        new_name = info['name']
-        new_instance = s.start(1, new_name, image=new_image, flavour=new_flavour,
-                               key=new_key, secgroup=new_security,
-                               userdata=new_userdata)
-        new_instances.append(new_instance)
+        print('Replacing %d instances %s'
+              % (len(replace_instances), ', '.join(names)))
+
+    max_unavailable = None
+    if args.max_unavailable is not None:
+        try:
+            max_unavailable = utils.parse_batch_size(args.max_unavailable,
+                                                     len(replace_instances))
+        except ValueError as e:
+            usage(str(e))
+            return 1
+
+    # get the userdata as a string
+    userdata_str = None
+    if userdata is not None:
+        with open(userdata, 'rb') as fd:
+            userdata_str = fd.read()
+
+    # options override information from the running instances
+    secgroups = None
+    if secgroup:
+        secgroups = secgroup.split(',')
+    try:
+        new_instances = s.replace(replace_instances, flavour=flavour,
+                                  image=image, key=key, secgroup=secgroups,
+                                  zone=region, userdata=userdata_str,
+                                  surge=args.surge,
+                                  max_unavailable=max_unavailable)
+    except swarmcore.ReplaceError as e:
+        msg = '%s\n%d instances started' % (str(e), len(e.instances))
+        log.error(msg)
+        print(msg)
+        return 1
 
     msg = '%d instances started' % len(new_instances)
     log.debug(msg)
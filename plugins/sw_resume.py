@@ -0,0 +1,160 @@
+"""
+This plugin is used to resume a set of instances paused by 'swarm pause'.
+The instances keep their disks, so they don't need provisioning again.
+
+Usage: swarm resume <options>
+
+where <options> is zero or more of:
+    -h   --help      print this help and stop
+    -i   --ip        show public IP instead of instance name
+    -n   --no-wait   don't wait for the instances to run
+    -p   --prefix    name prefix used to select nodes (required)
+    -q   --quiet     be quiet for scripting
+    -s   --ssh       also wait until the instances accept SSH
+    -T   --timeout   seconds to wait for the instances (default 600)
+    -V   --version   print version information and stop
+    -v   --verbose   be verbose (cumulative)
+
+Resumed instances usually get new public IP addresses, which are shown.
+
+As an example, the following will resume all paused instances whose names
+start with 'test' and wait until they accept SSH:
+
+    swarm resume -p test -s
+"""
+
+import os
+import sys
+import argparse
+
+import swarmcore
+import swarmcore.log
+
+
+# set up logging
+log = swarmcore.log.Log('swarm.log', swarmcore.log.Log.DEBUG)
+
+# program version
+MajorRelease = 0
+MinorRelease = 1
+VersionString = 'v%d.%d' % (MajorRelease, MinorRelease)
+
+Plugin = {
+          'entry': 'resume',
+          'version': '%s' % VersionString,
+          'command': 'resume',
+         }
+
+
+def usage(msg=None):
+    """Print help for the befuddled user."""
+
+    if msg:
+        print('*'*60)
+        print(msg)
+        print('*'*60)
+    print(__doc__)        # module docstring used
+
+def resume(args):
+    """Resume (start) a set of paused instances.
+
+    args    list of arg values to be parsed
+    """
+
+    # parse the command args
+    parser = argparse.ArgumentParser(prog='swarm resume',
+                                     description='This plugin starts paused EC2 instances.')
+    parser.add_argument('-i', '--ip', dest='show_ip', action='store_true',
+                        help='show public IP instead of instance name',
+                        default=False)
+    parser.add_argument('-n', '--no-wait', dest='wait', action='store_false',
+                        help="don't wait for instances to run", default=True)
+    parser.add_argument('-p', '--prefix', dest='prefix', action='store',
+                        help='set the prefix for the instance names',
+                        metavar='<prefix>')
+    parser.add_argument('-q', '--quiet', dest='quiet', action='store_true',
+                        help='be quiet for scripting', default=False)
+    parser.add_argument('-s', '--ssh', dest='ssh', action='store_true',
+                        help='also wait until instances accept SSH',
+                        default=False)
+    parser.add_argument('-T', '--timeout', dest='timeout', action='store',
+                        type=float, help='seconds to wait for instances',
+                        metavar='<seconds>',
+                        default=swarmcore.Swarm.PauseTimeout)
+    parser.add_argument('-v', '--verbose', dest='verbose', action='count',
+                        default=0, help='make execution more verbose (cumulative)')
+    parser.add_argument('-V', '--version', action='version', version=VersionString,
+                        help='print the version and stop')
+
+    args = parser.parse_args(args)
+
+    # increase verbosity if required
+    verbose = False
+    for _ in range(args.verbose):
+        log.bump_level()
+        verbose = True
+
+    # set variables to possibly modified defaults
+    show_ip = args.show_ip
+    prefix = args.prefix
+    quiet = args.quiet
+    timeout = args.timeout
+
+    if prefix is None:
+        usage("You must specify instances to resume ('-p' option).")
+        return 1
+    if timeout <= 0:
+        usage('The timeout must be positive')
+        return 1
+
+    # get a filtered list of stopped instances depending on prefix
+    swm = swarmcore.Swarm(verbose=verbose)
+    all_instances = swm.instances(state='stopped')
+    prefixes = prefix.split(',')
+    filtered_instances = []
+    for p in prefixes:
+        filter = swm.filter_name_prefix(p)
+        s = swm.filter(all_instances, filter)
+        filtered_instances = swm.union(filtered_instances, s)
+
+    log("Resuming %d instances named '%s*'"
+        % (len(filtered_instances), '*|'.join(prefixes)))
+
+    if len(filtered_instances) == 0:
+        if not quiet:
+            print("No paused instances found with prefix: '%s*'"
+                  % '*|'.join(prefixes))
+        return 0
+
+    (not_ready, instances) = swm.resume(filtered_instances,
+                                        wait=args.wait or args.ssh,
+                                        timeout=timeout)
+    state = 'running'
+    if args.ssh and not not_ready:
+        not_ready = swm.wait_ssh(instances, timeout)
+        state = 'ssh'
+
+    if not quiet and (args.wait or args.ssh):
+        for (name, ip, _) in sorted(swm.get_status(instances)):
+            if show_ip:
+                print('%-17s |%s' % (ip, state))
+            else:
+                print('%-17s |%s' % (name, ip))
+
+    if args.wait or args.ssh:
+        msg = ('Resumed %d instances, %d not %s'
+               % (len(filtered_instances), not_ready, state))
+    else:
+        msg = 'Resuming %d instances.' % len(filtered_instances)
+    log(msg)
+    if not quiet:
+        print(msg)
+
+    if verbose:
+        log.debug('==============================================================')
+        log.debug('=========================  FINISHED  =========================')
+        log.debug('==============================================================')
+
+    if not_ready:
+        return 1
+    return 0
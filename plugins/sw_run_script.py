@@ -0,0 +1,225 @@
+"""
+This plugin runs a local script on many instances.  The script is sent to
+each instance over the SSH connection, so there is no need to copy it
+first and nothing is left on the instance.
+
+Usage: swarm run-script <options> <script> [<arg> ...]
+
+where <options> is zero or more of:
+    -C   --collapse    show each distinct output once with a list of its hosts
+    -e   --env         set a remote environment variable, VAR=value (repeatable)
+    -f   --format      output format, 'text' (default) or 'jsonl'
+    -h   --help        print this help and stop
+    -i   --ip          show source as IP address, not VM name
+    -I   --interpreter remote program to run the script (default 'bash')
+    -p   --prefix      name prefix used to select nodes (default is all instances)
+    -q   --quiet       be quiet for scripting
+    -t   --timeout     seconds allowed for each instance before it is killed
+    -T   --deadline    seconds allowed for the whole run
+    -V   --version     print version information and stop
+    -v   --verbose     be verbose
+and <script> is the path to the local script, <arg> are arguments passed
+to the script.
+
+An example:
+
+    swarm run-script -p "test" -e MODE=fast setup.sh --force
+"""
+
+import os
+import sys
+import argparse
+
+import swarmcore
+import swarmcore.log
+import swarmcore.utils as utils
+import swarmcore.defaults as defaults
+
+
+# set up logging
+log = swarmcore.log.Log('swarm.log', swarmcore.log.Log.DEBUG)
+
+# program version
+MajorRelease = 0
+MinorRelease = 1
+VersionString = 'v%d.%d' % (MajorRelease, MinorRelease)
+
+# plugin info
+Plugin = {
+          'entry': 'run_script',
+          'version': VersionString,
+          'command': 'run-script',
+         }
+
+# legal output formats
+OutputFormats = ['text', 'jsonl']
+
+
+def usage(msg=None):
+    """Print help for the befuddled user."""
+
+    if msg:
+        print('*'*60)
+        print(msg)
+        print('*'*60)
+    print(__doc__)        # module docstring used
+
+def ip_key(key):
+    """Function to make a 'canonical' IP string for sorting.
+    The given IP has each subfield expanded to 3 numeric digits, eg:
+
+        given '1.255.24.6' return '001.255.014.006'
+    """
+
+    fields = key.ip.split('.')
+    result = []
+    for f in fields:
+        result.append('%03d' % int(f))
+
+    return result
+
+def run_script(args):
+    """Run a local script on required instances.
+
+    args    list of arg values
+    """
+
+    # parse the command args
+    parser = argparse.ArgumentParser(prog='swarm run-script',
+                                     description='This plugin runs a local script on the specified EC2 instances.')
+    parser.add_argument('-C', '--collapse', dest='collapse', action='store_true',
+                        help='group instances with identical output',
+                        default=False)
+    parser.add_argument('-e', '--env', dest='env', action='append',
+                        help='set a remote environment variable',
+                        metavar='<VAR=value>', default=[])
+    parser.add_argument('-f', '--format', dest='format', action='store',
+                        help="set the output format, 'text' or 'jsonl'",
+                        metavar='<format>', choices=OutputFormats,
+                        default='text')
+    parser.add_argument('-i', '--ip', dest='show_ip', action='store_true',
+                        help='display the instance IP in the results',
+                        default=False)
+    parser.add_argument('-I', '--interpreter', dest='interpreter', action='store',
+                        help='set the remote program that runs the script',
+                        metavar='<interpreter>', default='bash')
+    parser.add_argument('-p', '--prefix', dest='prefix', action='store',
+                        help='set the prefix for the instance names',
+                        metavar='<prefix>')
+    parser.add_argument('-q', '--quiet', dest='quiet', action='store_true',
+                        help='be quiet for scripting', default=False)
+    parser.add_argument('-t', '--timeout', dest='timeout', action='store',
+                        type=float, help='seconds allowed for each instance',
+                        metavar='<seconds>')
+    parser.add_argument('-T', '--deadline', dest='deadline', action='store',
+                        type=float, help='seconds allowed for the whole run',
+                        metavar='<seconds>')
+    parser.add_argument('-v', '--verbose', dest='verbose', action='count',
+                        default=0, help='make execution more verbose (cumulative)')
+    parser.add_argument('-V', '--version', action='version', version=VersionString,
+                        help='print the version and stop')
+    parser.add_argument('script', metavar='<script>', action='store',
+                        help='the local script to run on each instance')
+    parser.add_argument('script_args', metavar='<arg>', nargs=argparse.REMAINDER,
+                        help='arguments passed to the script')
+    args = parser.parse_args(args)
+
+    # increase verbosity if required
+    verbose = False
+    for _ in range(args.verbose):
+        log.bump_level()
+        verbose = True
+
+    # set variables
+    collapse = args.collapse
+    format = args.format
+    interpreter = args.interpreter
+    prefix = args.prefix
+    quiet = args.quiet
+    show_ip = args.show_ip
+    script = args.script
+    script_args = args.script_args
+
+    if not os.path.isfile(script):
+        usage("Can't find script file '%s'" % script)
+        return 1
+
+    env = {}
+    for e in args.env:
+        if '=' not in e:
+            usage("Environment setting must have the form VAR=value: '%s'" % e)
+            return 1
+        (name, value) = e.split('=', 1)
+        if not swarmcore.Swarm.EnvNameRE.match(name):
+            usage("Bad environment variable name: '%s'" % name)
+            return 1
+        env[name] = value
+
+    # get all instances
+    swm = swarmcore.Swarm(verbose=verbose)
+    all_instances = swm.instances()
+
+    # get a filtered list of instances depending on prefix
+    prefixes = []
+    filtered_instances = all_instances
+    if prefix is not None:
+        prefixes = prefix.split(',')
+        filtered_instances = []
+        for p in prefixes:
+            filter = swm.filter_name_prefix(p)
+            s = swm.filter(all_instances, filter)
+            filtered_instances = swm.union(filtered_instances, s)
+
+    if not quiet and format == 'text':
+        print("Running '%s' on %d instances named '%s*'"
+              % (script, len(filtered_instances), '*|'.join(prefixes)))
+
+    run_opts = {'script_args': script_args, 'env': env,
+                'interpreter': interpreter,
+                'timeout': args.timeout, 'deadline': args.deadline}
+
+    # JSON lines are streamed as each result arrives
+    if format == 'jsonl':
+        def show_json(result):
+            print(result.to_json())
+            sys.stdout.flush()
+
+        swm.run_script(filtered_instances, script, callback=show_json, **run_opts)
+        return 0
+
+    # if collapsing output, group results as they arrive and display
+    if collapse:
+        groups = utils.OutputGroups()
+
+        def group_result(result):
+            groups.add(result.label(show_ip), result.status, result.output)
+
+        swm.run_script(filtered_instances, script, callback=group_result,
+                       **run_opts)
+        groups.show()
+        return 0
+
+    # kick off the parallel run, sort by IP or name
+    answer = swm.run_script(filtered_instances, script, **run_opts)
+    if show_ip:
+        answer = sorted(answer, key=ip_key)
+    else:
+        answer = sorted(answer, key=lambda r: r.label())
+
+    # display results
+    status = 0
+    for result in answer:
+        output = result.output.split('\n')
+        canonical_output = ('\n'+' '*17+' |').join(output)
+        if result.status == 0:
+            print('%-17s |%s' % (result.label(show_ip), canonical_output))
+        else:
+            status = 1
+            print('%-17s*|%s' % (result.label(show_ip), canonical_output))
+
+    if verbose:
+        log.debug('==============================================================')
+        log.debug('=========================  FINISHED  =========================')
+        log.debug('==============================================================')
+
+    return status
@@ -8,7 +8,7 @@ where <options> is zero or more of:
     -c  <config>    set the config file to use
     -f  <flavour>   set the image flavour
     -h              print this help and stop
-    -i  <image>     sets image to use
+    -i  <image>     sets image to use, an image ID or name
     -k  <keyname>   set key to use
     -p  <prefix>    set the name prefix
     -q              be quiet, for scripting
@@ -18,9 +18,22 @@ where <options> is zero or more of:
     -v              verbose debug logging
     -V              print version and stop
     -z  <zone>      set the availability zone to use
+    --fleet         launch with one EC2 Fleet call, '-f' and '-z' may then
+                    be comma-separated lists of acceptable flavours and zones
+    --from-pool <pool>
+                    start stopped instances from a warm pool
 and <number> is the number of additional instances to start.
 This program only adds new Instances.
 
+With '--from-pool' pre-provisioned instances are claimed from the warm
+pool (see 'swarm pool'), renamed and started.  If the pool hasn't enough
+instances the rest are started new with the pool configuration (but not
+provisioned by the pool script).  The pool is refilled in the background.
+
+With '--fleet' as many instances as AWS has capacity for are started in
+one call, using any of the given flavours (earlier ones preferred) and
+zones.  Fewer than <number> instances may be started.
+
 The config file overrides any built-in defaults, and the options
 can override any config file values.
 """
@@ -36,6 +49,7 @@ import traceback
 
 import swarmcore
 import swarmcore.log
+import swarmcore.pool as pool
 import swarmcore.utils as utils
 import swarmcore.defaults as defaults
 
@@ -84,7 +98,7 @@ def start(args):
                         help='set the new instance flavour',
                         metavar='<flavour>', default=defaults.Flavour)
     parser.add_argument('-i', '--image', dest='image', action='store',
-                        help='set the image for the new instance',
+                        help='set the image ID or name for the new instance',
                         metavar='<image>', default=defaults.Image)
     parser.add_argument('-k', '--key', dest='key', action='store',
                         help='set the key file for the new instance',
@@ -110,6 +124,11 @@ def start(args):
     parser.add_argument('-z', '--zone', dest='zone', action='store',
                         help='set the zone for the new instance',
                         metavar='<zone>', default=defaults.Zone)
+    parser.add_argument('--fleet', dest='fleet', action='store_true',
+                        help='launch with one EC2 Fleet call', default=False)
+    parser.add_argument('--from-pool', dest='from_pool', action='store',
+                        help='claim instances from this warm pool',
+                        metavar='<pool>')
     parser.add_argument('number', metavar='<number>', action='store', type=int,
                         help='the number of instances to start')
 
@@ -151,9 +170,9 @@ def start(args):
         sys.exit(1)
 
     if verbose:
-        log.debug('sw_start: prefix=%s' % prefix)
-        log.debug('sw_start: number=%d' % number)
-        log.debug('sw_start: prefix_name=%s' % prefix_name)
+        log.debug('sw_start: prefix=%s', prefix)
+        log.debug('sw_start: number=%d', number)
+        log.debug('sw_start: prefix_name=%s', prefix_name)
 
     # prepare security group info
     secgroup = secgroup.split(',')
@@ -170,28 +189,57 @@ def start(args):
         with open(userdata, 'rb') as fd:
             userdata_str = fd.read()
         if verbose:
-            log.debug('userdata:\n%s' % userdata_str)
+            log.debug('userdata:\n%s', userdata_str)
+
+    # claim what we can from a warm pool, the rest use the pool config
+    claimed = []
+    if args.from_pool:
+        try:
+            warm = pool.WarmPool(s, args.from_pool)
+        except ValueError as e:
+            usage(str(e))
+            return 1
+        claimed = warm.claim(number, prefix)
+        if not quiet:
+            print('%d instances claimed from pool %s'
+                  % (len(claimed), args.from_pool))
+        d = warm.definition
+        (image, zone, flavour) = (d['image'], d['zone'], d['flavour'])
+        (key, secgroup) = (d['key'], d['secgroup'])
+        if d['userdata']:
+            with open(d['userdata'], 'rb') as fd:
+                userdata_str = fd.read()
+        pool.replenish_background(args.from_pool)
 
     # start instance nodes, wait until running
-    log.debug('prefix=%s' % str(prefix))
-    new = s.start(number, prefix, image=image, region=region, zone=zone,
-                  flavour=flavour, key=key, secgroup=secgroup,
-                  userdata=userdata_str)
+    log.debug('prefix=%s', prefix)
+    new = []
+    if number > len(claimed) and args.fleet:
+        new = s.start_fleet(number - len(claimed), prefix, image=image,
+                            zones=zone.split(','), flavours=flavour.split(','),
+                            key=key, secgroup=secgroup, userdata=userdata_str)
+    elif number > len(claimed):
+        new = s.start(number - len(claimed), prefix, image=image,
+                      region=region, zone=zone, flavour=flavour, key=key,
+                      secgroup=secgroup, userdata=userdata_str)
     if not quiet:
-        print('%d new instances running' % len(new))
+        print('%d new instances running' % (len(new) + len(claimed)))
+        if len(new) + len(claimed) < number:
+            print('%d instances could not be started'
+                  % (number - len(new) - len(claimed)))
 
     if verbose:
-        log.debug('sw_start: number=%d' % number)
-        log.debug('sw_start: prefix=%s' % prefix)
-        log.debug('sw_start: image=%s' % image)
-        log.debug('sw_start: flavour=%s' % flavour)
-        log.debug('sw_start: key=%s' % key)
-        log.debug('sw_start: region=%s' % region)
-        log.debug('sw_start: zone=%s' % zone)
-        log.debug('sw_start: secgroup=%s' % str(secgroup))
-        log.debug('sw_start: userdata=%s' % str(userdata))
-        log.debug('sw_start: userdata_str=\n%s' % str(userdata_str))
-        log.debug('sw_start: auth=%s' % auth)
+        log.debug('sw_start: number=%d', number)
+        log.debug('sw_start: prefix=%s', prefix)
+        log.debug('sw_start: image=%s', image)
+        log.debug('sw_start: flavour=%s', flavour)
+        log.debug('sw_start: key=%s', key)
+        log.debug('sw_start: region=%s', region)
+        log.debug('sw_start: zone=%s', zone)
+        log.debug('sw_start: secgroup=%s', secgroup)
+        log.debug('sw_start: userdata=%s', userdata)
+        log.debug('sw_start: userdata_str=\n%s', userdata_str)
+        log.debug('sw_start: auth=%s', auth)
 
     if verbose:
         log.debug('==============================================================')
@@ -105,10 +105,10 @@ def stop(args):
     wait = args.wait
     yes = args.yes
 
-    log.debug('sw_stop: prefix=%s' % str(prefix))
-    log.debug('sw_stop: state=%s' % str(state))
-    log.debug('sw_stop: wait=%s' % str(wait))
-    log.debug('sw_stop: yes=%s' % str(yes))
+    log.debug('sw_stop: prefix=%s', prefix)
+    log.debug('sw_stop: state=%s', state)
+    log.debug('sw_stop: wait=%s', wait)
+    log.debug('sw_stop: yes=%s', yes)
 
     # check if enough information supplied
     if prefix is None and state is None:
@@ -118,7 +118,7 @@ def stop(args):
     # get all instances
     swm = swarmcore.Swarm(verbose=verbose)
     all_instances = swm.instances()
-    log('instances=%s' % str(all_instances))
+    log.debug('instances=%s', all_instances)
 
     # get a filtered list of instances depending on prefix, state, etc
     prefix_str = '*'        # assume user wants to stop ALL instances
@@ -131,8 +131,8 @@ def stop(args):
             f = swm.filter_name_prefix(prefix)
             s = swm.filter(all_instances, f)
             filtered_instances = swm.union(filtered_instances, s)
-    log('prefix=%s, prefix_str=%s' % (str(prefix), prefix_str))
-    log('filtered_instances=%s' % str(filtered_instances))
+    log.debug('prefix=%s, prefix_str=%s', prefix, prefix_str)
+    log.debug('filtered_instances=%s', filtered_instances)
 
     state_str = '*'         # assume user wants to stop all states of instances
     state_instances = filtered_instances
@@ -145,8 +145,8 @@ def stop(args):
             s = swm.filter(filtered_instances, f)
             state_instances = swm.union(state_instances, s)
     filtered_instances = state_instances
-    log('state=%s, state_str=%s' % (str(state), state_str))
-    log('filtered_instances=%s' % str(filtered_instances))
+    log.debug('state=%s, state_str=%s', state, state_str)
+    log.debug('filtered_instances=%s', filtered_instances)
 
     if not quiet:
         print("Stopping %d instances named '%s', state='%s'"
@@ -169,11 +169,11 @@ def stop(args):
                            % len(filtered_instances))
         answer = answer.strip().lower()
     if len(answer) == 0 or answer[0] != 'y':
-        log.info('User chose not to stop %d instances' % len(filtered_instances))
+        log.info('User chose not to stop %d instances', len(filtered_instances))
         return 0
 
-    log.info('User elected to terminate %d instances:\n%s'
-             % (len(filtered_instances), str(filtered_instances)))
+    log.info('User elected to terminate %d instances:\n%s',
+             len(filtered_instances), filtered_instances)
 
     # stop all the instances
     swm.terminate(filtered_instances, wait)
@@ -3,6 +3,7 @@ This plugin waits for the given state on the specified instances.  The
 states we can wait for are:
     . running
     . ssh
+    . stopped
     . terminated
 
 Usage: swarm wait <options> <state>
@@ -55,6 +56,7 @@ DefaultAuthDir = os.path.expanduser('~/.ssh')
 LegalStates = [
                'running',    # instance is running
                'ssh',        # instance accepts SSH connection
+               'stopped',    # instance is stopped (paused)
                'terminated', # instance has terminated
               ]
 
@@ -105,8 +107,8 @@ def wait(args):
         log.bump_level()
         verbose = True
 
-    log.debug("wait: show_ip=%s, prefix='%s', state='%s'"
-              % (str(show_ip), str(prefix), state))
+    log.debug("wait: show_ip=%s, prefix='%s', state='%s'",
+              show_ip, prefix, state)
 
     if state not in LegalStates:
         states = '\n    '.join(LegalStates)
@@ -115,9 +117,14 @@ def wait(args):
         usage(msg)
         return 1
 
-    # get all instances
+    # get all instances, waiting for 'stopped' looks at all instances that
+    # haven't been terminated
     swm = swarmcore.Swarm(verbose=verbose)
-    all_instances = swm.instances()
+    if state == 'stopped':
+        all_instances = [i for i in swm.instances(state=None)
+                         if i.state['Name'] not in ('shutting-down', 'terminated')]
+    else:
+        all_instances = swm.instances()
 
     # get a filtered list of instances depending on prefix
     prefixes = []
@@ -138,7 +145,7 @@ def wait(args):
     # answer is a tuple (status, data)
     # where data is a list of tuples: (name, ip, state)
     answer = swm.wait(filtered_instances, state)
-    log.debug('swm.wait() returned: %s' % str(answer))
+    log.debug('swm.wait() returned: %s', answer)
 
     # display results
     (status, data) = answer
@@ -146,7 +153,7 @@ def wait(args):
         if show_ip:
             d_list = [(ip, s) for (name, ip, s) in data]
             d_list.sort()
-            log.debug('state=%s, d_list=%s' % (s, str(d_list)))
+            log.debug('state=%s, d_list=%s', s, d_list)
             for (ip, s) in d_list:
                 if state == s:
                     print('%-17s |%s' % (ip, s))
@@ -155,7 +162,7 @@ def wait(args):
         else:
             d_list = [(name, s) for (name, ip, s) in data]
             d_list.sort()
-            log.debug('state=%s, d_list=%s' % (state, str(d_list)))
+            log.debug('state=%s, d_list=%s', state, d_list)
             for (name, s) in d_list:
                 if state == s:
                     print('%-17s |%s' % (ip, s))
@@ -0,0 +1,163 @@
+"""
+This plugin watches the instances and reports changes as they happen:
+instances launched, going running, terminated, and no longer (or once
+again) accepting SSH connections.
+
+Usage: swarm watch <options>
+
+where <options> is zero or more of:
+    -c   --count     stop after this many polls (default is forever)
+    -h   --help      print this help and stop
+    -i   --ip        show public IP instead of instance name
+    -P   --poll      seconds between polls (default 30)
+    -p   --prefix    name prefix used to select nodes (default is all instances)
+    -V   --version   print version information and stop
+    -v   --verbose   be verbose (cumulative)
+
+Only changes are shown.  Each poll asks AWS for the state of all
+instances in one call; instances are only described in full or probed
+for SSH when their state changes.
+
+As an example, the following will watch all instances whose names start
+with 'test':
+
+    swarm watch -p test
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import swarmcore
+import swarmcore.log
+import swarmcore.fleet as fleet
+
+
+# set up logging
+log = swarmcore.log.Log('swarm.log', swarmcore.log.Log.DEBUG)
+
+# program version
+MajorRelease = 0
+MinorRelease = 1
+VersionString = 'v%d.%d' % (MajorRelease, MinorRelease)
+
+Plugin = {
+          'entry': 'watch',
+          'version': '%s' % VersionString,
+          'command': 'watch',
+         }
+
+# default seconds between polls
+DefaultPoll = 30
+
+# how each event is shown
+EventMessages = {
+                 fleet.Launched: 'launched, state %(state)s',
+                 fleet.Running: 'is running',
+                 fleet.Terminated: 'terminated',
+                 fleet.Unreachable: 'became unreachable',
+                 fleet.Reachable: 'is accepting SSH',
+                 fleet.StateChange: 'state is now %(state)s',
+                }
+
+
+def usage(msg=None):
+    """Print help for the befuddled user."""
+
+    if msg:
+        print('*'*60)
+        print(msg)
+        print('*'*60)
+    print(__doc__)        # module docstring used
+
+def watch(args):
+    """Watch instances, reporting changes.
+
+    args    list of arg values to be parsed
+    """
+
+    # parse the command args
+    parser = argparse.ArgumentParser(prog='swarm watch',
+                                     description='This plugin reports changes to EC2 instances as they happen.')
+    parser.add_argument('-c', '--count', dest='count', action='store',
+                        type=int, help='stop after this many polls',
+                        metavar='<count>')
+    parser.add_argument('-i', '--ip', dest='show_ip', action='store_true',
+                        help='show public IP instead of instance name',
+                        default=False)
+    parser.add_argument('-P', '--poll', dest='poll', action='store',
+                        type=float, help='seconds between polls',
+                        metavar='<seconds>', default=DefaultPoll)
+    parser.add_argument('-p', '--prefix', dest='prefix', action='store',
+                        help='set the prefix for the instance names',
+                        metavar='<prefix>')
+    parser.add_argument('-v', '--verbose', dest='verbose', action='count',
+                        default=0, help='make execution more verbose (cumulative)')
+    parser.add_argument('-V', '--version', action='version', version=VersionString,
+                        help='print the version and stop')
+
+    args = parser.parse_args(args)
+
+    # increase verbosity if required
+    verbose = False
+    for _ in range(args.verbose):
+        log.bump_level()
+        verbose = True
+
+    # set variables to possibly modified defaults
+    count = args.count
+    show_ip = args.show_ip
+    poll = args.poll
+    prefixes = []
+    if args.prefix is not None:
+        prefixes = args.prefix.split(',')
+
+    if poll <= 0:
+        usage('The poll time must be positive')
+        return 1
+
+    def selected(host):
+        """True if the host name matches a prefix (all hosts if none)."""
+
+        if not prefixes:
+            return True
+        return any((host.name or '').startswith(p) for p in prefixes)
+
+    swm = swarmcore.Swarm(verbose=verbose)
+    model = fleet.FleetModel(swm)
+
+    polls = 0
+    try:
+        while True:
+            events = model.poll()
+            polls += 1
+            now = time.strftime('%H:%M:%S')
+
+            if polls == 1:
+                hosts = [h for h in model.hosts.values() if selected(h)]
+                running = [h for h in hosts if h.state == 'running']
+                print("%s watching %d instances named '%s*', %d running, %d accepting SSH"
+                      % (now, len(hosts), '*|'.join(prefixes), len(running),
+                         len([h for h in running if h.reachable])))
+
+            for (event, host) in events:
+                if not selected(host):
+                    continue
+                msg = EventMessages[event] % {'state': host.state}
+                print('%s %-17s %s' % (now, host.label(show_ip), msg))
+                log('watch: %s %s' % (host.instance_id, msg))
+            sys.stdout.flush()
+
+            if count is not None and polls >= count:
+                break
+            time.sleep(poll)
+    except KeyboardInterrupt:
+        pass
+
+    if verbose:
+        log.debug('==============================================================')
+        log.debug('=========================  FINISHED  =========================')
+        log.debug('==============================================================')
+
+    return 0
@@ -1,2 +1,2 @@
-from swarm import Swarm
+from swarm import Swarm, ReplaceError
 del swarm
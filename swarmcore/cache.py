@@ -0,0 +1,145 @@
+"""
+A small persistent cache kept in the swarm cache directory.
+
+Each cache is a JSON file holding a dictionary of key -> (time, value).
+A cache may have a time-to-live, after which entries are treated as
+missing.  The file is read once per process, and rewritten atomically
+whenever an entry changes, starting from the current file contents so
+entries written by other processes are kept.
+"""
+
+import os
+import json
+import time
+import threading
+
+from . import defaults
+
+
+# caches already opened, keyed by path
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+class Cache(object):
+    """A persistent dictionary with optional expiry of entries."""
+
+    def __init__(self, path, ttl=None):
+        """Open a cache file.
+
+        path  path to the cache file
+        ttl   seconds an entry stays valid (None means forever)
+        """
+
+        self.path = path
+        self.ttl = ttl
+        self._data = None
+        self._lock = threading.Lock()
+
+    def _read(self):
+        """Read the cache file, return the data dictionary ({} if none)."""
+
+        try:
+            with open(self.path) as fd:
+                data = json.load(fd)
+        except (IOError, OSError, ValueError):
+            return {}
+        if not isinstance(data, dict):
+            return {}
+
+        return data
+
+    def _write(self):
+        """Write the data dictionary to the cache file atomically."""
+
+        directory = os.path.dirname(self.path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        tmp_path = '%s.%d' % (self.path, os.getpid())
+        with open(tmp_path, 'w') as fd:
+            json.dump(self._data, fd, sort_keys=True)
+        os.rename(tmp_path, self.path)
+
+    def _valid(self, entry, now):
+        """Return True if an entry hasn't expired."""
+
+        return self.ttl is None or now - entry[0] < self.ttl
+
+    def get(self, key, default=None):
+        """Return the value for a key, 'default' if missing or expired."""
+
+        with self._lock:
+            if self._data is None:
+                self._data = self._read()
+            entry = self._data.get(key, None)
+
+        if entry is None or not self._valid(entry, time.time()):
+            return default
+
+        return entry[1]
+
+    def keys(self):
+        """Return a list of the keys that haven't expired."""
+
+        with self._lock:
+            if self._data is None:
+                self._data = self._read()
+            data = dict(self._data)
+
+        now = time.time()
+        return [k for (k, e) in data.items() if self._valid(e, now)]
+
+    def put(self, key, value):
+        """Set the value for a key and save the cache."""
+
+        now = time.time()
+        with self._lock:
+            data = self._read()
+            data[key] = (now, value)
+            self._data = dict((k, e) for (k, e) in data.items()
+                              if self._valid(e, now))
+            self._write()
+
+    def update(self, entries):
+        """Set the values for many keys and save the cache once.
+
+        entries  a dictionary of key -> value
+        """
+
+        now = time.time()
+        with self._lock:
+            data = self._read()
+            for (key, value) in entries.items():
+                data[key] = (now, value)
+            self._data = dict((k, e) for (k, e) in data.items()
+                              if self._valid(e, now))
+            self._write()
+
+    def delete(self, key):
+        """Remove a key, if present, and save the cache."""
+
+        with self._lock:
+            data = self._read()
+            data.pop(key, None)
+            self._data = data
+            self._write()
+
+
+def get_cache(name, ttl=None):
+    """Return the cache with a name, opening it only once per process.
+
+    name  filename of the cache in the swarm cache directory
+    ttl   seconds an entry stays valid (None means forever), replaces any
+          ttl given when the cache was opened before
+    """
+
+    path = os.path.join(defaults.CacheDir, name)
+    with _caches_lock:
+        cache = _caches.get(path, None)
+        if cache is None:
+            cache = Cache(path, ttl)
+            _caches[path] = cache
+        cache.ttl = ttl
+
+    return cache
@@ -0,0 +1,130 @@
+"""
+A local catalog of EC2 instance types.
+
+The catalog maps an instance type name ('t2.micro', ...) to a tuple of
+(vCPUs, memory MiB, network performance).  A catalog file is bundled with
+swarm and may be refreshed from AWS with describe_instance_types(), the
+refreshed copy being kept in the swarm cache directory and used in
+preference to the bundled file.
+
+The catalog file is only read when first needed, and then only once per
+process.  Each line of the file is:
+
+    <type>:<vCPUs>:<memory MiB>:<network performance>
+
+Blank lines and lines starting with '#' are ignored.
+"""
+
+import os
+import threading
+
+from . import defaults
+
+
+# the catalog shipped with swarm
+BundledPath = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           'instance_types')
+
+# a refreshed catalog, used in preference to the bundled one
+LocalPath = os.path.join(defaults.CacheDir, 'instance_types')
+
+# indices into a catalog entry tuple
+VCPUS = 0
+MEMORY = 1
+NETWORK = 2
+
+# the catalog, loaded on first use
+_types = None
+_types_lock = threading.Lock()
+
+
+def _parse(path):
+    """Read a catalog file, return a dictionary of type name -> entry tuple."""
+
+    result = {}
+    with open(path) as fd:
+        for line in fd:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            (name, vcpus, memory, network) = line.split(':', 3)
+            result[name] = (int(vcpus), int(memory), network)
+
+    return result
+
+
+def _write(path, types):
+    """Write a catalog dictionary to a file, replacing it atomically."""
+
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    tmp_path = '%s.%d' % (path, os.getpid())
+    with open(tmp_path, 'w') as fd:
+        fd.write('#\n# EC2 instance type catalog, refreshed from AWS.\n')
+        fd.write('# Each line is:  <type>:<vCPUs>:<memory MiB>:<network performance>\n#\n')
+        for name in sorted(types):
+            (vcpus, memory, network) = types[name]
+            fd.write('%s:%d:%d:%s\n' % (name, vcpus, memory, network))
+    os.rename(tmp_path, path)
+
+
+def types():
+    """Return the catalog dictionary, loading it if necessary."""
+
+    global _types
+
+    with _types_lock:
+        if _types is None:
+            path = LocalPath if os.path.isfile(LocalPath) else BundledPath
+            _types = _parse(path)
+
+    return _types
+
+
+def lookup(name):
+    """Return the catalog entry tuple for a type name, None if unknown."""
+
+    return types().get(name, None)
+
+
+def ncpu(name):
+    """Return the number of vCPUs for a type name, None if unknown."""
+
+    entry = lookup(name)
+    if entry is None:
+        return None
+    return entry[VCPUS]
+
+
+def names():
+    """Return a sorted list of all type names in the catalog."""
+
+    return sorted(types())
+
+
+def refresh(client, path=LocalPath):
+    """Refresh the catalog from AWS and save it locally.
+
+    client  a boto3 EC2 client
+    path    path to the file to save the catalog in
+
+    Returns the number of instance types in the new catalog.
+    """
+
+    global _types
+
+    result = {}
+    paginator = client.get_paginator('describe_instance_types')
+    for page in paginator.paginate():
+        for t in page['InstanceTypes']:
+            result[t['InstanceType']] = (t['VCpuInfo']['DefaultVCpus'],
+                                         t['MemoryInfo']['SizeInMiB'],
+                                         t['NetworkInfo']['NetworkPerformance'])
+
+    _write(path, result)
+    with _types_lock:
+        _types = result
+
+    return len(result)
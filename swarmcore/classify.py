@@ -1,152 +1,280 @@
 """
-A set of classifier functions that take a VM console log
-and try to classify the VM state.
+Classify the state of a VM from its console log.
+
+Classification is driven by a table of rules.  Each rule has a result
+string, a list of patterns at least one of which must appear in the log
+('match') and a list of patterns none of which may appear ('unless').
+Rules are tried in order and the first rule satisfied gives the
+classification.  A rule with no 'match' patterns is satisfied whenever
+none of its 'unless' patterns appear.  If no rule is satisfied the
+classification is 'OK'.
+
+The rule table is compiled once.  Each distinct pattern is tested at most
+once per log, and only if a rule still being considered needs it, so
+rules later than the first satisfied rule cost nothing.  Literal patterns
+are found with a plain substring search, which is much faster in CPython
+than a regular expression scan.
+
+The built-in rules may be replaced by rules read from a config file, see
+load_rules().
+
+A console log holds the output of every boot since the instance was
+created.  last_boot() and boot_segments() split a log into boots.
+"""
 
-All classifiers have the signature:
+import os
+import re
+import threading
+import ConfigParser
 
-    class_????(log)
+from . import defaults
 
-where 'log' is a list of lines from the console log.
 
-The classify() function will try all classifiers in this module.
+# a rules file in this place is used instead of the built-in rules
+RulesPath = os.path.join(defaults.CacheDir, 'classify.rules')
 
-The classifiers will return a string containing the classification
-or None if the log can't be classified.
-"""
+# classification when no rule is satisfied
+DefaultResult = 'OK'
 
+# string in the log when the machine (re)boots
+RestartString = 'Linux version'
 
-def class_no_log(log):
-    """An error classifier.
+# literal strings used in the built-in rules
+ReadOnly = ['Read-only file system', 'Remounting filesystem read-only']
+RunawayLoop = 'request_module: runaway loop'
 
-    log    the console log text
 
-    Return None if not recognized, else the error type string.
-    """
+class Rule(object):
+    """One classification rule."""
 
-    if len(log) == 1 and log[0] == '':
-        return "Can't retrieve log"
-    if len(log) == 1 and log[0] == '?':
-        return "Log was just '?'"
-    return None
+    __slots__ = ('result', 'match', 'unless', 'regex')
 
+    def __init__(self, result, match=None, unless=None, regex=False):
+        """Create a rule.
 
-def class_fsck_manual(log):
-    """An error classifier.
+        result  the classification string if the rule is satisfied
+        match   list of patterns, at least one must be found
+                (an empty list is always satisfied)
+        unless  list of patterns, none may be found
+        regex   True if the patterns are regular expressions, otherwise
+                they are literal strings
+        """
 
-    log    the console log text
+        self.result = result
+        self.match = list(match or [])
+        self.unless = list(unless or [])
+        self.regex = regex
 
-    Return None if not recognized, else the error type string.
-    """
+    def __repr__(self):
+        return ('Rule(%r, match=%r, unless=%r, regex=%s)'
+                % (self.result, self.match, self.unless, self.regex))
 
-    if 'UNEXPECTED INCONSISTENCY; RUN fsck MANUALLY' in log:
-        return 'FSCK_manual'
-    return None
 
+# the built-in rules, in the order they are applied
+Rules = [
+         Rule("Can't retrieve log", [r'\A\Z'], regex=True),
+         Rule("Log was just '?'", [r'\A\?\Z'], regex=True),
+         Rule('FSCK_manual', ['UNEXPECTED INCONSISTENCY; RUN fsck MANUALLY']),
+         Rule('LDAP failure', ['failed to bind to LDAP server']),
+         Rule('ROFS', ReadOnly),
+         Rule('IOERROR', ['ext3_abort called'], ReadOnly),
+         Rule('HUNG, no login prompt', [], [' login: ', RunawayLoop]),
+         Rule('RUNAWAY_LOOP', [RunawayLoop]),
+         Rule('NETWORK_UNREACHABLE', ['Network is unreachable']),
+        ]
 
-def class_ldap(log):
-    """An error classifier.
 
-    log    the console log text
+def _make_test(pattern, regex):
+    """Return a function testing if a pattern is found in a log."""
 
-    Return None if not recognized, else the error type string.
-    """
+    if not regex:
+        return lambda log: pattern in log
 
-    if 'failed to bind to LDAP server' in log:
-        return 'LDAP failure'
-    return None
+    try:
+        compiled = re.compile(pattern)
+    except re.error as e:
+        raise ValueError("Bad classifier pattern '%s': %s" % (pattern, str(e)))
 
+    # a search for a pattern anchored at the start would try every position
+    if pattern.startswith(r'\A'):
+        return lambda log: compiled.match(log) is not None
+    return lambda log: compiled.search(log) is not None
 
-def class_rofs(log):
-    """An error classifier.
 
-    log    the console log text
+class Classifier(object):
+    """Classify console logs with a compiled table of rules."""
 
-    Return None if not recognized, else the error type string.
-    """
+    def __init__(self, rules=Rules):
+        """Compile the rules.
 
-    if ('Read-only file system' in log or
-            'Remounting filesystem read-only' in log):
-        return 'ROFS'
-    return None
+        rules  list of Rule objects, in the order they are applied
 
+        Raises ValueError if a pattern isn't a valid regular expression.
+        """
 
-def class_ioerror(log):
-    """An error classifier.
+        self.rules = rules
 
-    log    the console log text
+        # number each distinct pattern, rules refer to pattern numbers
+        self._tests = []
+        numbers = {}
+        for rule in rules:
+            for p in rule.match + rule.unless:
+                if (p, rule.regex) not in numbers:
+                    numbers[(p, rule.regex)] = len(self._tests)
+                    self._tests.append(_make_test(p, rule.regex))
+        self._table = [(rule.result,
+                        [numbers[(p, rule.regex)] for p in rule.match],
+                        [numbers[(p, rule.regex)] for p in rule.unless])
+                       for rule in rules]
 
-    Return None if not recognized, else the error type string.
-    """
+    def classify(self, log):
+        """Return the classification string for a console log."""
+
+        found = {}          # pattern number -> True if found in log
+
+        def is_found(i):
+            result = found.get(i, None)
+            if result is None:
+                result = found[i] = self._tests[i](log)
+            return result
 
-    if ('ext3_abort called' in log and
-            'Read-only file system' not in log and
-            'Remounting filesystem read-only' not in log):
-        return 'IOERROR'
-    return None
+        for (result, match, unless) in self._table:
+            if match and not any(is_found(i) for i in match):
+                continue
+            if any(is_found(i) for i in unless):
+                continue
+            return result
 
+        return DefaultResult
 
-def class_nologin(log):
-    """An error classifier.
 
-    log    the console log text
+def boot_offsets(log):
+    """Return a list of the offsets in a log where each boot starts.
 
-    Return None if not recognized, else the error type string.
+    Finds every RestartString in one pass.  The list is empty if the log
+    has no boot marker.
     """
-    import tempfile
-    (f, fname) = tempfile.mkstemp(prefix='vm_health_')
-    with open(fname, 'wb') as fd:
-        fd.write(log)
 
-    # if runaway loop, we can't continue
-    if 'request_module: runaway loop' in log:
-        return None
+    result = []
+    index = log.find(RestartString)
+    while index >= 0:
+        result.append(index)
+        index = log.find(RestartString, index + len(RestartString))
 
-    #if '.org.au login: ' not in log:
-    if ' login: ' not in log:
-        return 'HUNG, no login prompt'
+    return result
 
-    return None
 
+def last_boot(log):
+    """Return the part of a log from the start of the latest boot.
 
-def class_runaway_loop(log):
-    """An error classifier.
+    The whole log is returned if it has no boot marker.
+    """
 
-    log    the console log text
+    index = log.rfind(RestartString)
+    if index <= 0:
+        return log
+    return log[index:]
 
-    Return None if not recognized, else the error type string.
+
+def boot_segments(log):
+    """Split a log into a list of boots, oldest first.
+
+    Each boot starts at its RestartString, except that any text before
+    the first boot marker is part of the first boot.
     """
 
-    if 'request_module: runaway loop' in log:
-        return 'RUNAWAY_LOOP'
-    return None
+    offsets = boot_offsets(log)
+    if not offsets:
+        return [log]
+
+    starts = [0] + offsets[1:]
+    ends = offsets[1:] + [len(log)]
+    return [log[start:end] for (start, end) in zip(starts, ends)]
+
+
+def load_rules(path):
+    """Read classification rules from a config file.
+
+    path  path to the rules file
 
+    Each section of the file is one rule, the section name being the
+    classification string.  Rules are applied in file order.  A section
+    may contain:
 
-def class_network_unreachable(log):
-    """An error classifier.
+        match   patterns, one per line, at least one of which must be found
+        unless  patterns, one per line, none of which may be found
+        regex   'yes' if the patterns are regular expressions, otherwise
+                they are literal strings
 
-    log    the console log text
+    Enclose a pattern in double quotes to keep leading or trailing spaces.
+    For example:
 
-    Return None if not recognized, else the error type string.
+        [HUNG, no login prompt]
+        unless = " login: "
+                 request_module: runaway loop
+
+    Returns a list of Rule objects.  Raises ValueError if the file can't
+    be read or is badly formed.
+    """
+
+    parser = ConfigParser.RawConfigParser()
+    try:
+        if not parser.read(path):
+            raise ValueError("Can't read classifier rules file '%s'" % path)
+    except ConfigParser.Error as e:
+        raise ValueError("Bad classifier rules file '%s': %s" % (path, str(e)))
+
+    def patterns(section, option):
+        if not parser.has_option(section, option):
+            return []
+        result = []
+        for p in parser.get(section, option).split('\n'):
+            p = p.strip()
+            if len(p) > 1 and p[0] == p[-1] == '"':
+                p = p[1:-1]
+            if p:
+                result.append(p)
+        return result
+
+    rules = []
+    for section in parser.sections():
+        unknown = set(parser.options(section)) - set(['match', 'unless', 'regex'])
+        if unknown:
+            raise ValueError("Rule '%s' in '%s' has unknown option(s): %s"
+                             % (section, path, ', '.join(sorted(unknown))))
+        regex = (parser.has_option(section, 'regex') and
+                 parser.getboolean(section, 'regex'))
+        rules.append(Rule(section, patterns(section, 'match'),
+                          patterns(section, 'unless'), regex))
+
+    return rules
+
+
+# the classifier used by classify(), built on first use
+_classifier = None
+_classifier_lock = threading.Lock()
+
+
+def get_classifier():
+    """Return the default classifier, building it only once.
+
+    The rules come from the file at RulesPath if it exists, otherwise the
+    built-in rules are used.
     """
 
-    if 'Network is unreachable' in log:
-        return 'NETWORK_UNREACHABLE'
-    return None
+    global _classifier
 
+    with _classifier_lock:
+        if _classifier is None:
+            rules = Rules
+            if os.path.isfile(RulesPath):
+                rules = load_rules(RulesPath)
+            _classifier = Classifier(rules)
+
+    return _classifier
 
-# classifier functions, in the order they are applied
-classifiers = [class_fsck_manual, class_ldap,
-               class_rofs, class_ioerror, class_nologin,
-               class_runaway_loop, class_network_unreachable,
-               class_no_log,
-              ]
 
 def classify(console):
     """Classify the contents of a server console log."""
 
-    # run through all the classifier functions
-    for c in classifiers:
-        result = c(console)
-        if result is not None:
-            return result
-    return 'OK'
+    return get_classifier().classify(console)
@@ -0,0 +1,202 @@
+"""
+Fetch instance console logs, with a local cache.
+
+EC2 only updates the console output of an instance from time to time,
+and says when with a timestamp.  Fetched logs are kept on disk keyed by
+instance ID, along with the log timestamp and the time the instance was
+last checked.  An instance checked less than 'max_age' seconds ago isn't
+asked for its console output again, and a log whose timestamp hasn't
+changed isn't written again.  Each log returned is flagged as changed or
+not, so callers can skip work on logs they have already seen.
+
+Logs for many instances are fetched concurrently, every AWS call going
+through a rate limiter shared with the rest of swarm.
+"""
+
+import os
+import time
+import threading
+import Queue
+
+import botocore.exceptions
+
+from . import cache
+from . import defaults
+
+
+# directory holding cached console logs, one file per instance
+LogDir = os.path.join(defaults.CacheDir, 'console')
+
+# seconds before a cached log is checked with AWS again
+MaxAge = 5 * 60
+
+# number of concurrent fetches
+DefaultThreads = 10
+
+# retries of throttled AWS calls, and the base delay (seconds)
+Retries = 4
+RetryDelay = 1.0
+
+# AWS error codes that mean 'slow down'
+ThrottleErrors = ('Throttling', 'RequestLimitExceeded')
+
+
+class ConsoleLog(object):
+    """The console log of one instance.
+
+    instance_id  the AWS instance ID
+    timestamp    string time the log was last updated by AWS
+    output       the log text (unicode, '' if no output)
+    changed      True if the log differs from the cached copy
+    error        error string if the log couldn't be fetched, else None
+    """
+
+    __slots__ = ('instance_id', 'timestamp', 'output', 'changed', 'error')
+
+    def __init__(self, instance_id, timestamp=None, output=u'', changed=False,
+                 error=None):
+        self.instance_id = instance_id
+        self.timestamp = timestamp
+        self.output = output
+        self.changed = changed
+        self.error = error
+
+    def __repr__(self):
+        return ('ConsoleLog(%s, timestamp=%s, changed=%s, error=%s)'
+                % (self.instance_id, self.timestamp, self.changed, self.error))
+
+
+class ConsoleLogs(object):
+    """A cached source of instance console logs."""
+
+    def __init__(self, client, limiter, max_age=MaxAge, threads=DefaultThreads):
+        """Create the console log source.
+
+        client   a boto3 EC2 client
+        limiter  a utils.RateLimiter for AWS calls
+        max_age  seconds before a cached log is checked with AWS again
+        threads  number of concurrent fetches
+        """
+
+        self.client = client
+        self.limiter = limiter
+        self.max_age = max_age
+        self.threads = threads
+        self.index = cache.get_cache('console.index')
+
+    def get(self, instance_id):
+        """Return the ConsoleLog for one instance."""
+
+        return self.fetch([instance_id])[instance_id]
+
+    def fetch(self, instance_ids, threads=None):
+        """Get console logs for many instances concurrently.
+
+        instance_ids  a list of AWS instance IDs
+        threads       number of concurrent fetches (default self.threads)
+
+        Returns a dictionary of instance ID -> ConsoleLog.
+        """
+
+        if threads is None:
+            threads = self.threads
+
+        input_q = Queue.Queue()
+        for instance_id in instance_ids:
+            input_q.put(instance_id)
+
+        result = {}
+        checked = {}            # instance ID -> new index entry
+        lock = threading.Lock()
+
+        def worker():
+            while True:
+                try:
+                    instance_id = input_q.get_nowait()
+                except Queue.Empty:
+                    return
+                (console, entry) = self._fetch_one(instance_id)
+                with lock:
+                    result[instance_id] = console
+                    if entry is not None:
+                        checked[instance_id] = entry
+
+        workers = [threading.Thread(target=worker)
+                   for _ in range(min(threads, len(instance_ids)))]
+        for w in workers:
+            w.daemon = True
+            w.start()
+        for w in workers:
+            w.join()
+
+        if checked:
+            self.index.update(checked)
+
+        return result
+
+    def _fetch_one(self, instance_id):
+        """Get the console log for one instance.
+
+        Returns a tuple (ConsoleLog, entry) where 'entry' is the new index
+        entry for the instance, or None if the index needn't change.
+        """
+
+        path = os.path.join(LogDir, instance_id)
+        entry = self.index.get(instance_id)
+
+        # recently checked, use the cached log
+        if entry and time.time() - entry['checked'] < self.max_age:
+            output = self._read(path)
+            if output is not None:
+                return (ConsoleLog(instance_id, entry['timestamp'], output), None)
+
+        for attempt in range(Retries + 1):
+            self.limiter.wait()
+            try:
+                response = self.client.get_console_output(InstanceId=instance_id)
+                break
+            except botocore.exceptions.ClientError as e:
+                code = e.response.get('Error', {}).get('Code', None)
+                if code in ThrottleErrors and attempt < Retries:
+                    time.sleep(RetryDelay * 2**attempt)
+                    continue
+                return (ConsoleLog(instance_id, error=str(e)), None)
+            except botocore.exceptions.BotoCoreError as e:
+                return (ConsoleLog(instance_id, error=str(e)), None)
+
+        timestamp = str(response.get('Timestamp', ''))
+        output = response.get('Output', None) or u''
+        if isinstance(output, str):
+            output = output.decode('utf-8', 'replace')
+        new_entry = {'timestamp': timestamp, 'checked': time.time()}
+
+        if entry and entry['timestamp'] == timestamp and os.path.isfile(path):
+            return (ConsoleLog(instance_id, timestamp, output), new_entry)
+
+        self._write(path, output)
+        return (ConsoleLog(instance_id, timestamp, output, changed=True), new_entry)
+
+    @staticmethod
+    def _read(path):
+        """Read a cached log, return None if it can't be read."""
+
+        try:
+            with open(path, 'rb') as fd:
+                return fd.read().decode('utf-8', 'replace')
+        except (IOError, OSError):
+            return None
+
+    @staticmethod
+    def _write(path, output):
+        """Write a cached log atomically."""
+
+        if not os.path.isdir(LogDir):
+            try:
+                os.makedirs(LogDir)
+            except OSError:
+                pass            # another thread made it
+
+        tmp_path = '%s.%d.%d' % (path, os.getpid(), threading.current_thread().ident)
+        with open(tmp_path, 'wb') as fd:
+            fd.write(output.encode('utf-8'))
+        os.rename(tmp_path, path)
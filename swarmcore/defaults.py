@@ -5,6 +5,7 @@
 import os
 
 AuthPath = os.path.expanduser('~/.ssh')
+CacheDir = os.path.expanduser('~/.swarm')
 Region = 'ap-southeast-2'
 Zone = 'ap-southeast-2a'
 Flavour = 't2.micro'
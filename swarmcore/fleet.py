@@ -0,0 +1,212 @@
+"""
+An in-memory model of the instances in a region, updated incrementally.
+
+Each poll makes one paginated describe_instance_status() call, which
+returns just the state and status checks of every instance.  Only
+instances that are new or whose state or status checks changed are then
+described in full (to get the name and IP), and those instances are
+probed for SSH at once.  Other running instances are probed on a
+schedule: reachable ones every ReprobePolls polls, so a host that stops
+answering SSH while AWS still passes its status checks is noticed, and
+unreachable ones after a delay doubling with each failed probe, up to
+MaxProbeBackoff polls.  So the cost of a poll beyond the status call
+depends mostly on how much the fleet has changed, not on its size.
+
+Each poll returns a list of events describing the changes seen.
+"""
+
+# events returned by FleetModel.poll()
+Launched = 'launched'
+Running = 'running'
+Terminated = 'terminated'
+Unreachable = 'unreachable'
+Reachable = 'reachable'
+StateChange = 'state'
+
+# number of instance IDs per describe_instances() call
+DescribeChunk = 100
+
+# polls between SSH probes of a reachable host, and the most polls
+# between probes of a host that keeps failing them
+ReprobePolls = 5
+MaxProbeBackoff = 16
+
+
+class HostState(object):
+    """What is known about one instance.
+
+    instance_id  the AWS instance ID
+    name         the instance 'Name' tag (None if not named)
+    ip           the public IP address (None if none)
+    state        the instance state name, eg, 'running'
+    status       tuple of the (instance, system) status check results
+    reachable    True if SSH connects, False if not, None if not known
+    failures     number of SSH probes failed in a row
+    next_probe   number of the poll at which SSH is next probed
+    """
+
+    __slots__ = ('instance_id', 'name', 'ip', 'state', 'status', 'reachable',
+                 'failures', 'next_probe')
+
+    def __init__(self, instance_id):
+        self.instance_id = instance_id
+        self.name = None
+        self.ip = None
+        self.state = None
+        self.status = None
+        self.reachable = None
+        self.failures = 0
+        self.next_probe = 0
+
+    def label(self, show_ip=False):
+        """Return a display label: the name, or IP or ID if required."""
+
+        if show_ip or not self.name:
+            return self.ip or self.instance_id
+        return self.name
+
+    def __repr__(self):
+        return ('HostState(%s, name=%s, ip=%s, state=%s, reachable=%s)'
+                % (self.instance_id, self.name, self.ip, self.state,
+                   str(self.reachable)))
+
+
+class FleetModel(object):
+    """Track the instances of a Swarm, reporting only what changes."""
+
+    def __init__(self, swm):
+        """Create an empty model.
+
+        swm  the Swarm object used to talk to AWS
+        """
+
+        self.swm = swm
+        self.hosts = {}         # instance ID -> HostState
+        self.polls = 0
+
+    def poll(self):
+        """Update the model, return a list of (event, HostState) tuples.
+
+        The first poll only fills the model and returns no events.
+        """
+
+        statuses = self._describe_status()
+        events = []
+
+        # instances AWS no longer reports have gone
+        for instance_id in set(self.hosts) - set(statuses):
+            host = self.hosts.pop(instance_id)
+            if host.state != 'terminated':
+                events.append((Terminated, host))
+
+        changed = [instance_id for (instance_id, status) in statuses.items()
+                   if instance_id not in self.hosts or
+                   (self.hosts[instance_id].state,
+                    self.hosts[instance_id].status) != status]
+        details = self._describe(changed)
+
+        probe = []
+        for instance_id in changed:
+            (state, status) = statuses[instance_id]
+            host = self.hosts.get(instance_id, None)
+            if host is None:
+                host = self.hosts[instance_id] = HostState(instance_id)
+                events.append((Launched, host))
+            (host.name, host.ip) = details.get(instance_id, (host.name, host.ip))
+
+            if host.state is not None and state != host.state:
+                if state in (Running, Terminated):
+                    events.append((state, host))
+                else:
+                    events.append((StateChange, host))
+            (host.state, host.status) = (state, status)
+
+            if state == 'running':
+                probe.append(host)
+            else:
+                host.reachable = None
+                host.failures = 0
+
+        # other running instances are probed when their turn comes
+        changed = set(changed)
+        probe.extend(h for h in self.hosts.values()
+                     if h.state == 'running' and h.instance_id not in changed
+                        and h.next_probe <= self.polls)
+        events.extend(self._probe(probe))
+
+        self.polls += 1
+        if self.polls == 1:
+            return []
+        return events
+
+    def _probe(self, hosts):
+        """Probe SSH on hosts, update them, return reachability events."""
+
+        hosts = [h for h in hosts if h.ip]
+        if not hosts:
+            return []
+        reachable = self.swm.probe_ssh([h.ip for h in hosts])
+
+        events = []
+        for host in hosts:
+            ok = reachable.get(host.ip, False)
+            if ok and not host.reachable:
+                events.append((Reachable, host))
+            elif not ok and host.reachable:
+                events.append((Unreachable, host))
+            # a host never reachable since it went running isn't reported
+            # as unreachable, it just hasn't finished booting
+            host.reachable = ok or (None if host.reachable is None else False)
+
+            # schedule the next probe, backing off while probes fail
+            if ok:
+                host.failures = 0
+                host.next_probe = self.polls + ReprobePolls
+            else:
+                host.failures += 1
+                host.next_probe = self.polls + min(2**(host.failures - 1),
+                                                   MaxProbeBackoff)
+
+        return events
+
+    def _describe_status(self):
+        """Return a dictionary of instance ID -> (state, status)."""
+
+        result = {}
+        paginator = self.swm.client.get_paginator('describe_instance_status')
+        pages = iter(paginator.paginate(IncludeAllInstances=True))
+        while True:
+            self.swm.api_limiter.wait()
+            try:
+                page = next(pages)
+            except StopIteration:
+                break
+            for s in page['InstanceStatuses']:
+                status = (s.get('InstanceStatus', {}).get('Status', None),
+                          s.get('SystemStatus', {}).get('Status', None))
+                result[s['InstanceId']] = (s['InstanceState']['Name'], status)
+
+        return result
+
+    def _describe(self, instance_ids):
+        """Return a dictionary of instance ID -> (name, IP).
+
+        Instances are described with an 'instance-id' filter so that
+        instances that have vanished are simply missing from the result.
+        """
+
+        result = {}
+        for start in range(0, len(instance_ids), DescribeChunk):
+            chunk = instance_ids[start:start+DescribeChunk]
+            self.swm.api_limiter.wait()
+            data = self.swm.client.describe_instances(
+                       Filters=[{'Name': 'instance-id', 'Values': chunk}])
+            for reservation in data['Reservations']:
+                for i in reservation['Instances']:
+                    name = None
+                    for t in i.get('Tags', []):
+                        if t.get('Key', None) == 'Name':
+                            name = t['Value']
+                    result[i['InstanceId']] = (name, i.get('PublicIpAddress', None))
+
+        return result
@@ -0,0 +1,149 @@
+"""
+An index of the SSH keys available to swarm.
+
+The key directory is scanned once per process, when a key is first
+looked up, and the result is kept in a dictionary mapping key names to
+key files, so finding the key file for an instance's key pair name
+doesn't touch the filesystem.  Keys loaded into a running ssh-agent can
+optionally be used for key pairs that have no key file.
+"""
+
+import os
+import threading
+import subprocess
+
+
+# command to list the public keys held by ssh-agent
+AgentListCmd = ['ssh-add', '-L']
+
+# registries already built, keyed by (directory, use_agent)
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+class KeyRegistry(object):
+    """Map key pair names to SSH private key files.
+
+    A key pair name 'xyzzy' matches a file 'xyzzy' or 'xyzzy.<ext>' in the
+    key directory.  An exact filename match is preferred, and public key
+    files ('*.pub') are never matched.  If 'use_agent' is True the comments
+    of keys held by ssh-agent are also indexed the same way.
+    """
+
+    def __init__(self, ssh_dir, use_agent=True):
+        """Create the registry, scanned on first use.
+
+        ssh_dir    path to the directory holding key files
+        use_agent  if True, also index keys held by ssh-agent
+        """
+
+        self.ssh_dir = ssh_dir
+        self.use_agent = use_agent
+        self.files = None       # key name -> key file path
+        self.agent = None       # key names held by ssh-agent
+        self._lock = threading.Lock()
+
+    def _scan(self):
+        """Scan the key directory and, optionally, ssh-agent, once.
+
+        A missing key directory holds no key files.
+        """
+
+        with self._lock:
+            if self.files is not None:
+                return
+
+            try:
+                names = sorted(os.listdir(self.ssh_dir))
+            except OSError:
+                names = []
+
+            files = {}
+            stems = {}
+            for f in names:
+                path = os.path.join(self.ssh_dir, f)
+                if not os.path.isfile(path) or f.endswith('.pub'):
+                    continue
+                files[f] = path
+                (stem, _) = os.path.splitext(f)
+                stems.setdefault(stem, path)
+            for (stem, path) in stems.items():
+                files.setdefault(stem, path)
+
+            self.agent = self._agent_keys() if self.use_agent else set()
+            self.files = files
+
+    def lookup(self, key):
+        """Find the key file for a key pair name.
+
+        Returns the path to the key file, or None if the key is only held
+        by ssh-agent.  Raises KeyError if the key can't be found at all.
+        """
+
+        self._scan()
+        path = self.files.get(key, None)
+        if path is None and key not in self.agent:
+            raise KeyError("Can't find key file matching '%s' in %s"
+                           % (key, self.ssh_dir))
+
+        return path
+
+    def check(self, keys):
+        """Check that all the given key pair names can be found.
+
+        keys  an iterable of key pair names
+
+        Raises KeyError naming all the missing keys.
+        """
+
+        self._scan()
+        missing = sorted(set(k for k in keys
+                             if k not in self.files and k not in self.agent))
+        if missing:
+            raise KeyError("Can't find key files matching %s in %s"
+                           % (', '.join("'%s'" % k for k in missing),
+                              self.ssh_dir))
+
+    @staticmethod
+    def _agent_keys():
+        """Return the set of key names held by a running ssh-agent.
+
+        The name of an agent key is the basename of its comment, usually
+        the path it was loaded from, with and without any extension.
+        """
+
+        if not os.environ.get('SSH_AUTH_SOCK', None):
+            return set()
+
+        try:
+            proc = subprocess.Popen(AgentListCmd, stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE)
+            output = proc.communicate()[0]
+        except OSError:
+            return set()
+        if proc.returncode != 0:
+            return set()
+
+        result = set()
+        for line in output.splitlines():
+            fields = line.split(None, 2)
+            if len(fields) < 3:
+                continue
+            name = os.path.basename(fields[2].strip())
+            result.add(name)
+            result.add(os.path.splitext(name)[0])
+
+        return result
+
+
+def get_registry(ssh_dir, use_agent=True):
+    """Return the key registry for a directory, building it only once."""
+
+    cache_key = (os.path.abspath(ssh_dir), use_agent)
+    with _registries_lock:
+        registry = _registries.get(cache_key, None)
+        if registry is None:
+            registry = KeyRegistry(ssh_dir, use_agent)
+            _registries[cache_key] = registry
+
+    return registry
@@ -2,18 +2,57 @@
 A simple logger.
 
 Based on the 'borg' recipe from [http://code.activestate.com/recipes/66531/].
+
+The caller of each log call is found by walking back from the current
+frame, and the module name for each code object is worked out once and
+cached.  Lines are appended to a queue and written by one background
+thread, which writes and flushes everything waiting in one go, so logging
+threads never wait on the disk and lines from different threads never
+mix.  The writer wakes every FlushInterval seconds, or at once for ERROR
+and CRITICAL lines.  The queue is flushed at exit, or by calling flush().
+
+The level methods (debug(), info(), ...) take a format string and args,
+which are only formatted if the line will be logged, long args being
+truncated.  Use is_enabled() to guard building anything expensive.
 """
 
 import os
-import shutil
+import sys
 import time
+import atexit
 import datetime
-import traceback
+import threading
+import collections
 
 
 # default maximum length of filename
 MaxNameLength = 15
 
+# name of this module, frames in it are skipped looking for the caller
+try:
+    (_, _module_name) = __name__.rsplit('.', 1)
+except ValueError:
+    _module_name = __name__
+
+# seconds between writes by the writer thread
+FlushInterval = 0.2
+
+# seconds flush() waits for queued lines to be written
+FlushTimeout = 5.0
+
+# longest string logged for one argument of a lazily formatted message
+MaxArgLength = 2000
+
+# environment variable that, if set, names a log file always appended to,
+# used by detached swarm processes so they don't truncate the caller's log
+LogFileEnv = 'SWARM_LOG_FILE'
+
+# code object -> module name ('' for code in this module)
+_callers = {}
+
+# protects configuring the shared state
+_config_lock = threading.Lock()
+
 
 ################################################################################
 # A simple logger.
@@ -24,6 +63,7 @@ MaxNameLength = 15
 #     log('A line in the log at the default level (DEBUG)')
 #     log('A log line at WARN level', Log.WARN)
 #     log.debug('log line issued at DEBUG level')
+#     log.debug('result=%s', result)   # formatted only if logged
 # 
 # Log levels styled on the Python 'logging' module.
 ################################################################################
@@ -60,12 +100,26 @@ class Log(object):
         # make sure we have same state as all other log objects
         self.__dict__ = Log.__shared_state
 
-        # don't allow logfile to change after initially set
-        if hasattr(self, 'logfile'):
-            #self.critical('Ignore attempt to reconfigure logging')
-            return
+        with _config_lock:
+            # don't allow logfile to change after initially set
+            if hasattr(self, 'logfile'):
+                #self.critical('Ignore attempt to reconfigure logging')
+                return
+
+            self._configure(logfile, level, append, name_length)
+
+        self.critical('='*65)
+        self.critical('Log started on %s, log level=%s'
+                      % (datetime.datetime.now().ctime(), self.level2string()))
+        self.critical('-'*65)
+
+    def _configure(self, logfile, level, append, name_length):
+        """Open the log file and start the writer thread."""
 
         # OK, configure logging
+        if os.environ.get(LogFileEnv, None):
+            logfile = os.environ[LogFileEnv]
+            append = True
         if logfile is None:
             logfile = '%s.log' % __name__
 
@@ -100,12 +154,80 @@ class Log(object):
                     break
             level = new_level
         self.level = level
+        self.level_strings = {}         # level -> padded level string
         self.name_length = name_length
 
-        self.critical('='*65)
-        self.critical('Log started on %s, log level=%s'
-                      % (datetime.datetime.now().ctime(), self.level2string()))
-        self.critical('-'*65)
+        # lines are written by a background thread
+        self.lines = collections.deque()
+        self.wake = threading.Event()
+        self.writing = False
+        self.writer = threading.Thread(target=self._write_lines,
+                                       name='log-writer')
+        self.writer.daemon = True
+        self.writer.start()
+        atexit.register(self.flush)
+
+    def _write_lines(self):
+        """Write queued lines forever, flushing after each batch."""
+
+        while True:
+            self.wake.wait(FlushInterval)
+            self.wake.clear()
+            self.writing = True
+            batch = []
+            try:
+                while True:
+                    batch.append(self.lines.popleft())
+            except IndexError:
+                pass
+            if batch:
+                try:
+                    self.logfd.write(''.join(batch))
+                except (IOError, ValueError):
+                    # write line by line, losing only lines that fail
+                    for line in batch:
+                        try:
+                            self.logfd.write(line)
+                        except (IOError, ValueError):
+                            pass
+                try:
+                    self.logfd.flush()
+                except (IOError, ValueError):
+                    pass        # nowhere left to log to
+            self.writing = False
+
+    def flush(self):
+        """Wait until all lines logged so far are written.
+
+        Gives up after FlushTimeout seconds, or at once if the writer
+        thread has died.
+        """
+
+        deadline = time.time() + FlushTimeout
+        while self.lines or self.writing:
+            if not self.writer.is_alive() or time.time() > deadline:
+                break
+            self.wake.set()
+            time.sleep(0.01)
+
+    @staticmethod
+    def _caller():
+        """Return (module name, line number) of the code calling the logger."""
+
+        frame = sys._getframe(2)
+        while frame is not None:
+            code = frame.f_code
+            name = _callers.get(code, None)
+            if name is None:
+                name = os.path.basename(code.co_filename).rsplit('.', 1)[0]
+                if name == _module_name:
+                    name = ''
+                _callers[code] = name
+            if name:
+                return (name, frame.f_lineno)
+            frame = frame.f_back
+
+        return ('?', 0)
 
     def __call__(self, msg=None, level=None):
         """Call on the logging object.
@@ -118,67 +240,94 @@ class Log(object):
         if level is None:
             level = self.level
 
+        self._log(level, msg, ())
+
+    def _log(self, level, msg, args):
+        """Log a message, formatting it with any args only if logged."""
+
         # are we going to log?
         if level < self.level:
             return
 
         if msg is None:         # if user just wants a blank line
             msg = ''
+        elif args:
+            msg = self._format(msg, args)
 
         # get time
         to = datetime.datetime.now()
-        hr = to.hour
-        min = to.minute
-        sec = to.second
-        msec = to.microsecond
-
-        # caller information - look back for first module != <this module name>
-        frames = traceback.extract_stack()
-        frames.reverse()
-        try:
-            (_, mod_name) = __name__.rsplit('.', 1)
-        except ValueError:
-            mod_name = __name__
-        for (fpath, lnum, mname, _) in frames:
-            fname = os.path.basename(fpath).rsplit('.', 1)
-            if len(fname) > 1:
-                fname = fname[0]
-            if fname != mod_name:
-                break
+
+        # caller information - first module != <this module name>
+        (fname, lnum) = self._caller()
 
         # get string for log level
-        loglevel = (self.level2string() + '       ')[:8]
+        loglevel = self.level_strings.get(self.level, None)
+        if loglevel is None:
+            loglevel = self.level_strings[self.level] = (self.level2string() + '       ')[:8]
 
         fname = fname[:self.name_length]
-        self.logfd.write('%02d:%02d:%02d.%06d|%8s|%*s:%-4d|%s\n'
-                         % (hr, min, sec, msec, loglevel, self.name_length,
-                            fname, lnum, msg))
-        self.logfd.flush()
+        line = ('%02d:%02d:%02d.%06d|%8s|%*s:%-4d|%s\n'
+                % (to.hour, to.minute, to.second, to.microsecond,
+                   loglevel, self.name_length, fname, lnum, msg))
+        if isinstance(line, unicode):
+            # queue bytes only, so a batch of lines can always be joined
+            line = line.encode('utf-8', 'replace')
+        self.lines.append(line)
+        if level >= Log.ERROR:
+            self.wake.set()
+
+    @staticmethod
+    def _format(fmt, args):
+        """Return 'fmt % args', each non-numeric arg truncated.
+
+        Each arg that isn't a number is converted to a string and cut to
+        MaxArgLength characters.  A bad format doesn't raise, the format
+        and args are logged instead.
+        """
+
+        short = []
+        for arg in args:
+            if not isinstance(arg, (int, long, float)):
+                if not isinstance(arg, basestring):
+                    arg = str(arg)
+                if len(arg) > MaxArgLength:
+                    arg = '%s...(%d more)' % (arg[:MaxArgLength], len(arg) - MaxArgLength)
+            short.append(arg)
+
+        try:
+            return fmt % tuple(short)
+        except (TypeError, ValueError):
+            return '%s %% %s' % (fmt, str(tuple(short)))
+
+    def is_enabled(self, level):
+        """Return True if a message at 'level' would be logged."""
+
+        return level >= self.level
 
-    def critical(self, msg):
-        """Log a message at CRITICAL level."""
+    def critical(self, msg, *args):
+        """Log a message at CRITICAL level, formatted with any args."""
 
-        self(msg, Log.CRITICAL)
+        self._log(Log.CRITICAL, msg, args)
 
-    def error(self, msg):
-        """Log a message at ERROR level."""
+    def error(self, msg, *args):
+        """Log a message at ERROR level, formatted with any args."""
 
-        self(msg, Log.ERROR)
+        self._log(Log.ERROR, msg, args)
 
-    def warn(self, msg):
-        """Log a message at WARN level."""
+    def warn(self, msg, *args):
+        """Log a message at WARN level, formatted with any args."""
 
-        self(msg, Log.WARN)
+        self._log(Log.WARN, msg, args)
 
-    def info(self, msg):
-        """Log a message at INFO level."""
+    def info(self, msg, *args):
+        """Log a message at INFO level, formatted with any args."""
 
-        self(msg, Log.INFO)
+        self._log(Log.INFO, msg, args)
 
-    def debug(self, msg):
-        """Log a message at DEBUG level."""
+    def debug(self, msg, *args):
+        """Log a message at DEBUG level, formatted with any args."""
 
-        self(msg, Log.DEBUG)
+        self._log(Log.DEBUG, msg, args)
 
 #    def __del__(self):
 #        self.logfd.close()
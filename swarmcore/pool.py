@@ -0,0 +1,349 @@
+"""
+Warm pools of pre-provisioned, stopped instances.
+
+A pool is a named launch configuration (image, flavour, key, security
+groups, zone, userdata and an optional provisioning script) and a size.
+Filling a pool launches instances with that configuration, tagged with
+the pool name, waits until they accept SSH, runs the provisioning script
+and then stops them.  Claiming instances from a pool removes the pool
+tag, renames them with the normal {number} name allocator and starts them
+with one AWS call, which is much quicker than booting and provisioning
+new instances.
+
+Pool definitions are kept in the swarm cache directory.  Only one process
+at a time fills a given pool, so a background replenish started while
+another is still running does nothing.  Claims from a pool are serialised
+by a separate lock, so they never wait for a fill.
+"""
+
+import os
+import sys
+import fcntl
+import subprocess
+
+from . import cache
+from . import defaults
+from . import log
+
+
+# tag holding the pool name on pool instances
+PoolTag = 'swarm:pool'
+
+# name of the cache holding pool definitions
+DefinitionCache = 'pools'
+
+# name given to pool instances, '%s' is the pool name
+PoolName = '%s.pool{number}'
+
+# the swarm harness, run to replenish a pool in the background
+Harness = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                       'swarm')
+
+# log file of a background replenish, in the cache directory, '%s' is
+# the pool name
+ReplenishLog = 'pool.%s.log'
+
+# fields in a pool definition, and their defaults
+Fields = {
+          'image': None,
+          'flavour': defaults.Flavour,
+          'key': defaults.Key,
+          'secgroup': defaults.Secgroup.split(','),
+          'zone': defaults.Zone,
+          'userdata': None,         # path to a userdata file
+          'script': None,           # path to a provisioning script
+          'size': 0,
+         }
+
+# fields holding paths to local files
+PathFields = ('userdata', 'script')
+
+# instance states counted as pool members
+MemberStates = ('pending', 'running', 'stopping', 'stopped')
+
+
+def definitions():
+    """Return a dictionary of pool name -> definition dictionary."""
+
+    defs = cache.get_cache(DefinitionCache)
+    return dict((name, defs.get(name)) for name in defs.keys())
+
+def get_definition(name):
+    """Return the definition of a pool, None if not defined."""
+
+    return cache.get_cache(DefinitionCache).get(name)
+
+def define(name, **kwargs):
+    """Create or update a pool definition, return the new definition.
+
+    name     the pool name
+    kwargs   any of the definition fields, values of None are ignored
+
+    Fields not given keep any previous value, or take their default.
+    The userdata and script paths are stored as absolute paths, so the
+    pool can be filled from any directory, and must be existing files.
+    """
+
+    unknown = set(kwargs) - set(Fields)
+    if unknown:
+        raise ValueError("Unknown pool fields: %s" % ', '.join(sorted(unknown)))
+
+    definition = dict(Fields)
+    definition.update(get_definition(name) or {})
+    for (field, value) in kwargs.items():
+        if value is None:
+            continue
+        if field in PathFields:
+            value = os.path.abspath(os.path.expanduser(value))
+            if not os.path.isfile(value):
+                raise ValueError("Pool %s file '%s' doesn't exist" % (field, value))
+        definition[field] = value
+
+    if int(definition['size']) < 0:
+        raise ValueError("Pool size must be a non-negative integer")
+
+    cache.get_cache(DefinitionCache).put(name, definition)
+    return definition
+
+def undefine(name):
+    """Remove a pool definition."""
+
+    cache.get_cache(DefinitionCache).delete(name)
+
+def replenish_background(name):
+    """Start 'swarm pool replenish <name>' as a detached process.
+
+    The process appends to its own log file in the swarm cache directory
+    rather than writing a 'swarm.log' in the swarm install directory.
+    Returns the process ID.
+    """
+
+    if not os.path.isdir(defaults.CacheDir):
+        try:
+            os.makedirs(defaults.CacheDir)
+        except OSError:
+            pass            # another process made it
+
+    env = dict(os.environ)
+    env[log.LogFileEnv] = os.path.join(defaults.CacheDir, ReplenishLog % name)
+    with open(os.devnull, 'r+b') as devnull:
+        process = subprocess.Popen([sys.executable, Harness, 'pool',
+                                    'replenish', name],
+                                   cwd=os.path.dirname(Harness), env=env,
+                                   stdin=devnull, stdout=devnull,
+                                   stderr=devnull, close_fds=True,
+                                   preexec_fn=os.setsid)
+    return process.pid
+
+
+class WarmPool(object):
+    """A pool of stopped instances waiting to be claimed."""
+
+    def __init__(self, swm, name):
+        """Open a defined pool.
+
+        swm   the Swarm object used to talk to AWS
+        name  the pool name
+
+        Raises ValueError if the pool isn't defined.
+        """
+
+        definition = get_definition(name)
+        if definition is None:
+            raise ValueError("Pool '%s' isn't defined" % name)
+
+        self.swm = swm
+        self.name = name
+        self.definition = definition
+
+    def members(self):
+        """Return a dictionary of state -> list of pool instances."""
+
+        filters = [{'Name': 'tag:%s' % PoolTag, 'Values': [self.name]},
+                   {'Name': 'instance-state-name', 'Values': list(MemberStates)}]
+        self.swm.api_limiter.wait()
+        result = {}
+        for instance in sorted(self.swm.ec2.instances.filter(Filters=filters)):
+            result.setdefault(instance.state['Name'], []).append(instance)
+        return result
+
+    def status(self):
+        """Return a dictionary of state -> number of pool instances."""
+
+        return dict((state, len(instances))
+                    for (state, instances) in self.members().items())
+
+    def fill(self, timeout=None):
+        """Launch, provision and stop instances until the pool is full.
+
+        timeout  seconds to wait for new instances to accept SSH
+
+        Does nothing if another process is filling the pool.  Instances
+        that don't accept SSH in time or fail provisioning are terminated.  Returns the number of
+        instances added to the pool.
+        """
+
+        lock_fd = self._lock()
+        if lock_fd is None:
+            self.swm.log("pool %s: already being filled" % self.name)
+            return 0
+
+        try:
+            return self._fill(timeout)
+        finally:
+            os.close(lock_fd)
+
+    def _fill(self, timeout):
+        """Fill the pool, the caller holding the pool lock."""
+
+        d = self.definition
+        members = self.members()
+        have = sum(len(instances) for instances in members.values())
+        need = int(d['size']) - have
+        self.swm.log('pool %s: size=%s, have=%d, need=%d'
+                     % (self.name, d['size'], have, need))
+
+        # instances left running by an interrupted fill are stopped too
+        new = members.get('running', [])
+        if need > 0:
+            userdata = None
+            if d['userdata']:
+                with open(d['userdata'], 'rb') as fd:
+                    userdata = fd.read()
+            image = self.swm.ensure_image_id(d['image'] or self.swm.DefaultImage)
+            names = self.swm.allocate_names(need, PoolName % self.name)
+            pending = self.swm._launch(names, image=image, zone=d['zone'],
+                                       flavour=d['flavour'], key=d['key'],
+                                       secgroup=d['secgroup'],
+                                       userdata=userdata,
+                                       tags={PoolTag: self.name})
+            new.extend(self.swm._wait_launched(pending))
+
+        if not new:
+            return 0
+
+        timeout = timeout or self.swm.StartTimeout
+        unreachable = self.swm.wait_ssh_ready(new, timeout)
+        if unreachable:
+            self.swm.log.warn('pool %s: %d instances not accepting SSH, '
+                              'terminating', self.name, len(unreachable))
+            self.swm.terminate(unreachable)
+            new = [i for i in new if i not in unreachable]
+        failed = []
+        if new and d['script']:
+            results = self.swm.run_script(new, d['script'])
+            failed_ids = set(r.instance_id for r in results if r.status != 0)
+            failed = [i for i in new if i.instance_id in failed_ids]
+            new = [i for i in new if i.instance_id not in failed_ids]
+        if failed:
+            self.swm.log.warn('pool %s: %d instances failed provisioning, '
+                              'terminating', self.name, len(failed))
+            self.swm.terminate(failed)
+
+        if not new:
+            return 0
+        self.swm.pause(new, wait=True)
+        self.swm.log('pool %s: added %d instances' % (self.name, len(new)))
+        return len(new)
+
+    def claim(self, num, name):
+        """Start up to 'num' pool instances, renamed from 'name'.
+
+        num   number of instances wanted
+        name  name of the instances, may contain {number} formatting
+
+        Returns a list of the claimed instances, running, which may be
+        fewer than 'num' if the pool doesn't have enough stopped instances.
+        Instances are picked and untagged under the pool claim lock, so
+        concurrent claims never get the same instances.  Instances that
+        fail to start are put back in the pool.
+        """
+
+        lock_fd = self._lock('claim', wait=True)
+        try:
+            stopped = self.members().get('stopped', [])[:num]
+            if not stopped:
+                return []
+
+            pool_names = [self.swm.get_name(i) for i in stopped]
+            names = self.swm.allocate_names(len(stopped), name)
+            ids = [i.instance_id for i in stopped]
+            self.swm.api_limiter.wait()
+            self.swm.client.delete_tags(Resources=ids, Tags=[{'Key': PoolTag}])
+            for (instance, new_name) in zip(stopped, names):
+                self.swm._tag_name(instance, new_name)
+        finally:
+            os.close(lock_fd)
+
+        try:
+            (not_running, instances) = self.swm.resume(stopped, wait=True)
+        except Exception:
+            self._unclaim(stopped, pool_names)
+            raise
+
+        if not_running:
+            self.swm.log.warn('pool %s: %d claimed instances not running',
+                              self.name, not_running)
+            still_stopped = set(i.instance_id for i in instances
+                                if i.state['Name'] == 'stopped')
+            self._unclaim([i for i in stopped if i.instance_id in still_stopped],
+                          [n for (i, n) in zip(stopped, pool_names)
+                           if i.instance_id in still_stopped])
+            instances = [i for i in instances
+                         if i.instance_id not in still_stopped]
+        self.swm.log('pool %s: claimed %d instances' % (self.name, len(instances)))
+        return instances
+
+    def _unclaim(self, instances, pool_names):
+        """Put claimed instances that didn't start back in the pool.
+
+        instances   list of the instances
+        pool_names  list of the names the instances had in the pool
+        """
+
+        for (instance, pool_name) in zip(instances, pool_names):
+            tags = [{'Key': PoolTag, 'Value': self.name}]
+            if pool_name:
+                tags.append({'Key': 'Name', 'Value': pool_name})
+            self.swm.api_limiter.wait()
+            self.swm.client.create_tags(Resources=[instance.instance_id],
+                                        Tags=tags)
+        if instances:
+            self.swm.log.warn('pool %s: %d instances returned to the pool',
+                              self.name, len(instances))
+
+    def drain(self):
+        """Terminate all pool instances, return the number terminated."""
+
+        instances = []
+        for members in self.members().values():
+            instances.extend(members)
+        self.swm.terminate(instances)
+        return len(instances)
+
+    def _lock(self, kind='fill', wait=False):
+        """Take a pool lock, return the lock file descriptor.
+
+        kind  which lock, 'fill' or 'claim'
+        wait  if True wait for the lock, else return None if another
+              process holds it
+        """
+
+        if not os.path.isdir(defaults.CacheDir):
+            try:
+                os.makedirs(defaults.CacheDir)
+            except OSError:
+                pass            # another process made it
+
+        path = os.path.join(defaults.CacheDir,
+                            'pool.%s.%s.lock' % (self.name, kind))
+        fd = os.open(path, os.O_CREAT | os.O_RDWR, 0644)
+        flags = fcntl.LOCK_EX
+        if not wait:
+            flags |= fcntl.LOCK_NB
+        try:
+            fcntl.flock(fd, flags)
+        except IOError:
+            os.close(fd)
+            return None
+        return fd
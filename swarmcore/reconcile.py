@@ -0,0 +1,316 @@
+"""
+Converge instances to a declarative spec of node groups.
+
+A spec file names groups of instances and says how many of each there
+should be and how they are configured:
+
+    groups:
+      workers:
+        name: worker{number}
+        count: 10
+        flavour: m5.large
+        image: ami-12345678
+        key: ec2_sydney
+        secgroup: [sydney]
+        zone: ap-southeast-2a
+        userdata: worker_userdata.sh
+
+Instances belong to a group through the 'swarm:group' tag set when they
+are launched.  One snapshot of all instances is taken, and a plan for
+each group is worked out from it: instances whose configuration differs
+from the spec are replaced, surplus instances are terminated and missing
+ones launched.  The plans of all groups are then carried out at once.
+
+Spec files are YAML if PyYAML is installed, and may always be JSON.
+"""
+
+import json
+
+try:
+    import yaml
+    ParseErrors = (ValueError, yaml.YAMLError)
+except ImportError:
+    yaml = None
+    ParseErrors = (ValueError,)
+
+from . import defaults
+from . import utils
+
+
+# tag holding the group name on group instances
+GroupTag = 'swarm:group'
+
+# fields in a group spec, and their defaults ('name' defaults to the
+# group name followed by '{number}')
+Fields = {
+          'name': None,
+          'count': 0,
+          'flavour': defaults.Flavour,
+          'image': None,
+          'key': defaults.Key,
+          'secgroup': defaults.Secgroup.split(','),
+          'zone': None,             # any zone is acceptable
+          'userdata': None,         # path to a userdata file
+         }
+
+# instance states counted as group members
+MemberStates = ('pending', 'running')
+
+# instance states whose names are in use
+LiveStates = ('pending', 'running', 'stopping', 'stopped')
+
+
+def load_spec(path):
+    """Read a spec file, return a dictionary of group name -> group spec.
+
+    Missing fields take their defaults.  Raises ValueError if the file
+    can't be parsed or a group is badly formed.
+    """
+
+    with open(path, 'rb') as fd:
+        text = fd.read()
+
+    try:
+        if yaml is not None:
+            data = yaml.safe_load(text)
+        else:
+            data = json.loads(text)
+    except ParseErrors as e:
+        msg = "Can't parse spec file %s: %s" % (path, str(e))
+        if yaml is None:
+            msg += ' (PyYAML is not installed, so the file must be JSON)'
+        raise ValueError(msg)
+
+    if not isinstance(data, dict) or not isinstance(data.get('groups', None), dict):
+        raise ValueError("Spec file %s must have a 'groups' mapping" % path)
+
+    groups = {}
+    for (group, spec) in data['groups'].items():
+        if not isinstance(spec, dict):
+            raise ValueError("Group '%s' in %s must be a mapping" % (group, path))
+        unknown = set(spec) - set(Fields)
+        if unknown:
+            raise ValueError("Group '%s' in %s has unknown fields: %s"
+                             % (group, path, ', '.join(sorted(unknown))))
+        full = dict(Fields)
+        full.update(spec)
+        if full['name'] is None:
+            full['name'] = '%s{number}' % group
+        if isinstance(full['secgroup'], basestring):
+            full['secgroup'] = full['secgroup'].split(',')
+        try:
+            full['count'] = int(full['count'])
+        except (TypeError, ValueError):
+            full['count'] = -1
+        if full['count'] < 0:
+            raise ValueError("Group '%s' in %s: count must be a non-negative integer"
+                             % (group, path))
+        if full['count'] > 1 and '{number' not in full['name']:
+            raise ValueError("Group '%s' in %s: name must contain '{number...}'"
+                             % (group, path))
+        groups[group] = full
+
+    return groups
+
+
+class GroupPlan(object):
+    """The actions that bring one group to its spec.
+
+    group      the group name
+    spec       the group spec dictionary
+    keep       list of instances that match the spec
+    drifted    list of instances that don't match the spec, replaced
+    surplus    list of matching instances beyond the count, terminated
+    launch     number of instances to launch
+    names      names for the instances launched
+    """
+
+    __slots__ = ('group', 'spec', 'keep', 'drifted', 'surplus', 'launch', 'names')
+
+    def __init__(self, group, spec):
+        self.group = group
+        self.spec = spec
+        self.keep = []
+        self.drifted = []
+        self.surplus = []
+        self.launch = 0
+        self.names = []
+
+    def terminate(self):
+        """Return the list of instances the plan terminates."""
+
+        return self.drifted + self.surplus
+
+    def empty(self):
+        """Return True if the plan does nothing."""
+
+        return not (self.launch or self.drifted or self.surplus)
+
+    def __repr__(self):
+        return ('GroupPlan(%s, keep=%d, launch=%d, drifted=%d, surplus=%d)'
+                % (self.group, len(self.keep), self.launch,
+                   len(self.drifted), len(self.surplus)))
+
+
+class Reconciler(object):
+    """Plan and apply the changes that converge instances to a spec."""
+
+    def __init__(self, swm, groups, prune=False):
+        """Create the reconciler.
+
+        swm     the Swarm object used to talk to AWS
+        groups  dictionary of group name -> group spec, from load_spec()
+        prune   if True, instances of groups not in the spec are terminated
+        """
+
+        self.swm = swm
+        self.groups = groups
+        self.prune = prune
+
+    def snapshot(self):
+        """Return a list of all live instances, with one AWS call."""
+
+        filters = [{'Name': 'instance-state-name', 'Values': list(LiveStates)}]
+        self.swm.api_limiter.wait()
+        return list(self.swm.ec2.instances.filter(Filters=filters))
+
+    def plan(self, instances=None):
+        """Return a list of GroupPlan, one per group, sorted by group name.
+
+        instances  the snapshot to plan from (default take one)
+
+        If pruning, groups tagged on instances but not in the spec get a
+        plan to terminate all their instances.
+        """
+
+        if instances is None:
+            instances = self.snapshot()
+
+        members = {}
+        in_use = []
+        for instance in instances:
+            in_use.append(self.swm.get_name(instance))
+            group = self._tag(instance, GroupTag)
+            if group is not None and instance.state['Name'] in MemberStates:
+                members.setdefault(group, []).append(instance)
+
+        groups = dict(self.groups)
+        if self.prune:
+            for group in members:
+                if group not in groups:
+                    groups[group] = dict(Fields, name=group, count=0)
+
+        plans = []
+        for group in sorted(groups):
+            spec = groups[group]
+            plan = GroupPlan(group, spec)
+            image = None
+            if spec['image']:
+                image = self.swm.ensure_image_id(spec['image'])
+            for instance in sorted(members.get(group, []),
+                                   key=lambda i: self.swm.get_name(i)):
+                if self._drifted(instance, spec, image):
+                    plan.drifted.append(instance)
+                elif len(plan.keep) < spec['count']:
+                    plan.keep.append(instance)
+                else:
+                    plan.surplus.append(instance)
+            plan.launch = spec['count'] - len(plan.keep)
+            plan.names = self.swm.allocate_names(plan.launch, spec['name'],
+                                                 in_use=in_use)
+            plans.append(plan)
+
+        return plans
+
+    def apply(self, plans, callback=None):
+        """Carry out the plans of all groups at once.
+
+        plans     list of GroupPlan from plan()
+        callback  function called with (plan, error) as each group finishes,
+                  'error' is None on success
+
+        Each group launches its new instances, waits until they are
+        running, then terminates its drifted and surplus instances.  If
+        any new instance isn't running, all the new instances of the group
+        are terminated, the drifted instances are kept and the group fails.  Returns a dictionary of group name -> error
+        (None on success).
+        """
+
+        work = [p for p in plans if not p.empty()]
+
+        def converge(plan):
+            error = None
+            try:
+                self._converge(plan)
+            except Exception as e:
+                self.swm.log.error('apply: group %s failed: %s', plan.group, e)
+                error = str(e)
+            if callback:
+                callback(plan, error)
+            return error
+
+        results = utils.parallel_map(converge, work, max(len(work), 1))
+        return dict((p.group, r) for (p, r) in zip(work, results))
+
+    def _converge(self, plan):
+        """Carry out one group plan."""
+
+        spec = plan.spec
+        if plan.launch:
+            userdata = None
+            if spec['userdata']:
+                with open(spec['userdata'], 'rb') as fd:
+                    userdata = fd.read()
+            image = self.swm.ensure_image_id(spec['image'] or self.swm.DefaultImage)
+            zone = spec['zone'] or self.swm.DefaultZoneName
+            pending = self.swm._launch(plan.names, image=image, zone=zone,
+                                       flavour=spec['flavour'], key=spec['key'],
+                                       secgroup=spec['secgroup'],
+                                       userdata=userdata,
+                                       tags={GroupTag: plan.group})
+            new = self.swm._wait_launched(pending)
+            not_running = [i for i in new if i.state['Name'] != 'running']
+            if not_running:
+                # keep drifted instances serving until replacements run, and
+                # drop the whole launch: new instances left in the group
+                # would be kept by the next plan, which would then terminate
+                # the drifted instances as surplus
+                self.swm.terminate(new)
+                if plan.surplus:
+                    self.swm.terminate(plan.surplus)
+                raise Exception('%d of %d new instances not running, '
+                                'new instances terminated, drifted '
+                                'instances not terminated'
+                                % (len(not_running), len(new)))
+
+        if plan.terminate():
+            self.swm.terminate(plan.terminate())
+
+    @staticmethod
+    def _tag(instance, key):
+        """Return the value of an instance tag, None if not set."""
+
+        for t in instance.tags or []:
+            if t.get('Key', None) == key:
+                return t['Value']
+        return None
+
+    @staticmethod
+    def _drifted(instance, spec, image):
+        """Return True if an instance doesn't match its group spec.
+
+        image  the resolved image ID of the spec, None if not given
+        """
+
+        if instance.instance_type != spec['flavour']:
+            return True
+        if image is not None and instance.image_id != image:
+            return True
+        if instance.key_name != spec['key']:
+            return True
+        groups = sorted(sg['GroupName'] for sg in instance.security_groups)
+        if groups != sorted(spec['secgroup']):
+            return True
+        if spec['zone'] and instance.placement['AvailabilityZone'] != spec['zone']:
+            return True
+        return False
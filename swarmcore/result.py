@@ -0,0 +1,74 @@
+"""
+Result records for swarm operations.
+
+Each operation applied to a list of instances (cmd, copy, info, ...)
+returns one HostResult per instance.  The record carries the instance
+identity (id, name, IP) along with the operation results, so callers
+don't have to join separate result lists on IP address.
+"""
+
+import json
+
+from . import utils
+
+
+class HostResult(object):
+    """The result of an operation on one instance.
+
+    instance_id  the AWS instance ID
+    name         the instance 'Name' tag (None if not named)
+    ip           the instance public IP address
+    status       exit status of the operation (None if nothing executed)
+    duration     time taken for the instance, seconds
+    output       output string of the operation (None if nothing executed)
+    values       list of values from any info callbacks, in callback order
+    """
+
+    __slots__ = ('instance_id', 'name', 'ip', 'status', 'duration',
+                 'output', 'values')
+
+    def __init__(self, instance, status=None, output=None, duration=None,
+                 values=None):
+        """Create a result record for one instance.
+
+        instance  the instance object the result is for
+        status    exit status of the operation
+        output    output string of the operation
+        duration  time taken, seconds
+        values    list of info callback values
+        """
+
+        self.instance_id = instance.instance_id
+        self.name = utils.get_instance_name(instance)
+        self.ip = instance.public_ip_address
+        self.status = status
+        self.duration = duration
+        self.output = output
+        if values is None:
+            values = []
+        self.values = values
+
+    def label(self, show_ip=False):
+        """Return a display label: the name, or IP if required or no name."""
+
+        if show_ip or not self.name:
+            return self.ip
+        return self.name
+
+    def to_dict(self):
+        """Return the result as a dictionary."""
+
+        return dict((attr, getattr(self, attr)) for attr in self.__slots__)
+
+    def to_json(self):
+        """Return the result as a single line of JSON."""
+
+        data = self.to_dict()
+        output = data['output']
+        if isinstance(output, str):
+            data['output'] = output.decode('utf-8', 'replace')
+        return json.dumps(data, default=str, sort_keys=True)
+
+    def __repr__(self):
+        return ('HostResult(%s, name=%s, ip=%s, status=%s)'
+                % (self.instance_id, self.name, self.ip, str(self.status)))
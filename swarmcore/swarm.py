@@ -12,18 +12,44 @@ __version__ = '%d.%d' % (_MajorRelease, _MinorRelease)
 
 
 import os
+import re
 import sys
 import time
+import base64
+import calendar
+import pipes
+import random
+import tarfile
+import tempfile
 import commands
+import subprocess
 import threading
+import traceback
 import Queue
 import boto3
+import botocore.exceptions
+from . import cache
+from . import catalog
 from . import classify
+from . import consolelog
+from . import keys
 from . import log
 from . import utils
+from .result import HostResult
 
 
 
+class ReplaceError(Exception):
+    """A replacement failed part way.
+
+    instances  list of the new instances started before the failure
+    """
+
+    def __init__(self, msg, instances):
+        Exception.__init__(self, msg)
+        self.instances = instances
+
+
 class Swarm(object):
 
     # default attributes when starting a server
@@ -40,13 +66,54 @@ class Swarm(object):
     # SSH timeout, seconds
     SshTimeout = 10
 
+    # options used on every SSH/SCP connection, '%d' is the SSH timeout
+    SshOptions = ('-o "ConnectTimeout %d" -o "BatchMode yes" '
+                  '-o "CheckHostIP no" '
+                  '-o "PreferredAuthentications publickey" '
+                  '-o "StrictHostKeyChecking no"')
+
+    # SSH retries: number of retries of transient failures and base delay
+    SshRetries = 2
+    SshRetryDelay = 2.0
+
+    # starts of the error line the ssh client prints when it fails to set
+    # up a connection, so the remote command never ran and a retry is safe
+    SshTransientErrors = ('ssh: connect to host ',
+                          'kex_exchange_identification: ',
+                          'ssh_exchange_identification: ',
+                          'Connection closed by ', 'Connection reset by ')
+
+    # marker line preceding each remote fact in gathered output
+    FactMarker = '@@swarm-fact:%s@@'
+
+    # script interpreters that read a script from stdin with '-s'
+    ShellInterpreters = ('bash', 'sh', 'dash', 'ksh', 'zsh')
+
+    # form of an environment variable name given to run_script()
+    EnvNameRE = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+    # owners of images that may be found by name, and the time (seconds)
+    # a resolved image name or ID is cached
+    ImageOwners = ['self', 'amazon']
+    ImageCacheTTL = 24 * 60 * 60
+
     # various timeouts, seconds
     DefaultTimeout = 60
+    InfoTimeout = 60            # total time for an SSH info callback
 
     # various loop times, seconds
     RunningLoopWait = 10
     ConnectLoopWait = 10
     TerminatedLoopWait = 10
+    StateLoopWait = 10
+
+    # instance states wait() and wait_state() can wait for
+    WaitStates = ('running', 'stopped', 'terminated')
+
+    # maximum number of instance IDs in one stop or start call, and the
+    # time (seconds) to wait for instances to stop or start
+    StopStartChunk = 500
+    PauseTimeout = 10 * 60
 
     # sleep time to get around 'rate limit'
     LimitRateErrors = 0.0
@@ -54,12 +121,57 @@ class Swarm(object):
     # number of concurrent threads talking to AWS
     NumOSThreads = 5
 
+    # AWS API calls per second shared by all threads, and the burst allowed
+    ApiRate = 10.0
+    ApiBurst = 20
+
     # external commands we are going to use
     Cmd_nc = 'nc'	# to check net connectivity
 
     # time (seconds) to wait for instances to stop
     WaittimeStopServers = 10
 
+    # time (seconds) to wait for started instances to be running, and for
+    # replacement instances to accept SSH when surging
+    StartTimeout = 10 * 60
+    SurgeTimeout = 10 * 60
+
+    # retries tagging an instance AWS doesn't know about yet, and delay
+    TagRetries = 5
+    TagRetryDelay = 2.0
+    TagThreads = 10             # instances named at once
+
+    # EC2 Fleet launches: prefix of the temporary launch template names
+    # and the capacity type asked for
+    FleetTemplatePrefix = 'swarm-fleet'
+    FleetCapacityType = 'on-demand'
+
+    # maximum number of instance IDs in one terminate or reboot call
+    TerminateChunk = 500
+    RebootChunk = 500
+
+    # time (seconds) to wait for rebooted instances to accept SSH, the
+    # time between SSH probes, and the time after which an instance that
+    # was never seen down is taken as having rebooted
+    RebootTimeout = 10 * 60
+    RebootLoopWait = 5
+    ProbeLoopWait = 2           # between probe passes of wait_ssh_ready()
+    RebootGrace = 60
+
+    # console classifications that remediate() replaces
+    RemediateClasses = ('FSCK_manual', 'ROFS', 'IOERROR', 'RUNAWAY_LOOP',
+                        'HUNG, no login prompt')
+
+    # remediate() defaults: concurrent replacements, replacements per
+    # minute and seconds before the same instance name is replaced again
+    RemediateConcurrency = 5
+    RemediateRate = 10.0
+    RemediateCooldown = 60 * 60
+
+    # seconds after launch (or start) before remediate() checks an
+    # instance, a booting console looks like 'HUNG, no login prompt'
+    RemediateGrace = 10 * 60
+
 
     def version(self):
         """Get a tuple of (major, minor) release numbers."""
@@ -90,7 +202,7 @@ class Swarm(object):
         self.region_name = region_name
         self.verbose = verbose
         if verbose:
-            self.log.debug('self.verbose=%s' % str(self.verbose))
+            self.log.debug('self.verbose=%s', self.verbose)
 
         # override config stuff from the environment if not given
         access_key_id = self._check_env(access_key_id, 'AWS_ACCESS_KEY_ID')
@@ -98,9 +210,9 @@ class Swarm(object):
         region_name = self._check_env(region_name, 'AWS_REGION_NAME')
 #        config = self._check_env(config, 'AWS_CONFIG')
         if verbose:
-            self.log.debug('access_key_id=%s' % str(access_key_id))
-            self.log.debug('secret_access_key=%s' % str(secret_access_key))
-            self.log.debug('region_name=%s' % str(region_name))
+            self.log.debug('access_key_id=%s', access_key_id)
+            self.log.debug('secret_access_key=%s', secret_access_key)
+            self.log.debug('region_name=%s', region_name)
 #            self.log.debug('config=%s' % str(config))
 
         self.ec2 = boto3.resource(service_name='ec2',
@@ -118,11 +230,21 @@ class Swarm(object):
         # get a client object
         self.client = boto3.client('ec2', region_name=region_name)
 
+        # all threads share one limit on the AWS call rate
+        self.api_limiter = utils.get_rate_limiter('aws', self.ApiRate,
+                                                  self.ApiBurst)
+
+        # cached console logs
+        self.console = consolelog.ConsoleLogs(self.client, self.api_limiter)
+
         # get absolute path to user ~/.ssh directory
         self.ssh_dir = os.path.expanduser('~/.ssh')
         if auth_dir is not None:
             self.ssh_dir = auth_dir
 
+        # index of SSH keys, built once per process
+        self.keys = keys.get_registry(self.ssh_dir)
+
         # check that we have some external commands installed
         self.check_external(self.Cmd_nc)
 
@@ -144,12 +266,12 @@ class Swarm(object):
         # get a list of regions
         self.regions = self._get_regions()
         if self.verbose:
-            self.log('Regions:\n%s' % str(self.regions))
+            self.log.debug('Regions:\n%s', self.regions)
 
         # get data on zones in this region
         self.zones = self._get_availability_zones(region_name=region_name)
         if self.verbose:
-            self.log('Availability Zones in region %s: %s' % (region_name, str(self.zones)))
+            self.log.debug('Availability Zones in region %s: %s', region_name, self.zones)
 
         self.log('Swarm %s initialized!' % __version__)
 
@@ -158,15 +280,17 @@ class Swarm(object):
 
         self.ec2 = boto3.client('ec2', region_name=region_name)
 
-    def instances(self):
-        """Returns a list of all *running* instances."""
+    def instances(self, state='running'):
+        """Returns a list of all instances in the given state.
 
-        result = []
-        for instance in sorted(list(self.ec2.instances.all())):
-            if instance.state['Name'] == 'running':
-                result.append(instance)
+        state  the instance state name, eg, 'stopped' (None means any state)
+        """
 
-        return result
+        if state is None:
+            return sorted(list(self.ec2.instances.all()))
+
+        filters = [{'Name': 'instance-state-name', 'Values': [state]}]
+        return sorted(list(self.ec2.instances.filter(Filters=filters)))
 
     def start(self, num, name, image=DefaultImage,
               region=DefaultRegionName, zone=DefaultZoneName,
@@ -192,15 +316,45 @@ class Swarm(object):
         if userdata is None:
             userdata = ''
 
+        # resolve an image name, check an image ID
+        if image is None:
+            image = self.DefaultImage
+        image = self.ensure_image_id(image)
+
+        pending_names = self.allocate_names(num, name)
+        self.log.debug('pending_names=%s', pending_names)
+
+        pending_instances = self._launch(pending_names, image=image, zone=zone,
+                                         flavour=flavour, key=key,
+                                         secgroup=secgroup, userdata=userdata)
+
+        self.log('started %d instances, flavour=%s, key=%s, secgroup=%s, image=%s'
+                 % (num, flavour, key, str(secgroup), image))
+
+        return self._wait_launched(pending_instances)
+
+    def allocate_names(self, num, name, in_use=None):
+        """Return a list of 'num' unused instance names.
+
+        num     number of names required
+        name    instance name, may contain {number} formatting
+        in_use  list of names already in use (default is to ask AWS), new
+                names are appended to it
+
+        A name is in use if any instance that isn't terminated has it, so
+        paused (stopped) instances keep their names.
+        """
+
         # get list of server names already in use
-        names_already_used = []
-        for server in self.instances():
-            if server.state['Name'] in ('pending', 'running'):
-                running_name = self.get_name(server)
-                names_already_used.append(running_name)
-        self.log('names_already_used=%s' % str(names_already_used))
+        names_already_used = in_use
+        if names_already_used is None:
+            names_already_used = []
+            for server in self.instances(state=None):
+                if server.state['Name'] not in ('shutting-down', 'terminated'):
+                    running_name = self.get_name(server)
+                    names_already_used.append(running_name)
+        self.log.debug('names_already_used=%s', names_already_used)
 
-        result = []
         instance_number = 0
         number_names = 0
         pending_names = []
@@ -231,56 +385,433 @@ class Swarm(object):
             pending_names.append(instance_name)
             names_already_used.append(instance_name)
 
-        self.log('pending_names=%s' % str(pending_names))
+        return pending_names
 
+    def _launch(self, names, image, zone, flavour, key, secgroup, userdata,
+                tags=None):
+        """Launch instances with one create_instances() call and name them.
+
+        names  list of names for the new instances, one per instance
+        tags   dictionary of extra tags set on all the new instances
+
+        The other parameters are as for start().  Each instance is tagged
+        with its name as soon as it is created.  Returns the list of new
+        (pending) instances.
+        """
+
+        num = len(names)
         placement = {'AvailabilityZone': zone}
+        extra = {}
+        if tags:
+            tag_list = [{'Key': k, 'Value': v} for (k, v) in sorted(tags.items())]
+            extra['TagSpecifications'] = [{'ResourceType': 'instance',
+                                           'Tags': tag_list}]
+        self.api_limiter.wait()
         pending_instances = self.ec2.create_instances(ImageId=image,
                                                       InstanceType=flavour,
                                                       KeyName=key,
                                                       SecurityGroups=secgroup,
-                                                      UserData=userdata,
+                                                      UserData=userdata or '',
                                                       Placement=placement,
                                                       MinCount=num,
-                                                      MaxCount=num)
+                                                      MaxCount=num,
+                                                      **extra)
 
-        self.log('started %d instances, flavour=%s, key=%s, secgroup=%s, image=%s'
-                 % (num, flavour, key, str(secgroup), image))
+        self._tag_names(pending_instances, names)
 
-#        while True:
-#            self.log_state(pending_instances[0])
+        return pending_instances
 
-        # wait until instances are running and then name them
-        self.log('Start of Name tagging, pending_instances=%s' % str(pending_instances))
-        if pending_instances:
-            for (server, name) in zip(pending_instances, pending_names):
-                server.wait_until_running()
-                server.create_tags(Tags=[{'Key': 'Name', 'Value': name}])
-                self.log('Instance %s tagged as Name=%s' % (server.id, name))
+    def _tag_name(self, instance, name):
+        """Set the 'Name' tag of a new instance.
 
-        return pending_instances
+        A new instance may not be visible to the tagging API for a moment,
+        so 'not found' errors are retried.
+        """
+
+        for attempt in range(self.TagRetries + 1):
+            self.api_limiter.wait()
+            try:
+                self.client.create_tags(Resources=[instance.instance_id],
+                                        Tags=[{'Key': 'Name', 'Value': name}])
+                break
+            except botocore.exceptions.ClientError as e:
+                code = e.response.get('Error', {}).get('Code', '')
+                if not code.startswith('InvalidInstanceID') or attempt == self.TagRetries:
+                    raise
+                time.sleep(self.TagRetryDelay)
+        self.log('Instance %s tagged as Name=%s' % (instance.instance_id, name))
+
+    def _tag_names(self, instances, names):
+        """Set the 'Name' tags of new instances concurrently.
+
+        instances  list of new instance objects
+        names      list of names, one per instance
+
+        Up to TagThreads instances are tagged at once, each through
+        _tag_name().  Raises the first error once all have been tried.
+        """
+
+        items = zip(instances, names)
+        results = utils.parallel_map(lambda item: self._tag_name(*item),
+                                     items, self.TagThreads)
+        errors = [r for r in results if isinstance(r, Exception)]
+        for e in errors:
+            self.log.error('_tag_names: %s', e)
+        if errors:
+            raise errors[0]
+
+    def start_fleet(self, num, name, image=DefaultImage, zones=None,
+                    flavours=None, key=DefaultKey, secgroup=DefaultSecgroup,
+                    userdata=None, tags=None):
+        """Start up to 'num' instances with one EC2 Fleet call.
+
+        num       number of instances wanted
+        name      name of server, may contain {number} formatting
+        image     image ID or name
+        zones     list of acceptable zones (default [DefaultZoneName])
+        flavours  list of acceptable flavours, most preferred first
+                  (default [DefaultFlavour])
+        key       the key pair name
+        secgroup  the security group(s) to use, list of strings
+        userdata  userdata string, may be None
+        tags      dictionary of extra tags set on all the new instances
+
+        Tags shared by all instances are set by the fleet call itself, and
+        names that differ are tagged concurrently afterwards.  An 'instant'
+        fleet is asked for 'num' instances of any of the
+        flavours in any of the zones, so a shortage of one flavour or zone
+        doesn't fail the whole launch.  Returns a list of the instances
+        obtained, running, which may be fewer than 'num'.
+        """
+
+        zones = zones or [self.DefaultZoneName]
+        flavours = flavours or [self.DefaultFlavour]
+        self.log('Starting fleet of %d instances, name=%s, flavours=%s, zones=%s'
+                 % (num, name, ','.join(flavours), ','.join(zones)))
+
+        if image is None:
+            image = self.DefaultImage
+        image = self.ensure_image_id(image)
+
+        # a temporary launch template holds the common configuration
+        template_data = {'ImageId': image, 'KeyName': key,
+                         'SecurityGroups': list(secgroup)}
+        if userdata:
+            template_data['UserData'] = base64.b64encode(userdata)
+        shared_tags = dict(tags or {})
+        if '{number' not in name:
+            shared_tags['Name'] = name
+        if shared_tags:
+            tag_list = [{'Key': k, 'Value': v}
+                        for (k, v) in sorted(shared_tags.items())]
+            template_data['TagSpecifications'] = [{'ResourceType': 'instance',
+                                                   'Tags': tag_list}]
+        template_name = '%s-%d-%d' % (self.FleetTemplatePrefix, os.getpid(),
+                                      int(time.time() * 1000))
+        self.api_limiter.wait()
+        template = self.client.create_launch_template(LaunchTemplateName=template_name,
+                                                      LaunchTemplateData=template_data)
+        template_id = template['LaunchTemplate']['LaunchTemplateId']
+
+        # every flavour in every zone, earlier flavours preferred
+        overrides = []
+        for (priority, flavour) in enumerate(flavours):
+            for zone in zones:
+                overrides.append({'InstanceType': flavour,
+                                  'AvailabilityZone': zone,
+                                  'Priority': float(priority)})
+
+        try:
+            self.api_limiter.wait()
+            response = self.client.create_fleet(
+                Type='instant',
+                LaunchTemplateConfigs=[{'LaunchTemplateSpecification':
+                                            {'LaunchTemplateId': template_id,
+                                             'Version': '$Latest'},
+                                        'Overrides': overrides}],
+                TargetCapacitySpecification={'TotalTargetCapacity': num,
+                                             'DefaultTargetCapacityType':
+                                                 self.FleetCapacityType},
+                OnDemandOptions={'AllocationStrategy': 'prioritized'})
+        finally:
+            self.api_limiter.wait()
+            self.client.delete_launch_template(LaunchTemplateId=template_id)
+
+        for error in response.get('Errors', []):
+            self.log.warn('start_fleet: %s: %s',
+                          error.get('ErrorCode', ''), error.get('ErrorMessage', ''))
+
+        ids = []
+        for launched in response.get('Instances', []):
+            ids.extend(launched.get('InstanceIds', []))
+        self.log('start_fleet: obtained %d of %d instances' % (len(ids), num))
+        if not ids:
+            return []
+
+        # name the instances obtained, unless the fleet call named them
+        pending_instances = [self.ec2.Instance(instance_id) for instance_id in ids]
+        if 'Name' not in shared_tags:
+            names = self.allocate_names(len(ids), name)
+            self._tag_names(pending_instances, names)
+
+        return self._wait_launched(pending_instances)
+
+    def _wait_launched(self, instances):
+        """Wait until launched instances are running, return them refreshed.
+
+        The refreshed instance objects have their public IP addresses.
+        """
+
+        if not instances:
+            return []
+
+        not_running = self.wait_running(instances, self.StartTimeout)
+        if not_running:
+            self.log.warn('%d instances not running after %ds',
+                          not_running, self.StartTimeout)
+
+        ids = [i.instance_id for i in instances]
+        return list(self.ec2.instances.filter(InstanceIds=ids))
 
     def terminate(self, instances, wait=False):
         """Terminate instances in list, optionally wait until actually stopped."""
 
-        # kill all instances in list
-        for i in instances:
-            self.log('terminating: %s' % str(i))
-            i.terminate()
+        # kill all instances in list, many per call
+        ids = [i.instance_id for i in instances]
+        for start in range(0, len(ids), self.TerminateChunk):
+            chunk = ids[start:start+self.TerminateChunk]
+            self.log('terminating: %s' % ', '.join(chunk))
+            self.api_limiter.wait()
+            self.client.terminate_instances(InstanceIds=chunk)
 
         # wait until all actually stopped, if required
-        if wait:
+        if wait and instances:
             self.log('Waiting until all instances actually terminated...')
-            while instances:
-                new_instances = []
-                for i in instances:
-                    refreshed = self.ec2.Instance(i.id)
-                    if refreshed.state['Name'] != 'terminated':
-                        new_instances.append(i)
-                instances = new_instances
-
-                time.sleep(self.WaittimeStopServers)
+            while self.wait_terminated(instances, self.DefaultTimeout):
+                self.log('Still waiting for instances to terminate...')
             self.log('All instances terminated')
 
+    def replace(self, instances, **kwargs):
+        """Replace instances with new instances of the same configuration.
+
+        instances        list of instance objects to replace
+        flavour          (keyword) instance type for the new instances
+        image            (keyword) image ID or name for the new instances
+        key              (keyword) key pair name for the new instances
+        secgroup         (keyword) security groups for the new instances, list
+        userdata         (keyword) userdata string for the new instances
+        zone             (keyword) availability zone for the new instances
+        max_unavailable  (keyword) maximum number of instances replaced at
+                         once (default all)
+        surge            (keyword) if True, start each batch of new instances
+                         and wait until they accept SSH before terminating
+                         the instances they replace
+
+        The configuration of each instance is read and overridden by any
+        keyword values given.  A new instance with the same name is started
+        in the same zone, unless 'zone' is given.  Instances with identical configurations are
+        started with one AWS call.  Without 'surge' the old instances of a
+        batch are terminated before the new ones start.  Returns a list of
+        the new instances.
+
+        Raises ReplaceError, holding the new instances started so far, if
+        a batch fails.  With 'surge' the new instances of a batch that
+        failed to launch are terminated, as the old ones are still running.
+        """
+
+        overrides = (('flavour', 'instance_type'), ('image', 'image_id'),
+                     ('key', 'key_name'), ('secgroup', 'security_groups'),
+                     ('zone', 'availability_zone'))
+        userdata = kwargs.get('userdata', None)
+        surge = kwargs.get('surge', False)
+        max_unavailable = kwargs.get('max_unavailable', None) or len(instances)
+        if kwargs.get('image', None):
+            kwargs['image'] = self.ensure_image_id(kwargs['image'])
+
+        specs = dict((spec['instance_id'], spec)
+                     for spec in self.describe_instances(instances))
+        for spec in specs.values():
+            for (kw, field) in overrides:
+                if kwargs.get(kw, None):
+                    spec[field] = kwargs[kw]
+        self.log.debug('replace: specs=%s', specs)
+
+        result = []
+        for start in range(0, len(instances), max_unavailable):
+            batch = instances[start:start+max_unavailable]
+            batch_specs = [specs[i.instance_id] for i in batch]
+            if surge:
+                try:
+                    new = self._launch_specs(batch_specs, userdata)
+                except ReplaceError as e:
+                    self.terminate(e.instances)
+                    raise ReplaceError(str(e), result)
+                not_ready = self.wait_ssh_ready(new, self.SurgeTimeout)
+                if not_ready:
+                    msg = ('replace: %d new instances not accepting SSH, '
+                           'not terminating the instances they replace'
+                           % len(not_ready))
+                    self.log.error(msg)
+                    raise ReplaceError(msg, result + new)
+                self.terminate(batch, wait=True)
+            else:
+                self.terminate(batch, wait=True)
+                try:
+                    new = self._launch_specs(batch_specs, userdata)
+                except ReplaceError as e:
+                    raise ReplaceError(str(e), result + e.instances)
+            self.log('replace: replaced %d instances' % len(batch))
+            result.extend(new)
+
+        return result
+
+    def _launch_specs(self, specs, userdata=None):
+        """Launch one new instance for each spec, return them when running.
+
+        specs     list of dictionaries as returned by describe_instances()
+        userdata  userdata string for the new instances
+
+        Specs with identical configurations are grouped and each group is
+        launched with one create_instances() call, all groups at once.
+        If any group fails, raises ReplaceError holding the instances the
+        other groups launched, once they are running.
+        """
+
+        groups = {}
+        for spec in specs:
+            config = (spec['image_id'], spec['availability_zone'],
+                      spec['instance_type'], spec['key_name'],
+                      tuple(spec['security_groups']))
+            groups.setdefault(config, []).append(spec['name'])
+
+        def launch(item):
+            ((image, zone, flavour, key, secgroup), names) = item
+            return self._launch(names, image=image, zone=zone, flavour=flavour,
+                                key=key, secgroup=list(secgroup),
+                                userdata=userdata)
+
+        self.log('replace: launching %d instances in %d groups'
+                 % (len(specs), len(groups)))
+        pending = []
+        errors = []
+        for launched in utils.parallel_map(launch, groups.items(), len(groups)):
+            if isinstance(launched, Exception):
+                errors.append(launched)
+            else:
+                pending.extend(launched)
+
+        new = self._wait_launched(pending)
+        if errors:
+            msg = ('replace: %d of %d launch groups failed: %s'
+                   % (len(errors), len(groups), str(errors[0])))
+            self.log.error(msg)
+            raise ReplaceError(msg, new)
+
+        return new
+
+    def remediate(self, instances, **kwargs):
+        """Replace instances whose console log shows they are unhealthy.
+
+        instances    list of instance objects to check
+        classes      (keyword) classifications to replace
+                     (default RemediateClasses)
+        concurrency  (keyword) maximum replacements at once
+                     (default RemediateConcurrency)
+        rate         (keyword) maximum replacements per minute
+                     (default RemediateRate)
+        cooldown     (keyword) seconds before an instance name may be
+                     replaced again (default RemediateCooldown)
+        grace        (keyword) seconds after launch before an instance is
+                     checked (default RemediateGrace)
+        dry_run      (keyword) if True, report but don't replace
+        callback     (keyword) if given, called with each result as it arrives
+        threads      (keyword) number of instances classified at once
+        Other keywords are passed to replace().
+
+        The console logs of all instances are classified in one concurrent
+        pass, then the unhealthy instances are replaced in parallel.  The
+        time each instance name is successfully replaced is kept in a state
+        file, so an instance that keeps failing isn't replaced over and over.
+        Instances launched or started less than 'grace' seconds ago are
+        still booting and aren't checked.
+
+        Returns a list of HostResult objects for the unhealthy instances.
+        The status is 0 if replaced, 1 if the replacement failed or None if
+        skipped, the output describes what was done and .values holds the
+        classification.
+        """
+
+        classes = kwargs.pop('classes', self.RemediateClasses)
+        concurrency = kwargs.pop('concurrency', self.RemediateConcurrency)
+        rate = kwargs.pop('rate', self.RemediateRate)
+        cooldown = kwargs.pop('cooldown', self.RemediateCooldown)
+        grace = kwargs.pop('grace', self.RemediateGrace)
+        dry_run = kwargs.pop('dry_run', False)
+        callback = kwargs.pop('callback', None)
+        threads = kwargs.pop('threads', None)
+
+        booting = [i for i in instances if self.uptime(i) < grace]
+        if booting:
+            self.log('remediate: skipping %d instances launched in the last %ds'
+                     % (len(booting), grace))
+            booting_ids = set(i.instance_id for i in booting)
+            instances = [i for i in instances if i.instance_id not in booting_ids]
+
+        logs = self.console_logs(instances)
+        checked = self.info(instances, self.info_classify(logs), threads=threads)
+        by_id = dict((i.instance_id, i) for i in instances)
+        unhealthy = [(by_id[r.instance_id], r.values[0]) for r in checked
+                     if r.values and r.values[0] in classes]
+        self.log('remediate: %d of %d instances unhealthy'
+                 % (len(unhealthy), len(instances)))
+
+        replaced = cache.get_cache('remediate', ttl=cooldown)
+        limiter = utils.RateLimiter(rate / 60.0, concurrency)
+        lock = threading.Lock()
+
+        def remediate_one(item):
+            (instance, classification) = item
+            name = self.get_name(instance) or instance.instance_id
+            result = HostResult(instance, values=[classification])
+            with lock:
+                last = replaced.get(name)
+                if last is None and not dry_run:
+                    replaced.put(name, time.time())
+            if last is not None:
+                result.output = ('%s, not replaced, replaced %ds ago'
+                                 % (classification, int(time.time() - last)))
+            elif dry_run:
+                result.output = '%s, would be replaced' % classification
+            else:
+                limiter.wait()
+                start = time.time()
+                try:
+                    new = self.replace([instance], **kwargs)
+                    result.status = 0
+                    result.output = ('%s, replaced by %s' % (classification,
+                                     ', '.join(i.instance_id for i in new)))
+                except Exception as e:
+                    self.log.error('remediate: replacing %s failed: %s',
+                                   name, traceback.format_exc())
+                    with lock:
+                        replaced.delete(name)   # may be retried next sweep
+                    result.status = 1
+                    result.output = '%s, replace failed: %s' % (classification, str(e))
+                result.duration = time.time() - start
+            self.log('remediate: %s %s' % (name, result.output))
+            if callback:
+                callback(result)
+            return result
+
+        return utils.parallel_map(remediate_one, unhealthy, concurrency)
+
+    @staticmethod
+    def uptime(instance):
+        """Return the seconds since an instance was launched or started."""
+
+        launched = calendar.timegm(instance.launch_time.utctimetuple())
+        return time.time() - launched
+
     def get_name(self, instance):
         """Get a running instance name from .tags."""
 
@@ -297,15 +828,16 @@ class Swarm(object):
             (output, status, ip, name)
         """
 
-        self.log.info("wait: Waiting on %d instances for state '%s'"
-                      % (len(instances), state))
+        self.log.info("wait: Waiting on %d instances for state '%s'",
+                      len(instances), state)
 
-        if state == 'running':
-            status = self.wait_running(instances, timeout)
+        if state in self.WaitStates:
+            status = self.wait_state(instances, state, timeout)
             if status != 0:
-                self.log.info("wait: Some instances are NOT running")
+                self.log.info("wait: Some instances are NOT %s", state)
             else:
-                self.log.info("wait: All %d instances are running" % len(instances))
+                self.log.info("wait: All %d instances are %s",
+                              len(instances), state)
             return (status, self.get_status(instances))
 
         if state == 'ssh':
@@ -313,20 +845,13 @@ class Swarm(object):
             if status != 0:
                 self.log.info("wait: Some instances are NOT accepting SSH")
             else:
-                self.log.info("wait: All %d instances are accepting SSH" % len(instances))
+                self.log.info("wait: All %d instances are accepting SSH",
+                              len(instances))
             # get existing status tuples, replace 'whatever' with 'ssh'
             data = self.get_status(instances)
             new_data = [(name, ip, 'ssh') for (name, ip, _) in data]
             return (status, new_data)
 
-        if state == 'terminated':
-            status = self.wait_terminated(instances, timeout)
-            if status != 0:
-                self.log.info("wait: Some instances are NOT terminated")
-            else:
-                self.log.info("wait: All %d instances are terminated" % len(instances))
-            return (status, self.get_status(instances))
-
         msg = "wait: Bad wait state=%s" % state
         self.log.critical(msg)
         raise RuntimeError(msg)
@@ -340,39 +865,51 @@ class Swarm(object):
         Returns a count of number of instances NOT running.
         """
 
+        return self.wait_state(instances, 'running', timeout)
+
+    def wait_state(self, instances, state, timeout):
+        """Wait until all instances have the given state.
+
+        instances  a list of instance objects
+        state      the instance state name, eg, 'stopped'
+        timeout    timeout in seconds
+
+        Each pass makes one describe call for the instances still waited
+        on.  Returns a count of instances NOT in the state.
+        """
+
         # prepare for timeout: get start time
         start = time.time()
 
-        # now wait until all running or timeout expired
+        # now wait until all in state or timeout expired
         check_ids = [i.instance_id for i in instances]
-        while True:
-            self.log.debug('wait_running: check_ids=%s' % str(check_ids))
+        while check_ids:
+            self.log.debug('wait_state: state=%s, check_ids=%s',
+                           state, check_ids)
             next_check = []
+            self.api_limiter.wait()
             data = self.client.describe_instances(InstanceIds=check_ids)
             for instance in data['Reservations']:
                 for i in instance['Instances']:
-                    state = i['State']['Name']
-                    instance_id = i['InstanceId']
-
-                    if state != 'running':
-                        next_check.append(instance_id)
+                    if i['State']['Name'] != state:
+                        next_check.append(i['InstanceId'])
             check_ids = next_check
 
             # finished?
-            self.log.debug('len(check_ids)=%d' % len(check_ids))
+            self.log.debug('len(check_ids)=%d', len(check_ids))
             if len(check_ids) == 0:
                 break
 
             # check for timeout
             delta = time.time() - start
-            self.log.debug('wait_running: delta=%d, timeout=%d' % (int(delta), timeout))
+            self.log.debug('wait_state: delta=%d, timeout=%d', int(delta), timeout)
             if delta > timeout:
                 break
 
             # wait a bit - don't flood system
-            time.sleep(self.RunningLoopWait)
+            time.sleep(self.StateLoopWait)
 
-        # return number of non-running instances
+        # return number of instances not in the state
         return len(check_ids)
 
     def wait_ssh(self, instances, timeout):
@@ -399,15 +936,15 @@ class Swarm(object):
             for instance in instances:
                 ip = instance.public_ip_address
                 nc_cmd = cmd % ip
-                self.log.debug('wait_ssh: doing: %s' % nc_cmd)
+                self.log.debug('wait_ssh: doing: %s', nc_cmd)
                 (status, output) = commands.getstatusoutput(nc_cmd)
                 if status != 0:
-                    self.log.debug('wait_ssh: server %s unable to connect'
-                                   % instance.instance_id)
+                    self.log.debug('wait_ssh: server %s unable to connect',
+                                   instance.instance_id)
                     new_instances.append(instance)
                 else:
-                    self.log.debug('wait_ssh: server %s connected!'
-                                   % instance.instance_id)
+                    self.log.debug('wait_ssh: server %s connected!',
+                                   instance.instance_id)
 
             instances = new_instances
 
@@ -417,8 +954,8 @@ class Swarm(object):
 
             # check for timeout
             delta = time.time() - start
-            self.log.debug('wait_connect: delta=%d, timeout=%d'
-                           % (int(delta), timeout))
+            self.log.debug('wait_connect: delta=%d, timeout=%d',
+                           int(delta), timeout)
             if delta > timeout:
                 break
 
@@ -427,48 +964,60 @@ class Swarm(object):
 
         return len(instances)
 
-    def wait_terminated(self, instances, timeout):
-        """Wait until all instances are terminated.
+    def probe_ssh(self, ips, threads=None):
+        """Check concurrently which IP addresses accept SSH connections.
 
-        instances  a list of instance objects
-        timeout    timeout in seconds
+        ips      a list of IP addresses
+        threads  number of addresses probed at once (default all)
 
-        Returns a count of instances that can't terminate within timeout.
+        Only checks that the SSH port accepts connections.  Returns a
+        dictionary of IP -> True if the port is open.
         """
 
-        # prepare for timeout: get start time
-        start = time.time()
+        cmd = '%s -z -w %d %%s 22' % (self.Cmd_nc, self.SshTimeout)
 
-        # now wait until all terminated or timeout expired
-        check_ids = [i.instance_id for i in instances]
-        while True:
-            self.log.debug('wait_terminated: check_ids=%s' % str(check_ids))
-            next_check = []
-            data = self.client.describe_instances(InstanceIds=check_ids)
-            for instance in data['Reservations']:
-                for i in instance['Instances']:
-                    state = i['State']['Name']
-                    instance_id = i['InstanceId']
+        def probe(ip):
+            (status, _) = utils.run_cmd(cmd % ip, timeout=self.SshTimeout + 5)
+            return status == 0
 
-                    if state != 'terminated':
-                        next_check.append(instance_id)
-            check_ids = next_check
+        results = utils.parallel_map(probe, ips, threads or len(ips))
+        return dict((ip, r is True) for (ip, r) in zip(ips, results))
 
-            # finished?
-            if len(check_ids) == 0:
-                break
+    def wait_ssh_ready(self, instances, timeout):
+        """Wait until instances accept SSH, probing them concurrently.
 
-            # check for timeout
-            delta = time.time() - start
-            self.log.debug('wait_terminated: delta=%d, timeout=%d' % (int(delta), timeout))
-            if delta > timeout:
+        instances  list of instance objects to wait on
+        timeout    seconds to wait
+
+        Every instance still waiting is probed at once on each pass.
+        Returns a list of the instances that didn't accept SSH in time.
+        """
+
+        deadline = time.time() + timeout
+        pending = list(instances)
+        while True:
+            ips = [i.public_ip_address for i in pending if i.public_ip_address]
+            up = self.probe_ssh(ips) if ips else {}
+            pending = [i for i in pending if not up.get(i.public_ip_address, False)]
+            remaining = deadline - time.time()
+            self.log.debug('wait_ssh_ready: %d instances waiting, %ds left',
+                           len(pending), int(remaining))
+            if not pending or remaining <= 0:
                 break
+            time.sleep(min(self.ProbeLoopWait, remaining))
 
-            # wait a bit = don't flood system
-            time.sleep(self.TerminatedLoopWait)
+        return pending
 
-        # return number of non-terminated instances
-        return len(check_ids)
+    def wait_terminated(self, instances, timeout):
+        """Wait until all instances are terminated.
+
+        instances  a list of instance objects
+        timeout    timeout in seconds
+
+        Returns a count of instances that can't terminate within timeout.
+        """
+
+        return self.wait_state(instances, 'terminated', timeout)
 
     def get_status(self, instances):
         """Get general status of instances in list.
@@ -490,16 +1039,16 @@ class Swarm(object):
             for instance in data['Reservations']:
                 for i in instance['Instances']:
                     state = i['State']['Name']
-                    if 'PublicIpAddress' in i:
-                        public_ip = i['PublicIpAddress']
-                        name = ''
-                        t_list = i.get('Tags', [])
-                        for t in t_list:
-                            tag_name = t.get('Key', None)
-                            if tag_name == 'Name':
-                                name = t['Value']
+                    # stopped instances have no public IP
+                    public_ip = i.get('PublicIpAddress', '')
+                    name = ''
+                    t_list = i.get('Tags', [])
+                    for t in t_list:
+                        tag_name = t.get('Key', None)
+                        if tag_name == 'Name':
+                            name = t['Value']
 
-                        result.append((name, public_ip, state))
+                    result.append((name, public_ip, state))
 
             token = data.get('NextToken', None)
             if token is None:
@@ -516,7 +1065,7 @@ class Swarm(object):
         # ensure all machines are ACTIVE
         self.wait_active(instances, timeout)
 
-        self.log.info('wait_connect: Waiting on %d instances' % len(instances))
+        self.log.info('wait_connect: Waiting on %d instances', len(instances))
 
         # prepare for timeout: get start time
         start = time.time()
@@ -533,22 +1082,22 @@ class Swarm(object):
             for (x, server) in enumerate(instances):
                 if len(server.networks.items()) == 0:
                     # not ready yet
-                    self.log.debug("wait_connect: server %s has no IP yet"
-                                   % server.name)
+                    self.log.debug("wait_connect: server %s has no IP yet",
+                                   server.name)
                     break
                 ip = instance.public_ip_address
                 nc_cmd = cmd % ip
-                self.log.debug('wait_connect: doing: %s' % nc_cmd)
+                self.log.debug('wait_connect: doing: %s', nc_cmd)
                 (status, output) = commands.getstatusoutput(nc_cmd)
                 if status != 0:
-                    self.log.debug('wait_connect: server %s unable to connect'
-                                   % server.name)
+                    self.log.debug('wait_connect: server %s unable to connect',
+                                   server.name)
                     break
                 else:
                     sane_instances.append(server)
                     remove_index.append(x)
-                    self.log.debug('wait_connect: server %s connected!'
-                                   % server.name)
+                    self.log.debug('wait_connect: server %s connected!',
+                                   server.name)
 
             # remove instance_ids that have connected
             remove_index.sort(reverse=True) # remove higher numbers first
@@ -557,8 +1106,8 @@ class Swarm(object):
 
             # check for timeout
             delta = time.time() - start
-            self.log.debug('wait_connect: delta=%d, timeout=%d'
-                           % (int(delta), timeout))
+            self.log.debug('wait_connect: delta=%d, timeout=%d',
+                           int(delta), timeout)
             if delta > timeout:
                 break
 
@@ -567,30 +1116,172 @@ class Swarm(object):
 
         # delete the failed instances
         if instances:
-            self.log.info('wait_connect: %d instances failed - deleting'
-                          % len(instances))
-            self.log.critical('Would delete these instances, but chicken:\n%s'
-                              % str([s.name for s in instances]))
+            self.log.info('wait_connect: %d instances failed - deleting',
+                          len(instances))
+            self.log.critical('Would delete these instances, but chicken:\n%s',
+                              [s.name for s in instances])
 #            self.stop(instances)
 
         # return the connected instances
-        self.log.info('wait_connect: %d instances connected' % len(sane_instances))
+        self.log.info('wait_connect: %d instances connected', len(sane_instances))
         return self.refresh(sane_instances)
 
-    def reboot(self, instances):
-        """Soft reboot instances in list."""
+    def reboot(self, instances, **kwargs):
+        """Reboot instances, optionally waiting until they accept SSH.
+
+        instances  list of instance objects to reboot
+        wave       (keyword) number of instances rebooted at once (default all)
+        wait       (keyword) if True wait for each wave to accept SSH
+                   before rebooting the next
+        timeout    (keyword) seconds to wait for each wave
+        callback   (keyword) function called with each HostResult as
+                   each instance recovers (or doesn't)
+
+        Each wave is rebooted with as few AWS calls as possible.  If waiting,
+        returns a list of HostResult, status 0 and 'duration' the seconds
+        the instance took to accept SSH again, or status 1 if it didn't in
+        time.  If not waiting, returns an empty list.
+        """
+
+        wave = kwargs.get('wave', None) or len(instances)
+        wait = kwargs.get('wait', False)
+        timeout = kwargs.get('timeout', self.RebootTimeout)
+        callback = kwargs.get('callback', None)
 
-        for s in instances:
-            self.log('soft rebooting: %s' % str(s))
-            s.reboot(reboot_type=instances.REBOOT_SOFT)
+        result = []
+        for start in range(0, len(instances), wave):
+            batch = instances[start:start+wave]
+            ids = [i.instance_id for i in batch]
+            for first in range(0, len(ids), self.RebootChunk):
+                chunk = ids[first:first+self.RebootChunk]
+                self.log('rebooting: %s' % ', '.join(chunk))
+                self.api_limiter.wait()
+                self.client.reboot_instances(InstanceIds=chunk)
+            if wait:
+                result.extend(self.wait_rebooted(batch, timeout, callback))
+
+        return result
+
+    def reboot_hard(self, instances, **kwargs):
+        """Reboot instances in list.
+
+        EC2 has no separate hard reboot: an instance that doesn't shut down
+        cleanly within a few minutes is hard rebooted anyway.  Takes the
+        same keywords as reboot().
+        """
+
+        return self.reboot(instances, **kwargs)
 
+    def pause(self, instances, **kwargs):
+        """Stop instances, keeping their disks, so they can be resumed.
 
-    def reboot_hard(self, srvs):
-        """Hard reboot instances in list."""
+        instances  list of instance objects to stop
+        hibernate  (keyword) if True hibernate the instances, saving memory
+        wait       (keyword) if True wait until the instances are stopped
+        timeout    (keyword) seconds to wait
 
-        for s in srvs:
-            self.log('hard rebooting: %s' % str(s))
-            s.reboot(reboot_type=instances.REBOOT_HARD)
+        Only instances started with hibernation enabled can hibernate.
+        Returns a count of instances NOT stopped if waiting, else 0.
+        """
+
+        hibernate = kwargs.get('hibernate', False)
+        wait = kwargs.get('wait', False)
+        timeout = kwargs.get('timeout', self.PauseTimeout)
+
+        ids = [i.instance_id for i in instances]
+        for start in range(0, len(ids), self.StopStartChunk):
+            chunk = ids[start:start+self.StopStartChunk]
+            self.log('pausing: %s, hibernate=%s' % (', '.join(chunk), str(hibernate)))
+            self.api_limiter.wait()
+            self.client.stop_instances(InstanceIds=chunk, Hibernate=hibernate)
+
+        if wait and instances:
+            return self.wait_state(instances, 'stopped', timeout)
+        return 0
+
+    def resume(self, instances, **kwargs):
+        """Start paused (stopped) instances.
+
+        instances  list of instance objects to start
+        wait       (keyword) if True wait until the instances are running
+        timeout    (keyword) seconds to wait
+
+        Returns a tuple (count, instances) where 'count' is the number of
+        instances NOT running if waiting (else 0) and 'instances' is the
+        list of refreshed instances.  Instances get a new public IP address
+        when resumed.
+        """
+
+        wait = kwargs.get('wait', False)
+        timeout = kwargs.get('timeout', self.PauseTimeout)
+
+        ids = [i.instance_id for i in instances]
+        for start in range(0, len(ids), self.StopStartChunk):
+            chunk = ids[start:start+self.StopStartChunk]
+            self.log('resuming: %s' % ', '.join(chunk))
+            self.api_limiter.wait()
+            self.client.start_instances(InstanceIds=chunk)
+
+        if not instances:
+            return (0, [])
+
+        not_running = 0
+        if wait:
+            not_running = self.wait_state(instances, 'running', timeout)
+        return (not_running, list(self.ec2.instances.filter(InstanceIds=ids)))
+
+    def wait_rebooted(self, instances, timeout, callback=None):
+        """Wait until just rebooted instances accept SSH again.
+
+        instances  list of instance objects just rebooted
+        timeout    seconds to wait
+        callback   function called with each HostResult when known
+
+        All instances are probed together on each pass.  An instance is
+        ready when SSH connects after having failed, or after RebootGrace
+        seconds if it was never seen down.  Returns a list of HostResult,
+        status 0 and 'duration' the seconds until SSH connected, or status
+        1 if the instance wasn't ready in time.
+        """
+
+        start = time.time()
+        pending = dict((i.public_ip_address, i) for i in instances
+                       if i.public_ip_address)
+        down = set()
+        result = []
+
+        def deliver(hr):
+            result.append(hr)
+            if callback:
+                callback(hr)
+
+        # instances without a public IP can't be checked
+        for instance in instances:
+            if not instance.public_ip_address:
+                deliver(HostResult(instance, status=1, output='no public IP'))
+
+        while pending:
+            reachable = self.probe_ssh(pending.keys())
+            delta = time.time() - start
+            for (ip, ok) in reachable.items():
+                if not ok:
+                    down.add(ip)
+                elif ip in down or delta >= self.RebootGrace:
+                    instance = pending.pop(ip)
+                    self.log.debug('wait_rebooted: %s ready after %.1fs',
+                                   instance.instance_id, delta)
+                    deliver(HostResult(instance, status=0, duration=delta,
+                                       output='up after %.0fs' % delta))
+
+            if not pending or delta > timeout:
+                break
+            time.sleep(self.RebootLoopWait)
+
+        for instance in pending.values():
+            deliver(HostResult(instance, status=1, duration=timeout,
+                               output='no SSH after %ds' % timeout))
+
+        return result
 
 
     def filter(self, instances, *args):
@@ -645,122 +1336,500 @@ class Swarm(object):
         return result
 
 
-    def info(self, instances, *args):
-        """Return list of tuples of information about instances.
+    def info(self, instances, *args, **kwargs):
+        """Return list of information about instances.
 
         instances  list of instances
         args       tuple of info functions
+        callback   (keyword) if given, called with each result as it arrives
+                   and the results are not accumulated
+        threads    (keyword) number of instances queried at once
+                   (default NumOSThreads)
+        deadline   (keyword) seconds allowed for the whole operation
 
-        Returns a list of tuples of information, same order as functions.
-        For example, s.info(instances, hostname, ip) returns a list of
-        (hostname, ip), one for each server in the list.
+        Returns a list of HostResult objects, one for each instance.  The
+        .values attribute of each holds the info values in the same order as
+        the functions.  For example, s.info(instances, hostname, ip) returns
+        results with .values of [hostname, ip].
 
         Uses a thread pool to perform the operation.
         """
 
-        self.log.debug('info: %d instances' % len(instances))
+        callback = kwargs.get('callback', None)
+        threads = kwargs.get('threads', None)
+        end_time = self._end_time(kwargs.get('deadline', None))
+
+        self.log.debug('info: %d instances', len(instances))
         args_names = [f.func_name for f in args]
-        self.log.debug('info: args=%s' % str(args_names))
+        self.log.debug('info: args=%s', args_names)
 
-        return self._apply_threads(instances, *args)
+        return self._apply_threads(instances, *args, callback=callback,
+                                   threads=threads, end_time=end_time)
 
 
-    def copy(self, instances, src, dst, *args):
-        """Copy a file to each instance in the list.
+    def copy(self, instances, src, dst, *args, **kwargs):
+        """Copy files and/or directories to each instance in the list.
 
         instances  list of instances
-        src      path to a file to copy
-        dst      place on instance to copy file to
-        *args    callbacks to adorn each VM output
-                 (applied to each instance)
+        src        path to a file to copy, or a list of paths to copy
+        dst        place on instance to copy to
+        *args      callbacks to adorn each VM output
+                   (applied to each instance)
+        compress   (keyword) if True, gzip the tar stream (default False)
+        callback   (keyword) if given, called with each result as it arrives
+                   and the results are not accumulated
+        timeout    (keyword) seconds allowed for each instance (default none)
+        deadline   (keyword) seconds allowed for the whole copy, instances
+                   not finished are reported as timed out (default none)
+
+        Returns a list of HostResult objects.
+
+        A single plain file is copied with 'scp', so 'dst' may name the
+        remote file.  Anything else (several paths and/or directories) is
+        packed once into a local tar archive that is reused for every
+        instance and unpacked into the 'dst' directory over a single SSH
+        connection per instance.  Paths are shell-quoted, but a leading '~/'
+        in 'dst' still means the remote home directory.
 
         Copies in parallel.  Should need no throttling.
         """
 
-        # thread class - run a copy via SCP
-        class CopyThread(threading.Thread):
-            def __init__(self, instance, cmd, queue, args):
-                threading.Thread.__init__(self)
-                self.instance = instance
-                self.cmd = cmd
-                self.queue = queue
-                self.args = args
-
-            def run(self):
-                # execute the command, queue the result
-                adorn_list = []
-                for cb in args:
-                    adorn_list.append(cb(self.instance))
-                (status, output) = commands.getstatusoutput(self.cmd)
-                result = [output, status]
-                result.extend(adorn_list)
-                self.queue.put(result)
-
-        # queue where results are placed
-        result_queue = Queue.Queue()
-
-        # generate SCP command, pass to thread
-        cmd = ('scp -q -i %%s -o "ConnectTimeout %d" -o "BatchMode yes" '
-               '-o "CheckHostIP no" '
-               '-o "PreferredAuthentications publickey" '
-               '-o "StrictHostKeyChecking no" '
-               '%s ec2-user@%%s:%s' % (self.SshTimeout, src, dst))
-        for instance in instances:
+        compress = kwargs.get('compress', False)
+        callback = kwargs.get('callback', None)
+        timeout = kwargs.get('timeout', None)
+        deadline = kwargs.get('deadline', None)
+
+        self.check_keys(instances)
+
+        # a single plain file is just SCPed, everything else goes as a tar stream
+        sources = src
+        if isinstance(sources, basestring):
+            sources = [sources]
+        archive = None
+        if len(sources) == 1 and os.path.isfile(sources[0]):
+            cmd = ('scp -q %%s %s %s ec2-user@%%s:%s'
+                   % (self.SshOptions % self.SshTimeout,
+                      pipes.quote(sources[0]).replace('%', '%%'),
+                      pipes.quote(dst).replace('%', '%%')))
+        else:
+            archive = self._make_archive(sources, compress)
+            tar_opts = '-x'
+            if compress:
+                tar_opts = '-xz'
+            remote_dst = utils.remote_path(dst)
+            remote_cmd = ('mkdir -p %s && tar %s -f - -C %s'
+                          % (remote_dst, tar_opts, remote_dst))
+            cmd = ('ssh -q %%s %s ec2-user@%%s %s < %s 2>&1'
+                   % (self.SshOptions % self.SshTimeout,
+                      pipes.quote(remote_cmd).replace('%', '%%'),
+                      pipes.quote(archive).replace('%', '%%')))
+        self.log.debug('copy: cmd=%s', cmd)
+
+        def copy_func(instance):
+            """Function to perform the copy to one instance."""
+
+            key_opt = self.key_option(instance.key_name)
             ip = instance.public_ip_address
-            key_file = self.guess_key(instance.key_name)
-            copy_cmd = cmd % (key_file, ip)
-            CopyThread(instance, copy_cmd, result_queue, args).start()
+            return self._ssh(cmd % (key_opt, ip), timeout=timeout)
+
+        # one thread per instance, copies don't need throttling
+        try:
+            result = self._apply_threads(instances, *args, action=copy_func,
+                                         threads=len(instances),
+                                         callback=callback,
+                                         end_time=self._end_time(deadline))
+        finally:
+            if archive is not None:
+                os.remove(archive)
 
-        # get results and build return string
-        result = []
-        while threading.active_count() > 1 or not result_queue.empty():
-            while not result_queue.empty():
-                result_tuple = result_queue.get()
-                result.append(result_tuple)
-            time.sleep(1)
+        return result
+
+    def _make_archive(self, sources, compress=False):
+        """Pack files and directories into a local temporary tar file.
+
+        sources   list of paths to files and/or directories
+        compress  if True the archive is gzipped
+
+        Each source is stored under its basename, so unpacking the archive
+        in a directory has the same effect as copying every source there.
+        Returns the path to the archive, which the caller must remove.
+        """
+
+        mode = 'w'
+        suffix = '.tar'
+        if compress:
+            mode = 'w:gz'
+            suffix = '.tar.gz'
+
+        (fd, path) = tempfile.mkstemp(prefix='swarm_copy_', suffix=suffix)
+        os.close(fd)
+        tar = tarfile.open(path, mode)
+        try:
+            for source in sources:
+                if not os.path.exists(source):
+                    raise Exception("Can't find copy source '%s'" % source)
+                arcname = os.path.basename(os.path.normpath(source))
+                tar.add(source, arcname=arcname)
+        except:
+            tar.close()
+            os.remove(path)
+            raise
+        tar.close()
+
+        self.log.debug('_make_archive: %d sources packed into %s (%d bytes)',
+                       len(sources), path, os.path.getsize(path))
+
+        return path
+
+
+    def fetch(self, instances, src, dst, *args, **kwargs):
+        """Fetch files from each instance in the list.
+
+        instances  list of instances
+        src        remote path to fetch, or a list of remote paths
+                   (paths are quoted, but the glob tokens '*', '?' and
+                   simple '[...]' ranges are left for the remote shell
+                   to expand, as is a leading '~/')
+        dst        local directory, each instance's files go in <dst>/<name>/
+        *args      callbacks to adorn each VM output
+                   (applied to each instance)
+        compress   (keyword) if True (default) compress the data in transit
+        merge      (keyword) if True also merge fetched files line by line
+                   into <dst>/_merged/
+        threads    (keyword) number of concurrent fetches
+                   (default NumOSThreads)
+
+        Each instance streams a tar archive of the remote paths over one SSH
+        connection straight into a local 'tar' unpacking in <dst>/<name>.
+
+        Returns a list of HostResult objects.
+        """
+
+        compress = kwargs.get('compress', True)
+        merge = kwargs.get('merge', False)
+        threads = kwargs.get('threads', None)
+
+        sources = src
+        if isinstance(sources, basestring):
+            sources = [sources]
+
+        tar_z = ''
+        if compress:
+            tar_z = 'z'
+        remote_cmd = ('tar -c%sf - %s'
+                      % (tar_z, ' '.join(utils.remote_path(p, globs=True)
+                                         for p in sources)))
+
+        names = []
+
+        def fetch_func(instance):
+            """Function to fetch files from one instance."""
+
+            name = utils.get_instance_name(instance) or instance.instance_id
+            names.append(name)
+            host_dir = os.path.join(dst, name)
+            if not os.path.isdir(host_dir):
+                os.makedirs(host_dir)
+
+            key_opt = self.key_option(instance.key_name)
+            ip = instance.public_ip_address
+            ssh = ('ssh -q %s %s ec2-user@%s %s'
+                   % (key_opt, self.SshOptions % self.SshTimeout, ip,
+                      pipes.quote(remote_cmd)))
+            self.log.debug('fetch: %s -> %s', ssh, host_dir)
+
+            # stream remote tar output straight into a local tar, ssh stderr
+            # goes to a temporary file so a chatty remote tar can't block
+            # on a full pipe while we wait for the local tar
+            with tempfile.TemporaryFile() as err_fd:
+                ssh_proc = subprocess.Popen(ssh, shell=True,
+                                            stdout=subprocess.PIPE,
+                                            stderr=err_fd)
+                tar_proc = subprocess.Popen(['tar', '-x%sf' % tar_z, '-',
+                                             '-C', host_dir],
+                                            stdin=ssh_proc.stdout,
+                                            stdout=subprocess.PIPE,
+                                            stderr=subprocess.STDOUT)
+                ssh_proc.stdout.close()     # tar owns the pipe now
+                tar_output = tar_proc.communicate()[0]
+                ssh_status = ssh_proc.wait()
+                err_fd.seek(0)
+                ssh_output = err_fd.read()
+
+            # GNU tar complains about stripping '/' from absolute paths
+            lines = [l for l in (ssh_output + tar_output).splitlines()
+                     if 'Removing leading' not in l]
+            status = ssh_status or tar_proc.returncode
+
+            return (status, '\n'.join(lines))
+
+        self.check_keys(instances)
+        result = self._apply_threads(instances, *args, action=fetch_func,
+                                     threads=threads)
+
+        if merge:
+            self._merge_fetched(dst, sorted(names))
 
         return result
 
+    def _merge_fetched(self, dst, names):
+        """Merge fetched files from each instance into one file each.
+
+        dst    the local directory the files were fetched into
+        names  list of per-instance subdirectory names in 'dst'
+
+        Every text file found under any <dst>/<name>/ is appended, line by
+        line and prefixed with '<name>: ', to <dst>/_merged/<relative path>.
+        Files that look binary are skipped.
+        """
 
-    def cmd(self, instances, cmd, *args):
+        merge_dir = os.path.join(dst, '_merged')
+        self.log.debug('_merge_fetched: merging %d instances into %s',
+                       len(names), merge_dir)
+
+        # gather the set of relative paths fetched from any instance
+        rel_paths = set()
+        for name in names:
+            host_dir = os.path.join(dst, name)
+            for (dirpath, _, filenames) in os.walk(host_dir):
+                for f in filenames:
+                    path = os.path.join(dirpath, f)
+                    rel_paths.add(os.path.relpath(path, host_dir))
+
+        for rel_path in sorted(rel_paths):
+            merged_path = os.path.join(merge_dir, rel_path)
+            merged_dir = os.path.dirname(merged_path)
+            if not os.path.isdir(merged_dir):
+                os.makedirs(merged_dir)
+            with open(merged_path, 'wb') as out_fd:
+                for name in names:
+                    path = os.path.join(dst, name, rel_path)
+                    if not os.path.isfile(path):
+                        continue
+                    with open(path, 'rb') as in_fd:
+                        if '\0' in in_fd.read(1024):
+                            self.log.debug('_merge_fetched: skipping binary %s',
+                                           path)
+                            continue
+                        in_fd.seek(0)
+                        for line in in_fd:
+                            if not line.endswith('\n'):
+                                line += '\n'
+                            out_fd.write('%s: %s' % (name, line))
+
+    def cmd(self, instances, cmd, *args, **kwargs):
         """Execute a command on each instance in the list.
 
         instances  list of instances
         cmd      command to execute on each instance
         *args    callbacks to adorn each VM output
                  (applied to each instance)
-
-        Returns list of iterables:
-           (output, cb1, cb2, ...)
-
-        Uses a thread pool to perform the operation.
+        callback (keyword) if given, called with each result as it arrives
+                 and the results are not accumulated
+        batch_size   (keyword) if given, run in waves of this many instances
+        pause        (keyword) seconds to pause between waves (default 0)
+        max_failures (keyword) stop starting new waves once more than this
+                     many instances have failed (default no limit)
+        timeout      (keyword) seconds allowed for each instance, including
+                     retries, before the command is killed (default none)
+        deadline     (keyword) seconds allowed for the whole run, instances
+                     not finished are reported as timed out (default none)
+
+        Returns a list of HostResult objects holding the exit status and
+        output of the command on each instance.  Instances that time out
+        have a status of utils.TimeoutStatus.
+
+        Uses a thread pool to perform the operation.  When running in waves
+        each wave is run fully in parallel.
         """
 
-        self.log.debug('cmd: %d instances' % len(instances))
+        self.log.debug('cmd: %d instances', len(instances))
         args_names = [f.func_name for f in args]
-        self.log.debug('cmd: args=%s' % str(args_names))
+        self.log.debug('cmd: args=%s', args_names)
+
+        timeout = kwargs.get('timeout', None)
 
         def exec_func(instance):
             """Function to perform command on instance."""
 
-            key_file = self.guess_key(instance.key_name)
+            key_opt = self.key_option(instance.key_name)
             ip = instance.public_ip_address
 
-            ssh = ('ssh -q -i %s -o "ConnectTimeout %d" -o "BatchMode yes" '
-                   '-o "CheckHostIP no" '
-                   '-o "PreferredAuthentications publickey" '
-                   '-o "StrictHostKeyChecking no" '
-                   'ec2-user@%s "%s" 2>&1' % (key_file, self.SshTimeout, ip, cmd))
-            self.log.debug('SSH cmd: %s' % ssh)
-            (status, output) = commands.getstatusoutput(ssh)
+            ssh = ('ssh -q %s %s ec2-user@%s "%s" 2>&1'
+                   % (key_opt, self.SshOptions % self.SshTimeout, ip, cmd))
+            self.log.debug('SSH cmd: %s', ssh)
+
+            return self._ssh(ssh, timeout=timeout)
 
-            return (status, output)
+        result = self._run_action(instances, exec_func, *args, **kwargs)
+        self.log.debug('cmd: result=%s', result)
 
-        enhanced_args = [exec_func]
-        enhanced_args.extend(args)
+        return result
+
+    def run_script(self, instances, script, *args, **kwargs):
+        """Run a local script on each instance in the list.
+
+        instances    list of instances
+        script       path to the local script file
+        *args        callbacks to adorn each VM output
+                     (applied to each instance)
+        script_args  (keyword) list of arguments passed to the script
+        env          (keyword) dictionary of environment variables to set
+        interpreter  (keyword) remote program that runs the script
+                     (default 'bash')
 
-        result = self._apply_threads(instances, *enhanced_args)
-        self.log.debug('cmd: result=%s' % str(result))
+        The other keywords are as for cmd().
+
+        The script is read once and streamed to the interpreter's stdin over
+        a single SSH connection per instance, so no file is left on the
+        instance.  Arguments and environment values are shell-quoted.
+
+        Returns a list of HostResult objects, as for cmd().  Raises
+        ValueError if an environment variable name isn't a valid name.
+        """
+
+        script_args = kwargs.get('script_args', None) or []
+        env = kwargs.get('env', None) or {}
+        interpreter = kwargs.get('interpreter', None) or 'bash'
+        timeout = kwargs.get('timeout', None)
+
+        bad_names = sorted(n for n in env if not self.EnvNameRE.match(n))
+        if bad_names:
+            raise ValueError('Bad environment variable names: %s'
+                             % ', '.join(repr(n) for n in bad_names))
+
+        with open(script, 'rb') as fd:
+            script_text = fd.read()
+
+        # build the remote command: env VAR=value ... <interpreter> <args>
+        remote = []
+        if env:
+            remote.append('env')
+            for (name, value) in sorted(env.items()):
+                remote.append('%s=%s' % (name, pipes.quote(value)))
+        remote.append(interpreter)
+        if os.path.basename(interpreter) in self.ShellInterpreters:
+            remote.extend(['-s', '--'])
+        else:
+            remote.append('-')
+        remote.extend([pipes.quote(a) for a in script_args])
+        remote = ' '.join(remote)
+
+        self.log.debug('run_script: %d instances, script=%s (%d bytes), '
+                       'remote=%s', len(instances), script, len(script_text),
+                       remote)
+
+        def script_func(instance):
+            """Function to run the script on an instance."""
+
+            key_opt = self.key_option(instance.key_name)
+            ip = instance.public_ip_address
+
+            ssh = ('ssh -q %s %s ec2-user@%s %s'
+                   % (key_opt, self.SshOptions % self.SshTimeout, ip,
+                      pipes.quote(remote)))
+
+            return self._ssh(ssh, timeout=timeout, stdin=script_text)
+
+        return self._run_action(instances, script_func, *args, **kwargs)
+
+    def _run_action(self, instances, action, *args, **kwargs):
+        """Run an action over instances, with the cmd() keyword options.
+
+        instances  list of instances
+        action     function performing the operation on an instance,
+                   returns a tuple (status, output)
+        *args      callbacks to adorn each VM output
+
+        The keywords 'callback', 'batch_size', 'pause', 'max_failures' and
+        'deadline' are as for cmd(), any others are ignored.  Runs in waves
+        only if a batch size or failure budget is given.
+
+        Returns a list of HostResult objects.
+        """
+
+        callback = kwargs.get('callback', None)
+        batch_size = kwargs.get('batch_size', None)
+        pause = kwargs.get('pause', 0)
+        max_failures = kwargs.get('max_failures', None)
+        end_time = self._end_time(kwargs.get('deadline', None))
+
+        self.check_keys(instances)
+
+        if batch_size is None and max_failures is None:
+            return self._apply_threads(instances, *args, action=action,
+                                       callback=callback, end_time=end_time)
+
+        return self._apply_waves(instances, *args, action=action,
+                                 callback=callback,
+                                 batch_size=batch_size, pause=pause,
+                                 max_failures=max_failures,
+                                 end_time=end_time)
+
+    def _apply_waves(self, instances, *args, **kwargs):
+        """Evaluate an action over 'instances' in waves.
+
+        instances     a list of instance objects
+        args          tuple of info callbacks
+        action        (keyword) function performing the operation on an
+                      instance, returns a tuple (status, output)
+        callback      (keyword) if given, each result is passed to this
+                      function as it arrives instead of being returned
+        batch_size    (keyword) number of instances in each wave
+                      (default all instances in one wave)
+        pause         (keyword) seconds to pause between waves (default 0)
+        max_failures  (keyword) once more than this many instances have a
+                      non-zero status no more waves are started
+                      (default no limit)
+        end_time      (keyword) absolute time.time() by which all waves must
+                      finish, passed to _apply_threads() (default none)
+
+        Each wave is run fully in parallel.  Instances not processed
+        because the failure budget was exceeded get a HostResult with a
+        status of None.  Returns a list of HostResult objects.
+        """
+
+        action = kwargs.get('action', None)
+        callback = kwargs.get('callback', None)
+        batch_size = kwargs.get('batch_size', None) or len(instances) or 1
+        pause = kwargs.get('pause', 0)
+        max_failures = kwargs.get('max_failures', None)
+        end_time = kwargs.get('end_time', None)
+
+        result = []
+        failures = [0]      # a list so the closure can update it
+
+        def collect(host_result):
+            if host_result.status != 0:
+                failures[0] += 1
+            if callback:
+                callback(host_result)
+            else:
+                result.append(host_result)
+
+        waves = [instances[i:i+batch_size]
+                 for i in range(0, len(instances), batch_size)]
+        for (num, wave) in enumerate(waves):
+            self.log.info('_apply_waves: wave %d/%d, %d instances',
+                          num+1, len(waves), len(wave))
+            self._apply_threads(wave, *args, action=action,
+                                threads=len(wave), callback=collect,
+                                end_time=end_time)
+
+            if max_failures is not None and failures[0] > max_failures:
+                skipped = [i for w in waves[num+1:] for i in w]
+                self.log.warn('_apply_waves: %d failures exceeds budget of %d, '
+                              'skipping %d instances',
+                              failures[0], max_failures, len(skipped))
+                for instance in skipped:
+                    collect(HostResult(instance,
+                                       output='Skipped, failure budget exceeded'))
+                break
+
+            if pause and num < len(waves) - 1:
+                if end_time is not None:
+                    pause = min(pause, max(end_time - time.time(), 0))
+                time.sleep(pause)
 
         return result
 
@@ -779,10 +1848,10 @@ class Swarm(object):
 
 
     def info_flavour(self):
-        """Given a instance, return flavor index."""
+        """Given a instance, return instance type string."""
 
         def flavour_info(instance):
-            return int(instance.flavor['id'])
+            return instance.instance_type
 
         return flavour_info
 
@@ -791,41 +1860,106 @@ class Swarm(object):
         """Given a instance, return key name."""
 
         def key_info(instance):
-            return int(instance.flavor['id'])
+            return instance.key_name
 
         return key_info
 
 
     def info_ncpu(self):
-        """Given a instance, return number of CPUs."""
+        """Given a instance, return number of CPUs.
+
+        The number comes from the instance type catalog, None if the type
+        isn't in the catalog.
+        """
 
         def ncpu_info(instance):
-            return self.flavour2ncpu[int(instance.flavor['id'])]
+            return catalog.ncpu(instance.instance_type)
 
         return ncpu_info
 
 
     def info_hostname(self):
-        """Given a instance, return hostname string."""
+        """Given a instance, return hostname string.
 
-        def hostname_info(instance):
-            # have to ssh to instance and run 'hostname' command
-            ip = instance.public_ip_address
-            key = instance.key_name
+        This is a remote fact callback, see info_fact().
+        """
+
+        return self.info_fact('hostname', 'hostname')
+
+
+    def info_ssh(self):
+        """Given a instance, return True if we can SSH to it.
+
+        This is a remote fact callback, see info_fact().
+        """
+
+        return self.info_fact('ssh', 'echo ok', lambda value: value == 'ok')
+
+
+    def info_kernel(self):
+        """Given a instance, return the kernel release string.
 
-            # get path to key file - guess from key name
-            key_file = self.guess_key(key)
-            options = ('-o "ConnectTimeout %d" -o "BatchMode yes" '
-                       '-o "CheckHostIP no" '
-                       '-o "PreferredAuthentications publickey" '
-                       '-o "StrictHostKeyChecking no"' % self.SshTimeout)
-            cmd = ('ssh -q -i %s %s ec2-user@%s hostname'
-                   % (key_file, options, ip))
-            (status, output) = commands.getstatusoutput(cmd)
+        This is a remote fact callback, see info_fact().
+        """
+
+        return self.info_fact('kernel', 'uname -r')
+
+
+    def info_uptime(self):
+        """Given a instance, return the uptime in seconds (None if unknown).
+
+        This is a remote fact callback, see info_fact().
+        """
+
+        def convert(value):
+            try:
+                return float(value.split()[0])
+            except (IndexError, ValueError):
+                return None
+
+        return self.info_fact('uptime', 'cat /proc/uptime', convert)
 
-            return output
 
-        return hostname_info
+    def info_disk_free(self, path='/'):
+        """Given a instance, return free KB on the filesystem holding 'path'.
+
+        Returns None if unknown.  This is a remote fact callback, see
+        info_fact().
+        """
+
+        def convert(value):
+            try:
+                return int(value.split('\n')[-1].split()[3])
+            except (IndexError, ValueError):
+                return None
+
+        return self.info_fact('disk_free:%s' % path,
+                              'df -Pk %s' % pipes.quote(path), convert)
+
+
+    def info_fact(self, name, command, convert=None):
+        """Return a callback giving the output of a remote command.
+
+        name     the name of the fact
+        command  the shell command that produces the fact on the instance
+        convert  optional function to convert the fact string to a value
+
+        The callback has a .facts attribute declaring the remote facts it
+        needs.  All the facts needed by the callbacks of one operation are
+        gathered with a single SSH connection per instance, see
+        _gather_facts().
+        """
+
+        def fact_info(instance, facts):
+            value = facts.get(name, '')
+            if convert:
+                return convert(value)
+            return value
+
+        fact_info.facts = {name: command}
+        fact_info.func_name = '%s_info' % name
+
+        return fact_info
 
 
     def info_ip(self):
@@ -838,43 +1972,48 @@ class Swarm(object):
         return ip_info
 
 
-    def info_classify(self):
-        """Given a instance, return classification string."""
+    def info_classify(self, logs=None):
+        """Given a instance, return classification string.
+
+        logs  dictionary of instance ID -> ConsoleLog from console_logs(),
+              logs not in it are fetched one instance at a time
+
+        Prefetch the logs of many instances with console_logs(), which
+        fetches them in one rate-limited batch and updates the log index
+        once.
+        """
 
-        # string in log when machine restarts
-        RestartString = "Linux version"
+        logs = logs or {}
 
         def classify_info(instance):
             """Given a instance, get console log and classify health."""
 
             # get complete console log for the instance
-            error = False
-            for _ in range(5):
-                try:
-                    console = instance.get_console_output() #.output
-                except exceptions.BadRequest:
-                    console = 'Bad request?'
-                    error = True
-                except TypeError, e:
-                    console = 'AWS got TypeError: %s' % str(e)
-                    error = True
-                    break
-                else:
-                    error = False
-                    break
-            if error:
-                return console
-
-            # ensure we have only log since latest boot
-            while RestartString in console:
-                index = console.index(RestartString)
-                console = console[index+1:]
+            console_log = logs.get(instance.instance_id, None)
+            if console_log is None:
+                console_log = self.console.get(instance.instance_id)
+            if console_log.error:
+                return 'AWS error: %s' % console_log.error
+            console = console_log.output
 
-            # classify the VM from the log contents
-            return classify.classify(console)
+            # classify the VM from the log since the latest boot
+            return classify.classify(classify.last_boot(console))
 
         return classify_info
 
+
+    def console_logs(self, instances, threads=None):
+        """Get the console logs of many instances concurrently.
+
+        instances  a list of instance objects
+        threads    number of concurrent fetches
+
+        Logs are cached locally, see the consolelog module.  Returns a
+        dictionary of instance ID -> consolelog.ConsoleLog.
+        """
+
+        return self.console.fetch([i.instance_id for i in instances], threads)
+
     ##########
     # Filters
     ##########
@@ -900,9 +2039,11 @@ class Swarm(object):
     def filter_flavour(self, flavour):
         """Return filter for instance flavour."""
 
-        flavour_id = self.str2flavour[flavour]
+        if catalog.lookup(flavour) is None:
+            self.log.warn("Flavour '%s' isn't in the instance type catalog",
+                          flavour)
 
-        return lambda instance: (int(instance.flavor['id']) == flavour_id)
+        return lambda instance: (instance.instance_type == flavour)
 
 
     def filter_image(self, image):
@@ -910,7 +2051,7 @@ class Swarm(object):
 
         image = self.ensure_image_id(image)
 
-        return lambda instance: (instance.image['id'] == image)
+        return lambda instance: (instance.image_id == image)
 
     ##########
     # utility/debug functions
@@ -934,42 +2075,61 @@ class Swarm(object):
 
 
     def dump_instance(self, instance):
-        self.log('instance:\n%s' % utils.obj_dump(instance))
+        if self.log.is_enabled(log.Log.DEBUG):
+            self.log('instance:\n%s' % utils.obj_dump(instance))
 
 
     def guess_key(self, key):
-        """Try to guess the key filename from key name."""
-
-        self.log.debug('guess_key: key=%s, .ssh_dir=%s' % (key, self.ssh_dir))
-        key_file = None
-        for f in os.listdir(self.ssh_dir):
-            path = os.path.join(self.ssh_dir, f)
-            if os.path.isfile(path):
-                filename = os.path.basename(f)
-                if filename == key:
-                    key_file = path
-                    break
-                (prefix, ext) = os.path.splitext(filename)
-                if prefix == key and key_file is None:
-                    key_file = path
-                    break
+        """Try to guess the key filename from key name.
 
-        if key_file is None:
-            msg = ("Can't find key file matching '%s'" % key)
-            raise Exception(msg)
+        Returns the key file path, or None if the key is held by ssh-agent.
+        """
 
-        self.log.debug('guess_key: key %s -> key_file %s' % (key, str(key_file)))
+        try:
+            key_file = self.keys.lookup(key)
+        except KeyError as e:
+            raise Exception(e.args[0])
+
+        self.log.debug('guess_key: key %s -> key_file %s', key, key_file)
 
         return key_file
 
+    def key_option(self, key):
+        """Return the SSH/SCP identity option string for a key name.
+
+        The result is '' if the key is held by ssh-agent.
+        """
+
+        key_file = self.guess_key(key)
+        if key_file is None:
+            return ''
+        return '-i %s' % key_file
+
+    def check_keys(self, instances):
+        """Check that the keys for all instances are available.
+
+        Raises an exception naming any missing keys, so a fleet operation
+        fails before it starts rather than in the first worker thread.
+        """
+
+        try:
+            self.keys.check(set(i.key_name for i in instances))
+        except KeyError as e:
+            self.log.error(e.args[0])
+            raise Exception(e.args[0])
+
 
     def flavour_type_to_index(self, type_str):
-        """Convert a flavour type string to index."""
+        """Convert a flavour type string to index.
+
+        The index is the position of the type in the sorted catalog.
+        """
 
-        result = self.str2flavour.get(type_str, None)
-        if result is None:
+        try:
+            result = catalog.names().index(type_str)
+        except ValueError:
             msg = ("Type '%s' not found: type_str=%s (%s)"
-                   % (str(type_str), type(type_str)))
+                   % (str(type_str), str(type_str), type(type_str)))
             raise Exception(msg)
 
         return result
@@ -978,8 +2138,10 @@ class Swarm(object):
     def flavour_index_to_type(self, index):
         """Convert a flavour index to the type string."""
 
-        result = self.flavour2str.get(int(index), None)
-        if result is None:
+        names = catalog.names()
+        try:
+            result = names[int(index)]
+        except (IndexError, ValueError):
             msg = ("Index not found: index=%s (%s)"
                    % (str(index), type(index)))
             raise Exception(msg)
@@ -990,102 +2152,315 @@ class Swarm(object):
     def flavour_index_to_ncpu(self, index):
         """Convert a flavour index to number of cpus."""
 
-        result = self.flavour2ncpu.get(index, None)
-        if result is None:
-            msg = ("Index '%s' not found: index=%s (%s)"
-                   % (str(index), type(index)))
-            raise Exception(msg)
+        return catalog.ncpu(self.flavour_index_to_type(index))
 
-        return result
+
+    def refresh_catalog(self):
+        """Refresh the instance type catalog from AWS.
+
+        Returns the number of instance types in the refreshed catalog.
+        """
+
+        num = catalog.refresh(self.client)
+        self.log('Instance type catalog refreshed, %d types' % num)
+
+        return num
 
 
     def ensure_image_id(self, image):
-        """Ensure we have an image ID, convert name to ID if necessary."""
-
-        # check if image given is NAME, convert to ID
-        images = self.client.images.list()
-        found = False
-        for i in images:
-            if i.human_id == image:
-                if found:
-                    msg = ("Sorry, image name '%s' found twice in image list"
-                           % image)
-                    self.log.error(msg)
-                    raise Exception(msg)
-                found = True
-                image = i.id
-        # now check that image actually exists in the image list
-        found = False
-        for i in images:
-            if i.id == image:
-                found = True
-                break
+        """Ensure we have an image ID, convert name to ID if necessary.
+
+        image  an image ID ('ami-...') or image name
+
+        A name is looked up among the images owned by ImageOwners.  The
+        resolved ID is kept in a persistent cache for ImageCacheTTL seconds,
+        so repeated lookups don't call AWS.  Raises Exception if the image
+        isn't found, or a name matches more than one image.
+        """
+
+        images = cache.get_cache('images', ttl=self.ImageCacheTTL)
+        cache_key = '%s:%s' % (self.region_name, image)
+        image_id = images.get(cache_key)
+        if image_id is not None:
+            return image_id
+
+        if image.startswith('ami-'):
+            response = self.client.describe_images(
+                           Filters=[{'Name': 'image-id', 'Values': [image]}])
+        else:
+            response = self.client.describe_images(
+                           Owners=self.ImageOwners,
+                           Filters=[{'Name': 'name', 'Values': [image]}])
+        found = [i['ImageId'] for i in response['Images']]
+
         if not found:
-            msg = ("Sorry, image ID '%s' not found in image list"
-                   % image)
+            msg = "Sorry, image '%s' not found" % image
+            self.log.error(msg)
+            raise Exception(msg)
+        if len(found) > 1:
+            msg = ("Sorry, image name '%s' matches %d images: %s"
+                   % (image, len(found), ', '.join(sorted(found))))
             self.log.error(msg)
             raise Exception(msg)
 
-        return image
+        image_id = found[0]
+        images.put(cache_key, image_id)
+        self.log("Image '%s' resolved to %s" % (image, image_id))
+
+        return image_id
 
 
-    def _apply_threads(self, instances, *args):
+    def _apply_threads(self, instances, *args, **kwargs):
         """Evaluate all 'args' functions over 'instances'.
 
         instances  a list of instance objects
-        args     tuple of operations
-
-        Use a pool of 'NumOSThreads' threads to do it.
+        args       tuple of info callbacks
+        action     (keyword) function performing the operation on an instance,
+                   returns a tuple (status, output)
+        threads    (keyword) size of the thread pool (default NumOSThreads)
+        callback   (keyword) if given, each result is passed to this function
+                   as it arrives instead of being returned in the list
+        end_time   (keyword) absolute time.time() after which we stop waiting,
+                   kill any running commands and report instances not
+                   finished as timed out (default wait forever)
+
+        Use a pool of 'threads' threads to do it.  Returns a list of
+        HostResult objects, in completion order.
         """
 
-        self.log.debug('_apply_threads: NumOSThreads=%d' % self.NumOSThreads)
-        self.log.debug('_apply_threads: %d instances' % len(instances))
-        self.log.debug('_apply_threads: args=%s' % str(args))
+        action = kwargs.get('action', None)
+        num_threads = kwargs.get('threads', None) or self.NumOSThreads
+        callback = kwargs.get('callback', None)
+        end_time = kwargs.get('end_time', None)
+
+        args = self._bind_facts(args)
+
+        self.log.debug('_apply_threads: num_threads=%d', num_threads)
+        self.log.debug('_apply_threads: %d instances', len(instances))
+        self.log.debug('_apply_threads: action=%s, args=%s',
+                       action, args)
+
+        log = self.log
+        stop = threading.Event()
+        running = utils.CommandGroup()
 
         # the actual thread code
         class doitThread(threading.Thread):
-            def __init__(self, input_q, output_q, args):
+            def __init__(self, input_q, output_q, action, args):
                 threading.Thread.__init__(self)
+                self.daemon = True      # don't let stragglers block exit
                 self.input_q = input_q
                 self.output_q = output_q
+                self.action = action
                 self.args = args
 
             def run(self):
                 # read a instance off the input queue and process it
-                # if the queue is empty, quit thread
-                while not input_q.empty():
+                # if the queue is empty or we are stopped, quit thread
+                running.join()
+                while not stop.is_set():
                     try:
-                        instance = input_q.get_nowait()
+                        instance = self.input_q.get_nowait()
                     except Queue.Empty:
                         break
 
-                    result = []
-                    for func in self.args:
-                        result.append(func(instance))
+                    start = time.time()
+                    (status, output) = (None, None)
+                    try:
+                        if self.action:
+                            (status, output) = self.action(instance)
+                        values = [func(instance) for func in self.args]
+                    except Exception as e:
+                        log.error('_apply_threads: instance %s failed: %s',
+                                  instance.instance_id, traceback.format_exc())
+                        (status, output, values) = (1, 'Error: %s' % str(e), [])
+                    result = HostResult(instance, status=status, output=output,
+                                        duration=time.time()-start,
+                                        values=values)
                     self.output_q.put(result)
 
+        def deliver(host_result):
+            """Pass a result to the callback or save it."""
+
+            self.log.debug('info: result=%s', host_result)
+            if callback:
+                callback(host_result)
+            else:
+                result.append(host_result)
+
         # create input/output queue, fill input queue
         input_q = Queue.Queue()
         output_q = Queue.Queue()
 
+        pending = {}
         for instance in instances:
             input_q.put(instance)
+            pending[instance.instance_id] = instance
 
         # start worker threads
-        for i in xrange(self.NumOSThreads):
-            doitThread(input_q, output_q, args).start()
+        workers = []
+        if end_time is None or end_time > time.time():
+            workers = [doitThread(input_q, output_q, action, args)
+                       for _ in xrange(min(num_threads, len(instances)))]
+        for w in workers:
+            w.start()
 
         # pick up results as they are posted to the output queue
         result = []
-        while threading.active_count() > 1 or not output_q.empty():
-            while not output_q.empty():
-                result_tuple = output_q.get()
-                result.append(result_tuple)
-                self.log.debug('info: result=%s' % str(result_tuple))
-            time.sleep(1)
+        while pending:
+            wait = 1.0
+            if end_time is not None:
+                wait = min(wait, end_time - time.time())
+                if wait <= 0:
+                    break
+            try:
+                host_result = output_q.get(timeout=wait)
+            except Queue.Empty:
+                if not any(w.is_alive() for w in workers) and output_q.empty():
+                    break
+                continue
+            pending.pop(host_result.instance_id, None)
+            deliver(host_result)
+
+        # anything still pending ran out of time
+        if pending:
+            stop.set()
+            running.kill()
+            self.log.warn('_apply_threads: %d instances timed out', len(pending))
+            for instance in pending.values():
+                deliver(HostResult(instance, status=utils.TimeoutStatus,
+                                   output='Timed out, run deadline exceeded'))
 
         return result
 
+    def _bind_facts(self, args):
+        """Make remote fact callbacks callable with just an instance.
+
+        args  tuple of info callbacks, some may have a .facts attribute
+
+        All facts needed by the callbacks are merged and gathered with one
+        SSH connection per instance, the first time any fact callback is
+        called for that instance.  Returns a list of callbacks.
+        """
+
+        fact_cmds = {}
+        for func in args:
+            fact_cmds.update(getattr(func, 'facts', {}))
+        if not fact_cmds:
+            return list(args)
+
+        # each worker thread handles one instance at a time
+        local = threading.local()
+
+        def facts_for(instance):
+            if getattr(local, 'instance_id', None) != instance.instance_id:
+                local.facts = self._gather_facts(instance, fact_cmds)
+                local.instance_id = instance.instance_id
+            return local.facts
+
+        def bind(func):
+            return lambda instance: func(instance, facts_for(instance))
+
+        return [bind(f) if hasattr(f, 'facts') else f for f in args]
+
+    def _gather_facts(self, instance, fact_cmds):
+        """Gather remote facts from an instance with one SSH connection.
+
+        instance   the instance to query
+        fact_cmds  dictionary mapping fact name to shell command
+
+        The commands are merged into one script, each command's output
+        preceded by a marker line, which is run by 'bash -s' on the instance.
+        Returns a dictionary mapping fact name to output string.  Facts
+        that couldn't be gathered have a value of ''.
+        """
+
+        script = []
+        for (name, command) in sorted(fact_cmds.items()):
+            script.append("echo '%s'" % (self.FactMarker % name))
+            script.append('(%s) 2>&1' % command)
+        script = '\n'.join(script) + '\n'
+
+        ssh = ('ssh -q %s %s ec2-user@%s "bash -s"'
+               % (self.key_option(instance.key_name),
+                  self.SshOptions % self.SshTimeout,
+                  instance.public_ip_address))
+        (status, output) = self._ssh(ssh, timeout=self.InfoTimeout, stdin=script)
+        self.log.debug('_gather_facts: %s status=%d, %d facts',
+                       instance.instance_id, status, len(fact_cmds))
+
+        # split output into sections at the marker lines
+        markers = dict((self.FactMarker % name, name) for name in fact_cmds)
+        facts = dict((name, []) for name in fact_cmds)
+        lines = None
+        for line in output.split('\n'):
+            if line in markers:
+                lines = facts[markers[line]]
+            elif lines is not None:
+                lines.append(line)
+
+        return dict((name, '\n'.join(lines)) for (name, lines) in facts.items())
+
+    def _ssh(self, cmd, timeout=None, stdin=None):
+        """Run an SSH or SCP command line, retrying transient failures.
+
+        cmd      the complete command line to run
+        timeout  total seconds allowed, including retries (None is no limit)
+        stdin    optional string to send to the command's stdin
+
+        A failure of ssh to connect is retried up to SshRetries times with
+        jittered exponential backoff.  Any other failure, including a
+        remote command that exits 255 itself, isn't retried, as the command
+        may have done something.  If the timeout expires the command is
+        killed.
+
+        Returns a tuple (status, output).
+        """
+
+        end_time = self._end_time(timeout)
+
+        attempt = 0
+        while True:
+            remaining = None
+            if end_time is not None:
+                remaining = end_time - time.time()
+                if remaining <= 0:
+                    return (utils.TimeoutStatus, 'Timed out after %ds' % timeout)
+
+            (status, output) = utils.run_cmd(cmd, timeout=remaining, stdin=stdin)
+
+            if attempt >= self.SshRetries or not self._transient(status, output):
+                return (status, output)
+
+            attempt += 1
+            delay = self.SshRetryDelay * 2**(attempt-1) * random.uniform(0.5, 1.5)
+            if end_time is not None:
+                delay = min(delay, max(end_time - time.time(), 0))
+            self.log.debug('_ssh: status=%d, retry %d in %.1fs: %s',
+                           status, attempt, delay, cmd)
+            time.sleep(delay)
+
+    def _transient(self, status, output):
+        """Decide if an SSH failure is transient and worth retrying.
+
+        Only a failure to connect is retried: ssh exits 255 and its own
+        error line, the last line of the output, shows the connection
+        failed before the remote command started.
+        """
+
+        if status != 255 or not output:
+            return False
+        last_line = output.rstrip('\n').rsplit('\n', 1)[-1]
+        return last_line.startswith(self.SshTransientErrors)
+
+    @staticmethod
+    def _end_time(seconds):
+        """Convert a duration to an absolute end time, None stays None."""
+
+        if seconds is None:
+            return None
+        return time.time() + seconds
+
     @staticmethod
     def _check_env(value, env_str):
         """Maybe overwrite variable from the environment.
@@ -1132,6 +2507,7 @@ class Swarm(object):
 
         Returns a list of:
             {
+             'instance_id': 'i-......',
              'state': 'running',
              'public_ip': '54.123.123.123',
              'image_id': 'ami-......',
@@ -1156,10 +2532,11 @@ class Swarm(object):
             for instance in data['Reservations']:
                 for i in instance['Instances']:
                     d = {
+                         'instance_id': i['InstanceId'],
                          'state': i['State']['Name'],
-                         'public_ip': i['PublicIpAddress'],
+                         'public_ip': i.get('PublicIpAddress', None),
                          'image_id': i['ImageId'],
-                         'key_name': i['KeyName'],
+                         'key_name': i.get('KeyName', None),
                          'instance_type': i['InstanceType'],
                          'tenancy': i['Placement']['Tenancy'],
                          'availability_zone': i['Placement']['AvailabilityZone'],
@@ -1195,4 +2572,5 @@ class Swarm(object):
         data = self.client.describe_instances(InstanceIds=[instance_id])
         for instance in data['Reservations']:
             for i in instance['Instances']:
-                self.log.debug('instance %s state=%s' % (instance_id, i['State']['Name']))
+                self.log.debug('instance %s state=%s',
+                               instance_id, i['State']['Name'])
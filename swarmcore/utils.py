@@ -3,12 +3,30 @@ General use functions for swarm.
 """
 
 import os
+import re
 import sys
+import math
+import pipes
+import time
+import signal
+import hashlib
+import threading
+import subprocess
 
 
 # form of hostnames, %s are IP fields
 HostnameMask = 'vm-%s-%s-%s-%s'
 
+# status returned by run_cmd() for a command killed at its deadline
+TimeoutStatus = -1
+
+# the CommandGroup, if any, each thread's run_cmd() commands belong to
+_local = threading.local()
+
+# rate limiters shared by all threads, keyed by name
+_limiters = {}
+_limiters_lock = threading.Lock()
+
 
 def error(msg):
     """Print error message and quit."""
@@ -16,6 +34,107 @@ def error(msg):
     print(msg)
     sys.exit(1)
 
+def run_cmd(cmd, timeout=None, stdin=None):
+    """Run a shell command, return a tuple (status, output).
+
+    cmd      the shell command string
+    timeout  seconds the command may run before it is killed (None is forever)
+    stdin    string to write to the command's stdin (default /dev/null)
+
+    Standard error is merged into the output and a trailing newline is
+    removed, as with commands.getstatusoutput().  The status is the exit
+    code of the command.  The command runs in its own process group so
+    that a timeout kills it and all of its children; the status is then
+    TimeoutStatus.  If the calling thread has joined a CommandGroup the
+    command is in that group while it runs.
+    """
+
+    stdin_fd = subprocess.PIPE
+    if stdin is None:
+        stdin_fd = open(os.devnull, 'rb')
+
+    proc = subprocess.Popen(cmd, shell=True, stdin=stdin_fd,
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                            close_fds=True, preexec_fn=os.setsid)
+    group = getattr(_local, 'group', None)
+    if group is not None:
+        group.add(proc.pid)
+
+    killed = []
+    def kill():
+        killed.append(True)
+        _kill_group(proc.pid)
+
+    timer = None
+    if timeout is not None:
+        timer = threading.Timer(max(timeout, 0), kill)
+        timer.daemon = True
+        timer.start()
+
+    try:
+        output = proc.communicate(stdin)[0]
+    finally:
+        if timer:
+            timer.cancel()
+        if group is not None:
+            group.discard(proc.pid)
+        if stdin is None:
+            stdin_fd.close()
+
+    if output.endswith('\n'):
+        output = output[:-1]
+    if killed:
+        msg = 'Timed out after %.1fs' % timeout
+        if output:
+            msg = '%s\n%s' % (output, msg)
+        return (TimeoutStatus, msg)
+
+    return (proc.returncode, output)
+
+def _kill_group(pid):
+    """Kill a process group, ignoring groups that have already gone."""
+
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except OSError:
+        pass
+
+class CommandGroup(object):
+    """The commands run_cmd() starts in the threads that joined the group.
+
+    Lets one operation kill the commands its own threads are running,
+    leaving commands started by other operations in the process alone.
+    """
+
+    def __init__(self):
+        self.pids = set()
+        self.lock = threading.Lock()
+
+    def join(self):
+        """Put commands the calling thread starts from now on in the group."""
+
+        _local.group = self
+
+    def add(self, pid):
+        """Add a running command's process group."""
+
+        with self.lock:
+            self.pids.add(pid)
+
+    def discard(self, pid):
+        """Remove a finished command's process group."""
+
+        with self.lock:
+            self.pids.discard(pid)
+
+    def kill(self):
+        """Kill all commands in the group that are still running."""
+
+        with self.lock:
+            pids = list(self.pids)
+        for pid in pids:
+            _kill_group(pid)
+
 def obj_dump(obj):
     """Debug routine.  Dump attributes of an object.
 
@@ -56,6 +175,277 @@ def ip_key(key):
 
     return result
 
+def normalise_output(output):
+    """Normalise command output for comparison.
+
+    Trailing whitespace on each line and trailing blank lines are removed.
+    """
+
+    lines = [l.rstrip() for l in output.split('\n')]
+    while lines and lines[-1] == '':
+        lines.pop()
+
+    return '\n'.join(lines)
+
+
+# shell glob tokens left unquoted by remote_path(): '*', '?' and simple
+# bracket expressions like '[0-9]' or '[!ab]'
+GlobTokenRE = re.compile(r'(\*|\?|\[[!^]?[A-Za-z0-9_.-]+\])')
+
+def remote_path(path, globs=False):
+    """Quote a path for use in a remote shell command.
+
+    path   the path to quote
+    globs  if True leave shell glob tokens unquoted so they are expanded
+
+    A leading '~' or '~/' is left unquoted so it still means the remote
+    home directory.  Everything else is quoted with pipes.quote().
+    """
+
+    prefix = ''
+    if path == '~' or path.startswith('~/'):
+        prefix = path[:2]
+        path = path[2:]
+    if not path:
+        return prefix
+
+    if not globs:
+        return prefix + pipes.quote(path)
+
+    result = [prefix]
+    for (i, token) in enumerate(GlobTokenRE.split(path)):
+        if i % 2:
+            result.append(token)        # a glob token
+        elif token:
+            result.append(pipes.quote(token))
+
+    return ''.join(result)
+
+
+# splits a name into (prefix, number, suffix) on the last run of digits
+NameNumberRE = re.compile(r'^(.*?)(\d+)(\D*)$')
+
+def host_ranges(names):
+    """Make a compact host-range string from a list of names.
+
+    For example, given:
+
+        ['test_1', 'test_2', 'test_3', 'test_7', 'other']
+
+    return 'other,test_[1-3,7]'.  Zero-padded numbers keep their width, and
+    unpadded numbers at least that wide share their range, so 'test_09',
+    'test_10' and 'test_11' become 'test_[09-11]'.
+    """
+
+    # numbers by (prefix, suffix), as (number, digits, padded)
+    numbered = {}
+    plain = []
+    for name in names:
+        match = NameNumberRE.match(name)
+        if match is None:
+            plain.append(name)
+            continue
+        (prefix, number, suffix) = match.groups()
+        padded = len(number) > 1 and number.startswith('0')
+        numbered.setdefault((prefix, suffix), []).append((int(number),
+                                                          len(number), padded))
+
+    # group numbers by (prefix, suffix, width): a padded number has its own
+    # width, an unpadded one the widest padded width it is as wide as
+    groups = {}
+    for ((prefix, suffix), numbers) in numbered.items():
+        widths = sorted(set(d for (_, d, padded) in numbers if padded))
+        for (n, digits, padded) in numbers:
+            width = digits if padded else 0
+            if not padded:
+                for w in widths:
+                    if w <= digits:
+                        width = w
+            groups.setdefault((prefix, suffix, width), set()).add(n)
+
+    result = list(plain)
+    for ((prefix, suffix, width), numbers) in groups.items():
+        numbers = sorted(numbers)
+        ranges = []
+        start = prev = numbers[0]
+        for n in numbers[1:] + [None]:
+            if n is not None and n == prev + 1:
+                prev = n
+                continue
+            if start == prev:
+                ranges.append('%0*d' % (width, start))
+            else:
+                ranges.append('%0*d-%0*d' % (width, start, width, prev))
+            start = prev = n
+        if len(numbers) == 1:
+            result.append('%s%s%s' % (prefix, ranges[0], suffix))
+        else:
+            result.append('%s[%s]%s' % (prefix, ','.join(ranges), suffix))
+
+    return ','.join(sorted(result))
+
+
+class OutputGroups(object):
+    """Group hosts that produced identical output.
+
+    Output is normalised and hashed as each result is added, so memory
+    grows with the number of distinct outputs rather than with the number
+    of hosts (apart from the host names themselves).
+    """
+
+    def __init__(self):
+        # digest -> (status, normalised output, [names])
+        self.groups = {}
+
+    def add(self, name, status, output):
+        """Add one host result to the groups."""
+
+        output = normalise_output(output)
+        digest = hashlib.sha1('%s\0%s' % (status, output)).digest()
+        group = self.groups.get(digest, None)
+        if group is None:
+            group = (status, output, [])
+            self.groups[digest] = group
+        group[2].append(name)
+
+    def results(self):
+        """Return a sorted list of (status, output, names) tuples.
+
+        Groups are sorted with the largest first.
+        """
+
+        result = [(status, output, sorted(names))
+                  for (status, output, names) in self.groups.values()]
+        result.sort(key=lambda x: (-len(x[2]), x[2]))
+
+        return result
+
+    def show(self):
+        """Print each distinct output once under its host list, dshbak style."""
+
+        for (status, output, names) in self.results():
+            header = '%s (%d)' % (host_ranges(names), len(names))
+            if status != 0:
+                header += ' *status=%s' % str(status)
+            print('-' * 60)
+            print(header)
+            print('-' * 60)
+            print(output)
+
+
+def parse_batch_size(spec, total):
+    """Convert a batch size specification to a number of instances.
+
+    spec   either a number ('10') or a percentage ('25%')
+    total  the total number of instances
+
+    Returns the number of instances in a batch, always at least 1.
+    Raises ValueError if 'spec' is badly formed.
+    """
+
+    spec = str(spec).strip()
+    if spec.endswith('%'):
+        percent = float(spec[:-1])
+        if not 0 < percent <= 100:
+            raise ValueError("Batch percentage must be in (0, 100]: '%s'" % spec)
+        size = int(math.ceil(total * percent / 100.0))
+    else:
+        size = int(spec)
+        if size < 1:
+            raise ValueError("Batch size must be a positive integer: '%s'" % spec)
+
+    return max(size, 1)
+
+class RateLimiter(object):
+    """Limit the rate of an action shared between many threads.
+
+    A token bucket: 'rate' tokens are added each second up to 'burst'
+    tokens, and each action takes one token.  A thread that finds no
+    token reserves the next one and sleeps until it is due, so waiting
+    threads are released in order at the limited rate.
+    """
+
+    def __init__(self, rate, burst=1):
+        """Create a rate limiter.
+
+        rate   actions allowed per second
+        burst  number of actions allowed at once after an idle period
+        """
+
+        self.rate = float(rate)
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last = time.time()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """Wait until the action may be performed."""
+
+        with self._lock:
+            now = time.time()
+            self._tokens = min(self.burst,
+                               self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= 1
+            delay = -self._tokens / self.rate
+
+        if delay > 0:
+            time.sleep(delay)
+
+def parallel_map(func, items, threads):
+    """Apply a function to each item using a pool of threads.
+
+    func     function taking one item
+    items    a list of items
+    threads  maximum number of threads
+
+    Returns a list of the function results in item order.  An exception
+    raised by the function is returned as its result.
+    """
+
+    items = list(items)
+    results = [None] * len(items)
+    next_index = [0]
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                index = next_index[0]
+                if index >= len(items):
+                    return
+                next_index[0] += 1
+            try:
+                results[index] = func(items[index])
+            except Exception as e:
+                results[index] = e
+
+    workers = [threading.Thread(target=worker)
+               for _ in range(min(threads, len(items)))]
+    for w in workers:
+        w.daemon = True
+        w.start()
+    for w in workers:
+        w.join()
+
+    return results
+
+def get_rate_limiter(name, rate, burst=1):
+    """Return the rate limiter with a name, creating it only once.
+
+    name   name of the limiter, eg, 'aws'
+    rate   actions allowed per second (used only on creation)
+    burst  actions allowed at once (used only on creation)
+    """
+
+    with _limiters_lock:
+        limiter = _limiters.get(name, None)
+        if limiter is None:
+            limiter = RateLimiter(rate, burst)
+            _limiters[name] = limiter
+
+    return limiter
+
 def get_instance_name(instance):
     """Get instance name.
 
@@ -0,0 +1,86 @@
+"""
+Tests for Swarm.remediate().
+
+No AWS calls are made: the Swarm methods that talk to AWS are replaced
+on the object under test.
+
+Run from the swarm directory with:
+
+    python -m unittest discover -s tests
+"""
+
+import time
+import shutil
+import datetime
+import tempfile
+import unittest
+
+import swarmcore
+import swarmcore.log
+import swarmcore.defaults as defaults
+from swarmcore.result import HostResult
+
+
+class FakeInstance(object):
+    """Just enough of a boto3 Instance for remediate()."""
+
+    def __init__(self, number, age):
+        self.instance_id = 'i-%08d' % number
+        self.tags = [{'Key': 'Name', 'Value': 'test%d' % number}]
+        self.public_ip_address = '10.0.0.%d' % number
+        self.launch_time = (datetime.datetime.utcnow()
+                            - datetime.timedelta(seconds=age))
+
+
+class RemediateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.old_cache_dir = defaults.CacheDir
+        defaults.CacheDir = self.cache_dir
+
+        self.checked = []
+        self.replaced = []
+
+        swm = swarmcore.Swarm.__new__(swarmcore.Swarm)
+        swm.log = swarmcore.log.Log('swarm.log', swarmcore.log.Log.DEBUG)
+        swm.console_logs = lambda instances: {}
+        swm.info = self.fake_info
+        swm.replace = self.fake_replace
+        self.swm = swm
+
+    def tearDown(self):
+        defaults.CacheDir = self.old_cache_dir
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def fake_info(self, instances, *args, **kwargs):
+        """Classify every instance checked as hung, as when booting."""
+
+        self.checked.extend(i.instance_id for i in instances)
+        return [HostResult(i, values=['HUNG, no login prompt'])
+                for i in instances]
+
+    def fake_replace(self, instances, **kwargs):
+        self.replaced.extend(i.instance_id for i in instances)
+        return [FakeInstance(99, 0)]
+
+    def test_fresh_instance_not_replaced(self):
+        fresh = FakeInstance(1, 30)
+        results = self.swm.remediate([fresh], grace=600)
+
+        self.assertEqual(results, [])
+        self.assertEqual(self.checked, [])
+        self.assertEqual(self.replaced, [])
+
+    def test_old_hung_instance_replaced(self):
+        fresh = FakeInstance(1, 30)
+        old = FakeInstance(2, 3600)
+        results = self.swm.remediate([fresh, old], grace=600)
+
+        self.assertEqual(self.checked, [old.instance_id])
+        self.assertEqual(self.replaced, [old.instance_id])
+        self.assertEqual([r.status for r in results], [0])
+
+
+if __name__ == '__main__':
+    unittest.main()
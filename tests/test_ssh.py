@@ -0,0 +1,68 @@
+"""
+Tests for the SSH retry logic of Swarm._ssh().
+
+Local shell commands stand in for ssh command lines, each appending a
+line to a file every time it runs so the tests can count the runs.
+
+Run from the swarm directory with:
+
+    python -m unittest discover -s tests
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import swarmcore
+import swarmcore.log
+
+
+class SshRetryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.runs_file = os.path.join(self.tmp_dir, 'runs')
+
+        swm = swarmcore.Swarm.__new__(swarmcore.Swarm)
+        swm.log = swarmcore.log.Log('swarm.log', swarmcore.log.Log.DEBUG)
+        swm.SshRetries = 2
+        swm.SshRetryDelay = 0.0
+        self.swm = swm
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def run_counted(self, script):
+        """Run 'script' through _ssh(), return (status, output, runs)."""
+
+        cmd = 'echo run >> %s; %s' % (self.runs_file, script)
+        (status, output) = self.swm._ssh(cmd)
+        with open(self.runs_file) as fd:
+            runs = len(fd.readlines())
+        return (status, output, runs)
+
+    def test_remote_exit_255_not_retried(self):
+        (status, _, runs) = self.run_counted('exit 255')
+
+        self.assertEqual(status, 255)
+        self.assertEqual(runs, 1)
+
+    def test_remote_connection_message_not_retried(self):
+        script = 'echo "curl: (7) Connection timed out"; exit 255'
+        (status, _, runs) = self.run_counted(script)
+
+        self.assertEqual(status, 255)
+        self.assertEqual(runs, 1)
+
+    def test_ssh_connect_failure_retried(self):
+        script = ('echo "ssh: connect to host 10.0.0.1 port 22: '
+                  'Connection timed out" >&2; exit 255')
+        (status, _, runs) = self.run_counted(script)
+
+        self.assertEqual(status, 255)
+        self.assertEqual(runs, 1 + self.swm.SshRetries)
+
+
+if __name__ == '__main__':
+    unittest.main()